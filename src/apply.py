@@ -0,0 +1,368 @@
+"""
+Apply the objects of a remote folder to a database, e.g. to rebuild a test database.
+Dependencies are parsed from the definitions: an object depends on every extracted object whose name it references.
+Objects are applied by waves, each wave only depending on the previous ones. Within a wave, objects are grouped into
+batches of small statements, each batch one round trip and one transaction, and the batches run in parallel over a connection pool
+"""
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List,Dict,Set,Tuple,Optional,Iterator,TextIO
+from model import ObjectType,ApplyStats,ApplyFailure
+from writer import parse_database_object_file
+from config import APPLY_BATCH_SIZE,APPLY_BATCH_BYTES
+
+#comments and string literals, whose words are not references
+IGNORED_TEXT_PATTERN = re.compile(r"--[^\n]*|/\*.*?\*/|N?'(?:[^']|'')*'",re.DOTALL)
+
+#external objects referenced through a string literal
+LITERAL_REFERENCE_PATTERN = re.compile(r"\b(?:DATA_SOURCE|FILE_FORMAT)\s*=\s*N?'((?:[^']|'')*)'",re.IGNORECASE)
+
+IDENTIFIER = r"(?:\[(?:[^\]]|\]\])+\]|\"[^\"]+\"|[A-Za-z_@#][\w@#$]*)"
+
+IDENTIFIER_PATTERN = re.compile(IDENTIFIER)
+
+#a name of one to four identifiers separated by dots
+NAME_PATTERN = re.compile(rf"{IDENTIFIER}(?:\s*\.\s*{IDENTIFIER})*")
+
+#created in their own batch outside of a transaction, as polybase objects may not be created in a user transaction
+UNBATCHED_OBJECT_TYPES = {ObjectType.EXTDATASOURCE,ObjectType.EXTFILEFORMAT,ObjectType.EXTTABLE}
+
+#types of the objects each type can depend on. Tables do not depend on anything, so their column names are not taken for references
+DEPENDENCY_OBJECT_TYPES:Dict[ObjectType,Set[ObjectType]] = {
+    ObjectType.TABLE:set(),
+    ObjectType.EXTDATASOURCE:set(),
+    ObjectType.EXTFILEFORMAT:set(),
+    ObjectType.EXTTABLE:{ObjectType.EXTDATASOURCE,ObjectType.EXTFILEFORMAT},
+    ObjectType.INDEX:{ObjectType.TABLE,ObjectType.VIEW},
+    ObjectType.VIEW:{ObjectType.TABLE,ObjectType.EXTTABLE,ObjectType.VIEW,ObjectType.FUNCTION},
+    ObjectType.FUNCTION:{ObjectType.TABLE,ObjectType.EXTTABLE,ObjectType.VIEW,ObjectType.FUNCTION},
+    ObjectType.PROCEDURE:{ObjectType.TABLE,ObjectType.EXTTABLE,ObjectType.VIEW,ObjectType.FUNCTION,ObjectType.PROCEDURE}
+}
+
+#pseudo object file of the schemas created before the first wave
+SCHEMA_FILE_PREFIX = "schema:"
+
+def get_literal(text:str)->str:
+
+    return "N'"+text.replace("'","''")+"'"
+
+def get_identifier(identifier:str)->str:
+
+    if identifier.startswith("["):
+        return identifier[1:-1].replace("]]","]")
+
+    if identifier.startswith("\""):
+        return identifier[1:-1]
+
+    return identifier
+
+def get_object_reference(object_definition:str)->Iterator[Tuple[Optional[str],str]]:
+    """
+    Yield the schema (None when the name is not qualified) and name of every name of the definition
+    """
+
+    for literal in LITERAL_REFERENCE_PATTERN.findall(object_definition):
+        yield (None,literal.replace("''","'"))
+
+    for name in NAME_PATTERN.findall(IGNORED_TEXT_PATTERN.sub(" ",object_definition)):
+
+        parts = [get_identifier(identifier=x) for x in IDENTIFIER_PATTERN.findall(name)]
+
+        yield (parts[-2] if len(parts)>1 else None,parts[-1])
+
+def get_dependency(object_definitions:Dict[str,str])->Dict[str,Set[str]]:
+    """
+    Return the object files each object depends on, among the given objects keyed by object file and of the types of DEPENDENCY_OBJECT_TYPES.
+    An unqualified name is resolved to an object without schema, then of the schema of the object, then of dbo, then to the only object of this name
+    """
+
+    qualified_files:Dict[Tuple[Optional[str],str],Set[str]] = dict()
+
+    name_files:Dict[str,Set[str]] = dict()
+
+    object_schemas:Dict[str,Optional[str]] = dict()
+
+    object_types:Dict[str,ObjectType] = dict()
+
+    dependencies:Dict[str,Set[str]] = dict()
+
+    for object_file in object_definitions:
+
+        parsed_file = parse_database_object_file(object_file=object_file)
+
+        #applied in the first wave
+        if parsed_file is None:
+            dependencies[object_file] = set()
+            continue
+
+        object_schema,object_name,object_type = parsed_file
+
+        object_schemas[object_file] = object_schema
+
+        object_types[object_file] = object_type
+
+        key = (None if object_schema is None else object_schema.lower(),object_name.lower())
+
+        qualified_files.setdefault(key,set()).add(object_file)
+
+        name_files.setdefault(object_name.lower(),set()).add(object_file)
+
+    for object_file,object_schema in object_schemas.items():
+
+        dependency:Set[str] = set()
+
+        dependency_types = DEPENDENCY_OBJECT_TYPES[object_types[object_file]]
+
+        references = get_object_reference(object_definition=object_definitions[object_file]) if len(dependency_types)>0 else []
+
+        for reference_schema,reference_name in set(references):
+
+            reference_name = reference_name.lower()
+
+            if reference_name not in name_files:
+                continue
+
+            if reference_schema is not None:
+                dependency|=qualified_files.get((reference_schema.lower(),reference_name),set())
+                continue
+
+            for schema in [None,None if object_schema is None else object_schema.lower(),"dbo"]:
+                if (schema,reference_name) in qualified_files:
+                    dependency|=qualified_files[(schema,reference_name)]
+                    break
+            else:
+                if len(name_files[reference_name])==1:
+                    dependency|=name_files[reference_name]
+
+        dependency.discard(object_file)
+
+        dependencies[object_file] = {x for x in dependency if object_types[x] in dependency_types}
+
+    return dependencies
+
+def get_apply_wave(dependencies:Dict[str,Set[str]])->List[List[str]]:
+    """
+    Return the objects by wave: an object is in the wave after the last wave of its dependencies.
+    Objects of a dependency cycle, and those depending on one, are in a last wave, in the order of dependencies
+    """
+
+    waves:List[List[str]] = list()
+
+    dependents:Dict[str,List[str]] = {x:list() for x in dependencies}
+
+    remaining_counts:Dict[str,int] = dict()
+
+    for object_file,dependency in dependencies.items():
+
+        remaining_counts[object_file] = len(dependency)
+
+        for dependency_file in dependency:
+            dependents[dependency_file].append(object_file)
+
+    wave = sorted(x for x,y in remaining_counts.items() if y==0)
+
+    while len(wave)>0:
+
+        waves.append(wave)
+
+        next_wave:List[str] = list()
+
+        for object_file in wave:
+            for dependent_file in dependents[object_file]:
+
+                remaining_counts[dependent_file]-=1
+
+                if remaining_counts[dependent_file]==0:
+                    next_wave.append(dependent_file)
+
+        wave = sorted(next_wave)
+
+    cycle_wave = [x for x,y in remaining_counts.items() if y>0]
+
+    if len(cycle_wave)>0:
+        waves.append(cycle_wave)
+
+    return waves
+
+def get_schema_definition(object_files:List[str])->Dict[str,str]:
+    """
+    Statements creating the schemas of the objects when missing, keyed by pseudo object file
+    """
+
+    schemas = {x[0] for x in (parse_database_object_file(object_file=y) for y in object_files) if x is not None and x[0] is not None}
+
+    return {f"{SCHEMA_FILE_PREFIX}{x}":f"IF SCHEMA_ID({get_literal(text=x)}) IS NULL EXEC({get_literal(text='CREATE SCHEMA ['+x.replace(']',']]')+']')});"\
+            for x in sorted(schemas) if x.lower()!="dbo"}
+
+def get_batch(object_files:List[str],\
+              object_definitions:Dict[str,str],\
+              batch_size:int=APPLY_BATCH_SIZE,\
+              batch_bytes:int=APPLY_BATCH_BYTES)->List[List[str]]:
+    """
+    Group the objects of a wave into batches of at most batch_size objects and batch_bytes bytes of definition
+    (a larger definition is alone). External objects are alone
+    """
+
+    batches:List[List[str]] = list()
+
+    batch:List[str] = list()
+
+    size = 0
+
+    for object_file in object_files:
+
+        parsed_file = parse_database_object_file(object_file=object_file)
+
+        if parsed_file is not None and parsed_file[2] in UNBATCHED_OBJECT_TYPES:
+            batches.append([object_file])
+            continue
+
+        definition_bytes = len(object_definitions[object_file].encode("utf-8"))
+
+        if len(batch)>0 and (len(batch)>=batch_size or size+definition_bytes>batch_bytes):
+            batches.append(batch)
+            batch = list()
+            size = 0
+
+        batch.append(object_file)
+        size+=definition_bytes
+
+    if len(batch)>0:
+        batches.append(batch)
+
+    return batches
+
+def get_batch_sql(object_definitions:List[str])->str:
+    """
+    A view, function or procedure must be the first statement of its batch, so each definition is run through sp_executesql.
+    XACT_ABORT rolls the whole batch back on the first error
+    """
+
+    return "\n".join(["SET NOCOUNT ON;","SET XACT_ABORT ON;"]+[f"EXEC sp_executesql {get_literal(text=x)};" for x in object_definitions])
+
+def execute_all(connection,sql:str):
+    """
+    Execute sql on the DBAPI cursor of connection and read all its results, as the error of a statement is only raised once its result is reached
+    """
+
+    cursor = connection.connection.cursor()
+
+    try:
+        cursor.execute(sql)
+
+        while cursor.nextset():
+            pass
+    finally:
+        cursor.close()
+
+def execute_batch(engine,batch:List[str],object_definitions:Dict[str,str])->List[ApplyFailure]:
+    """
+    Execute a batch in a single transaction. When it fails, its objects are executed again one by one to find the failed ones
+    """
+
+    try:
+        parsed_file = parse_database_object_file(object_file=batch[0])
+
+        if len(batch)==1 and parsed_file is not None and parsed_file[2] in UNBATCHED_OBJECT_TYPES:
+            with engine.connect() as connection:
+                connection.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql(object_definitions[batch[0]])
+        else:
+            with engine.begin() as connection:
+                execute_all(connection=connection,sql=get_batch_sql(object_definitions=[object_definitions[x] for x in batch]))
+
+        return list()
+    except Exception as ex:
+
+        if len(batch)==1:
+            return [ApplyFailure(object_file=batch[0],error=str(getattr(ex,"orig",None) or ex).strip())]
+
+        failures:List[ApplyFailure] = list()
+
+        for object_file in batch:
+            failures+=execute_batch(engine=engine,batch=[object_file],object_definitions=object_definitions)
+
+        return failures
+
+def apply_object(engine,\
+                 object_definitions:Dict[str,str],\
+                 jobs:int=1,\
+                 batch_size:int=APPLY_BATCH_SIZE,\
+                 dry_run:bool=False,\
+                 output:Optional[TextIO]=None)->Tuple[ApplyStats,List[ApplyFailure]]:
+    """
+    Create the schemas then the objects keyed by object file, wave by wave with jobs concurrent batches.
+    The wave of dependency cycles is applied one object at a time, in the order of object_definitions.
+    Failed objects are applied once more at the end, one at a time, in case a dependency was not found in their definition.
+    With dry_run, only print the waves
+    """
+
+    start_time = time.perf_counter()
+
+    dependencies = get_dependency(object_definitions=object_definitions)
+
+    waves = get_apply_wave(dependencies=dependencies)
+
+    schema_definitions = get_schema_definition(object_files=list(object_definitions.keys()))
+
+    if len(schema_definitions)>0:
+        waves.insert(0,list(schema_definitions.keys()))
+
+    definitions = dict(object_definitions,**schema_definitions)
+
+    apply_stats = ApplyStats(wave_count=len(waves),object_count=len(object_definitions))
+
+    failures:List[ApplyFailure] = list()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+
+        for wave_no,wave in enumerate(waves,start=1):
+
+            #the objects of a wave never depend on each other, except in the wave of dependency cycles
+            serial = any(len(dependencies.get(x,set()).intersection(wave))>0 for x in wave)
+
+            if serial:
+                batches = [[x] for x in wave]
+            else:
+                #smaller batches in a small wave, so every connection of the pool is used
+                batches = get_batch(object_files=wave,\
+                                    object_definitions=definitions,\
+                                    batch_size=max(1,min(batch_size,-(-len(wave)//jobs))))
+
+            if dry_run:
+                if output is not None:
+                    print(f"wave {wave_no}/{len(waves)}: {len(wave)} objects in {len(batches)} batches{' (serial)' if serial else ''}",file=output)
+
+                    for object_file in wave:
+                        print(f"  {object_file}",file=output)
+                continue
+
+            if output is not None:
+                print(f"wave {wave_no}/{len(waves)}: {len(wave)} objects in {len(batches)} batches:",end="",file=output)
+
+            wave_start_time = time.perf_counter()
+
+            if serial:
+                wave_failures = [x for y in batches for x in execute_batch(engine=engine,batch=y,object_definitions=definitions)]
+            else:
+                wave_failures = [x for y in executor.map(lambda x:execute_batch(engine=engine,batch=x,object_definitions=definitions),batches) for x in y]
+
+            apply_stats.batch_count+=len(batches)
+
+            failures+=wave_failures
+
+            if output is not None:
+                print(f"{len(wave)-len(wave_failures)} applied,{len(wave_failures)} failed ({time.perf_counter()-wave_start_time:.2f}s)",file=output)
+
+    if len(failures)>0:
+
+        if output is not None:
+            print(f"retrying {len(failures)} failed objects",file=output)
+
+        failures = [x for y in failures for x in execute_batch(engine=engine,batch=[y.object_file],object_definitions=definitions)]
+
+    apply_stats.failed_count = len([x for x in failures if not x.object_file.startswith(SCHEMA_FILE_PREFIX)])
+    apply_stats.applied_count = 0 if dry_run else apply_stats.object_count-apply_stats.failed_count
+    apply_stats.duration = time.perf_counter()-start_time
+
+    return (apply_stats,failures)
@@ -0,0 +1,299 @@
+"""
+Throughput and peak memory of each extraction stage on synthetic catalogs, optionally compared against a stored baseline
+"""
+import sys
+import json
+import time
+import tempfile
+import tracemalloc
+from typing import List,Callable,Any,Dict,Optional
+from model import TableInfo,IndexInfo,ExtTableInfo,ExtDataSourceInfo,DatabaseObject
+from catalog import TableCatalog,IndexCatalog
+from fake import generate_table_rows,generate_index_rows,generate_module_rows,generate_ext_table_rows,get_table_ddl_rows
+from func import group_by
+from database import create_table_object,create_index_object,create_external_table_object,create_external_data_source_object
+from database import get_procedure_object,iter_server_rendered_table_object
+from writer import DatabaseObjectWriter
+from dos import parse_argument
+
+#allowed relative loss of throughput or growth of peak memory before a stage is reported as a regression
+BENCHMARK_TOLERANCE = 0.25
+
+def measure_memory(build_func:Callable[[],Any])->int:
+    """
+    Return the memory held by the object built by build_func in bytes
+    """
+
+    tracemalloc.start()
+
+    try:
+        result = build_func()
+
+        memory,_ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    del result
+
+    return memory
+
+def benchmark_catalog_memory(table_count:int,column_count:int)->Dict[str,int]:
+    """
+    Compare the memory of the catalog rows held as dataclass lists and as columnar catalogs
+    """
+
+    index_column_count = 4
+
+    table_rows = lambda:generate_table_rows(table_count=table_count,column_count=column_count)
+
+    index_rows = lambda:generate_index_rows(index_count=table_count,column_count=index_column_count)
+
+    def build_table_info()->List[TableInfo]:
+        return [TableInfo(table_schema=x[0],\
+                          table_name=x[1],\
+                          column_name=x[2],\
+                          data_type=x[3],\
+                          data_type_length=x[4],\
+                          is_nullable=x[5],\
+                          ordinal_position=x[6]) for x in table_rows()]
+
+    def build_index_info()->List[IndexInfo]:
+        return [IndexInfo(index_schema=x[0],\
+                          table_name=x[1],\
+                          index_name=x[2],\
+                          index_column_name=x[3],\
+                          index_type=x[4],\
+                          column_position=x[5],\
+                          is_included_column=x[6],\
+                          is_descending_key=x[7]) for x in index_rows()]
+
+    return {
+        "table_rows":table_count*column_count,
+        "table_info_bytes":measure_memory(build_func=build_table_info),
+        "table_catalog_bytes":measure_memory(build_func=lambda:TableCatalog.from_rows(rows=table_rows())),
+        "index_rows":table_count*index_column_count,
+        "index_info_bytes":measure_memory(build_func=build_index_info),
+        "index_catalog_bytes":measure_memory(build_func=lambda:IndexCatalog.from_rows(rows=index_rows()))
+    }
+
+def measure_stage(stage_func:Callable[[],int])->Dict[str,float]:
+    """
+    Run the stage once timed and once traced, as tracing slow it down.
+    stage_func return the number of items it processed
+    """
+
+    start_time = time.perf_counter()
+
+    item_count = stage_func()
+
+    duration = time.perf_counter()-start_time
+
+    tracemalloc.start()
+
+    try:
+        stage_func()
+
+        _,peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "items":item_count,
+        "seconds":round(duration,6),
+        "items_per_second":round(item_count/max(duration,1e-9),1),
+        "peak_memory_bytes":peak_memory
+    }
+
+def benchmark_stages(table_count:int,\
+                     column_count:int,\
+                     index_count:int,\
+                     procedure_count:int,\
+                     ext_table_count:int)->Dict[str,Dict[str,float]]:
+    """
+    Measure row ingestion, grouping, every renderer and the writer on their own.
+    The rows of every stage are generated beforehand so only the stage itself is measured
+    """
+
+    table_rows = list(generate_table_rows(table_count=table_count,column_count=column_count))
+
+    index_rows = list(generate_index_rows(index_count=index_count,column_count=4))
+
+    ext_table_rows = list(generate_ext_table_rows(table_count=ext_table_count,column_count=column_count))
+
+    procedure_rows = list(generate_module_rows(module_type="PROCEDURE",module_count=procedure_count))
+
+    table_ddl_rows = list(get_table_ddl_rows(table_rows=table_rows))
+
+    table_info = [TableInfo(*x) for x in table_rows]
+
+    index_info = [IndexInfo(*x) for x in index_rows]
+
+    ext_table_info = [ExtTableInfo(*x) for x in ext_table_rows]
+
+    ext_data_source_info = [ExtDataSourceInfo(external_data_source_name=f"data_source{x}",\
+                                              external_data_source_type="HADOOP",\
+                                              external_data_source_location=f"abfss://data{x}@account.dfs.core.windows.net",\
+                                              credential_name=f"credential{x}") for x in range(max(table_count//100,1))]
+
+    table_object = create_table_object(table_info=table_info)
+
+    def write_object(database_objects:List[DatabaseObject])->int:
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            database_object_writer = DatabaseObjectWriter(root_dir=temp_dir,remote_name="benchmark")
+
+            for database_object in database_objects:
+                database_object_writer.write(database_object=database_object)
+
+            database_object_writer.close()
+
+        return len(database_objects)
+
+    def count_group(grouped:Dict[Any,List[Any]])->int:
+        return sum(len(x) for x in grouped.values())
+
+    stages:Dict[str,Callable[[],int]] = {
+        "ingest_table_info":lambda:len([TableInfo(*x) for x in table_rows]),
+        "ingest_index_info":lambda:len([IndexInfo(*x) for x in index_rows]),
+        "ingest_table_catalog":lambda:len(TableCatalog.from_rows(rows=table_rows).column_name),
+        "ingest_index_catalog":lambda:len(IndexCatalog.from_rows(rows=index_rows).index_column_name),
+        "group_by_table":lambda:count_group(grouped=group_by(objects=table_info,group_key_func=lambda x:(x.table_schema,x.table_name))),
+        "render_table":lambda:len(create_table_object(table_info=table_info)),
+        "render_index":lambda:len(create_index_object(index_info=index_info)),
+        "render_external_table":lambda:len(create_external_table_object(ext_table_info=ext_table_info)),
+        "render_external_data_source":lambda:len(create_external_data_source_object(ext_data_source_info=ext_data_source_info)),
+        "render_procedure":lambda:len(list(get_procedure_object(rows=procedure_rows))),
+        "render_server_table":lambda:len(list(iter_server_rendered_table_object(rows=table_ddl_rows))),
+        "write_table":lambda:write_object(database_objects=table_object)
+    }
+
+    return {name:measure_stage(stage_func=stage_func) for name,stage_func in stages.items()}
+
+def compare_baseline(stages:Dict[str,Dict[str,float]],\
+                     baseline_stages:Dict[str,Dict[str,float]],\
+                     tolerance:float)->List[str]:
+    """
+    Return a message for every stage slower or using more memory than the baseline beyond the tolerance
+    """
+
+    regressions:List[str] = list()
+
+    for name,baseline in baseline_stages.items():
+
+        if name not in stages:
+            continue
+
+        current = stages[name]
+
+        if current["items_per_second"]<baseline["items_per_second"]*(1-tolerance):
+            regressions.append(f"{name}: {current['items_per_second']} items/s, baseline {baseline['items_per_second']} items/s")
+
+        if current["peak_memory_bytes"]>baseline["peak_memory_bytes"]*(1+tolerance):
+            regressions.append(f"{name}: {current['peak_memory_bytes']} bytes peak memory, baseline {baseline['peak_memory_bytes']} bytes")
+
+    return regressions
+
+def get_count_option(options:Dict[str,str],name:str,default:int)->Optional[int]:
+
+    value = options.get(name,str(default))
+
+    if not value.isdigit():
+        return None
+
+    return int(value)
+
+def help_command():
+    print("Usage: python benchmark.py [table_count] [column_count] [options]")
+    print()
+    print("Options:")
+    print("  --indexes <N>          : Number of indexes (default table_count)")
+    print("  --procedures <N>       : Number of procedures (default table_count)")
+    print("  --ext-tables <N>       : Number of external tables (default table_count/10)")
+    print("  --baseline <file>      : Compare with a stored result and fail on regression")
+    print("  --save-baseline <file> : Store the result as the new baseline")
+    print(f"  --tolerance <ratio>    : Allowed loss of throughput or growth of memory (default {BENCHMARK_TOLERANCE})")
+
+def main(argv)->int:
+
+    parsed_argument = parse_argument(argv=argv)
+
+    if parsed_argument is None or len(parsed_argument[0])>2 or not all(x.isdigit() for x in parsed_argument[0]):
+        help_command()
+        return 1
+
+    arguments,options = parsed_argument
+
+    table_count = int(arguments[0]) if len(arguments)>0 else 10000
+
+    column_count = int(arguments[1]) if len(arguments)>1 else 30
+
+    index_count = get_count_option(options=options,name="--indexes",default=table_count)
+
+    procedure_count = get_count_option(options=options,name="--procedures",default=table_count)
+
+    ext_table_count = get_count_option(options=options,name="--ext-tables",default=table_count//10)
+
+    try:
+        tolerance = float(options.get("--tolerance",BENCHMARK_TOLERANCE))
+    except ValueError:
+        tolerance = None
+
+    if index_count is None or procedure_count is None or ext_table_count is None or tolerance is None:
+        help_command()
+        return 1
+
+    result = {
+        "config":{
+            "table_count":table_count,
+            "column_count":column_count,
+            "index_count":index_count,
+            "procedure_count":procedure_count,
+            "ext_table_count":ext_table_count
+        },
+        "stages":benchmark_stages(table_count=table_count,\
+                                  column_count=column_count,\
+                                  index_count=index_count,\
+                                  procedure_count=procedure_count,\
+                                  ext_table_count=ext_table_count),
+        "catalog_memory":benchmark_catalog_memory(table_count=table_count,column_count=column_count)
+    }
+
+    regressions:List[str] = list()
+
+    if "--baseline" in options:
+
+        try:
+            with open(options["--baseline"],"r") as file:
+                baseline = json.load(file)
+        except (OSError,ValueError):
+            print(f"cannot read baseline {options['--baseline']}",file=sys.stderr)
+            return 1
+
+        if baseline["config"]!=result["config"]:
+            print(f"baseline {options['--baseline']} was measured on a different catalog size",file=sys.stderr)
+            return 1
+
+        regressions = compare_baseline(stages=result["stages"],\
+                                       baseline_stages=baseline["stages"],\
+                                       tolerance=tolerance)
+
+    result["regressions"] = regressions
+
+    if "--save-baseline" in options:
+        with open(options["--save-baseline"],"w") as file:
+            json.dump(result,file,indent=4)
+
+    print(json.dumps(result,indent=4))
+
+    if len(regressions)>0:
+
+        for regression in regressions:
+            print(f"regression {regression}",file=sys.stderr)
+
+        return 1
+
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,223 @@
+"""
+Compact column-wise storage of the catalog rows.
+Values shared by every row of an object (schema, name, ...) are stored once per object,
+column values are stored once per row with repeated strings interned and flags packed in a bytearray.
+row_start[i]..row_start[i+1] is the row range of the i-th object
+"""
+import sys
+from array import array
+from typing import List,Optional,Iterator,Iterable,Sequence
+from model import DatabaseObject,ObjectType
+from render import render_column,render_table,render_external_table,render_index_column,render_index
+
+
+def intern_value(value:Optional[str])->Optional[str]:
+
+    if value is None:
+        return None
+
+    return sys.intern(value)
+
+class TableCatalog:
+    """
+    Rows of GET_TABLE_SQL, ordered by table and ordinal position
+    """
+
+    def __init__(self):
+
+        self.table_schema:List[str] = list()
+        self.table_name:List[str] = list()
+        self.row_start = array("q",[0])
+
+        self.column_name:List[str] = list()
+        self.data_type:List[str] = list()
+        self.data_type_length:List[Optional[str]] = list()
+        self.is_nullable = bytearray()
+
+    def __len__(self)->int:
+        return len(self.table_name)
+
+    def append_row(self,row:Sequence):
+
+        if len(self.table_name)==0 or self.table_name[-1]!=row[1] or self.table_schema[-1]!=row[0]:
+            self.table_schema.append(intern_value(row[0]))
+            self.table_name.append(row[1])
+            self.row_start.append(self.row_start[-1])
+
+        self.column_name.append(intern_value(row[2]))
+        self.data_type.append(intern_value(row[3]))
+        self.data_type_length.append(intern_value(row[4]))
+        self.is_nullable.append(row[5]=="YES")
+
+        self.row_start[-1]+=1
+
+    @staticmethod
+    def from_rows(rows:Iterable[Sequence])->"TableCatalog":
+
+        catalog = TableCatalog()
+
+        for row in rows:
+            catalog.append_row(row=row)
+
+        return catalog
+
+    def iter_object(self)->Iterator[DatabaseObject]:
+
+        for index in range(len(self.table_name)):
+
+            columns = [render_column(column_name=self.column_name[row_index],\
+                                     data_type=self.data_type[row_index],\
+                                     data_type_length=self.data_type_length[row_index],\
+                                     is_nullable=self.is_nullable[row_index]==1)\
+                       for row_index in range(self.row_start[index],self.row_start[index+1])]
+
+            yield DatabaseObject(object_schema=self.table_schema[index],\
+                                 object_name=self.table_name[index],\
+                                 object_definition=render_table(table_schema=self.table_schema[index],\
+                                                                table_name=self.table_name[index],\
+                                                                columns=columns),\
+                                 object_type=ObjectType.TABLE)
+
+class IndexCatalog:
+    """
+    Rows of GET_INDEX_SQL, ordered by table, index and column position
+    """
+
+    def __init__(self):
+
+        self.index_schema:List[str] = list()
+        self.table_name:List[str] = list()
+        self.index_name:List[str] = list()
+        self.index_type:List[str] = list()
+        self.row_start = array("q",[0])
+
+        self.index_column_name:List[str] = list()
+        self.is_included_column = bytearray()
+        self.is_descending_key = bytearray()
+
+    def __len__(self)->int:
+        return len(self.index_name)
+
+    def append_row(self,row:Sequence):
+
+        if len(self.index_name)==0 or self.index_name[-1]!=row[2] or\
+            self.table_name[-1]!=row[1] or self.index_schema[-1]!=row[0]:
+            self.index_schema.append(intern_value(row[0]))
+            self.table_name.append(intern_value(row[1]))
+            self.index_name.append(row[2])
+            self.index_type.append(intern_value(row[4]))
+            self.row_start.append(self.row_start[-1])
+
+        self.index_column_name.append(intern_value(row[3]))
+        self.is_included_column.append(bool(row[6]))
+        self.is_descending_key.append(bool(row[7]))
+
+        self.row_start[-1]+=1
+
+    @staticmethod
+    def from_rows(rows:Iterable[Sequence])->"IndexCatalog":
+
+        catalog = IndexCatalog()
+
+        for row in rows:
+            catalog.append_row(row=row)
+
+        return catalog
+
+    def iter_object(self)->Iterator[DatabaseObject]:
+
+        for index in range(len(self.index_name)):
+
+            index_columns:List[str] = list()
+
+            include_columns:List[str] = list()
+
+            for row_index in range(self.row_start[index],self.row_start[index+1]):
+
+                column = render_index_column(column_name=self.index_column_name[row_index],\
+                                             is_descending_key=self.is_descending_key[row_index]==1)
+
+                if self.is_included_column[row_index]:
+                    include_columns.append(column)
+                else:
+                    index_columns.append(column)
+
+            yield DatabaseObject(object_schema=self.index_schema[index],\
+                                 object_name=self.index_name[index],\
+                                 object_definition=render_index(index_type=self.index_type[index],\
+                                                                index_name=self.index_name[index],\
+                                                                index_schema=self.index_schema[index],\
+                                                                table_name=self.table_name[index],\
+                                                                index_columns=index_columns,\
+                                                                include_columns=include_columns),\
+                                 object_type=ObjectType.INDEX)
+
+class ExtTableCatalog:
+    """
+    Rows of GET_EXTERNAL_TABLE_SQL, ordered by external table and ordinal position
+    """
+
+    def __init__(self):
+
+        self.external_table_schema:List[str] = list()
+        self.external_table_name:List[str] = list()
+        self.external_location:List[str] = list()
+        self.external_data_source_name:List[str] = list()
+        self.file_format_name:List[str] = list()
+        self.row_start = array("q",[0])
+
+        self.column_name:List[str] = list()
+        self.data_type:List[str] = list()
+        self.data_type_length:List[Optional[str]] = list()
+        self.is_nullable = bytearray()
+
+    def __len__(self)->int:
+        return len(self.external_table_name)
+
+    def append_row(self,row:Sequence):
+
+        if len(self.external_table_name)==0 or self.external_table_name[-1]!=row[1] or\
+            self.external_table_schema[-1]!=row[0]:
+            self.external_table_schema.append(intern_value(row[0]))
+            self.external_table_name.append(row[1])
+            self.external_location.append(row[7])
+            self.external_data_source_name.append(intern_value(row[8]))
+            self.file_format_name.append(intern_value(row[9]))
+            self.row_start.append(self.row_start[-1])
+
+        self.column_name.append(intern_value(row[2]))
+        self.data_type.append(intern_value(row[3]))
+        self.data_type_length.append(intern_value(row[4]))
+        self.is_nullable.append(bool(row[5]))
+
+        self.row_start[-1]+=1
+
+    @staticmethod
+    def from_rows(rows:Iterable[Sequence])->"ExtTableCatalog":
+
+        catalog = ExtTableCatalog()
+
+        for row in rows:
+            catalog.append_row(row=row)
+
+        return catalog
+
+    def iter_object(self)->Iterator[DatabaseObject]:
+
+        for index in range(len(self.external_table_name)):
+
+            columns = [render_column(column_name=self.column_name[row_index],\
+                                     data_type=self.data_type[row_index],\
+                                     data_type_length=self.data_type_length[row_index],\
+                                     is_nullable=self.is_nullable[row_index]==1)\
+                       for row_index in range(self.row_start[index],self.row_start[index+1])]
+
+            yield DatabaseObject(object_schema=self.external_table_schema[index],\
+                                 object_name=self.external_table_name[index],\
+                                 object_definition=render_external_table(table_schema=self.external_table_schema[index],\
+                                                                         table_name=self.external_table_name[index],\
+                                                                         columns=columns,\
+                                                                         external_location=self.external_location[index],\
+                                                                         external_data_source_name=self.external_data_source_name[index],\
+                                                                         file_format_name=self.file_format_name[index]),\
+                                 object_type=ObjectType.EXTTABLE)
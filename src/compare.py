@@ -0,0 +1,128 @@
+"""
+Comparison of the objects extracted for two remotes (or two copies of a remote folder).
+Objects are compared by content hash, from the manifest of a file output or computed from a pack,
+and definitions are only read for the changed objects
+"""
+import difflib
+import hashlib
+from pathlib import Path
+from typing import List,Dict,Optional,Iterator
+from model import ObjectType,ObjectTypeDiff,ObjectFilter
+from config import MANIFEST_FILE,PACK_FILE
+from objectfilter import is_object_file_match
+from writer import load_manifest,parse_database_object_file
+from pack import PackReader
+
+
+class ObjectSource:
+    """
+    Content hash and definition of the objects of a remote folder, from its files or its pack
+    whichever was written last
+    """
+
+    def __init__(self,remote_dir:Path):
+
+        self.remote_dir = remote_dir
+
+        manifest_path = remote_dir/MANIFEST_FILE
+
+        pack_path = remote_dir/PACK_FILE
+
+        self.pack_reader:Optional[PackReader] = None
+
+        if pack_path.is_file() and (not manifest_path.is_file() or pack_path.stat().st_mtime>=manifest_path.stat().st_mtime):
+            self.pack_reader = PackReader.open(remote_dir=remote_dir)
+
+        elif not manifest_path.is_file():
+            raise ValueError(f"{remote_dir} holds no extracted objects")
+
+    def get_content_hash(self)->Dict[str,str]:
+        """
+        Return the content hash of every object keyed by its file path relative to the remote folder
+        """
+
+        if self.pack_reader is None:
+            return load_manifest(manifest_path=self.remote_dir/MANIFEST_FILE)
+
+        return {x:hashlib.sha256(y).hexdigest() for x,y in self.pack_reader.iter_record()}
+
+    def get_definition(self,object_file:str)->str:
+
+        if self.pack_reader is None:
+            with (self.remote_dir/object_file).open("r",newline="") as file:
+                return file.read()
+
+        return self.pack_reader.get_definition(key=object_file)
+
+    def close(self):
+
+        if self.pack_reader is not None:
+            self.pack_reader.close()
+
+def diff_content_hash(content_hash_a:Dict[str,str],\
+                      content_hash_b:Dict[str,str],\
+                      object_filter:Optional[ObjectFilter]=None)->List[ObjectTypeDiff]:
+    """
+    Return the added (only in b), removed (only in a) and changed objects grouped by type, in ObjectType order.
+    Types without difference are left out
+    """
+
+    object_type_diffs:Dict[ObjectType,ObjectTypeDiff] = {x:ObjectTypeDiff(object_type=x) for x in ObjectType}
+
+    def get_type_diff(object_file:str)->Optional[ObjectTypeDiff]:
+
+        parsed_object_file = parse_database_object_file(object_file=object_file)
+
+        if parsed_object_file is None:
+            return None
+
+        if object_filter is not None and not is_object_file_match(object_filter=object_filter,object_file=object_file):
+            return None
+
+        return object_type_diffs[parsed_object_file[2]]
+
+    for object_file,content_hash in content_hash_a.items():
+
+        other_content_hash = content_hash_b.get(object_file)
+
+        if other_content_hash==content_hash:
+            continue
+
+        object_type_diff = get_type_diff(object_file=object_file)
+
+        if object_type_diff is None:
+            continue
+
+        if other_content_hash is None:
+            object_type_diff.removed.append(object_file)
+        else:
+            object_type_diff.changed.append(object_file)
+
+    for object_file in content_hash_b.keys()-content_hash_a.keys():
+
+        object_type_diff = get_type_diff(object_file=object_file)
+
+        if object_type_diff is not None:
+            object_type_diff.added.append(object_file)
+
+    for object_type_diff in object_type_diffs.values():
+        object_type_diff.added.sort()
+        object_type_diff.removed.sort()
+        object_type_diff.changed.sort()
+
+    return [x for x in object_type_diffs.values() if len(x.added)+len(x.removed)+len(x.changed)>0]
+
+def get_unified_diff(source_a:ObjectSource,source_b:ObjectSource,object_file:str,label_a:str,label_b:str)->Iterator[str]:
+    """
+    Lines of the unified diff of an object, a definition without final line break is marked as git does
+    """
+
+    for line in difflib.unified_diff(source_a.get_definition(object_file=object_file).splitlines(keepends=True),\
+                                     source_b.get_definition(object_file=object_file).splitlines(keepends=True),\
+                                     fromfile=f"{label_a}/{object_file}",\
+                                     tofile=f"{label_b}/{object_file}"):
+
+        if line.endswith("\n"):
+            yield line
+        else:
+            yield line+"\n\\ No newline at end of file\n"
@@ -1,5 +1,80 @@
 REMOTE_DIR = ".dos"
 
+#number of connections kept in the pool shared by an extraction run
+POOL_SIZE = 1
+
+#number of remotes extracted concurrently in fleet mode
+FLEET_MAX_PARALLEL = 8
+
+#number of remotes of the same host extracted concurrently in fleet mode
+FLEET_MAX_PER_HOST = 2
+
+#number of rows fetched per round trip while streaming a result set
+FETCH_BATCH_SIZE = 1000
+
+#maximum number of bytes of module definitions fetched in a single round trip (a larger definition is fetched alone)
+MODULE_BATCH_BYTES = 8*1024*1024
+
+#number of times a failed batch of module definitions is fetched again, and the delay before the first retry in seconds (doubled at every retry)
+FETCH_RETRY_COUNT = 3
+FETCH_RETRY_DELAY = 1.0
+
+#capacity of the pipeline queues: batches of FETCH_BATCH_SIZE rows between the fetch and render stages of a category,
+#batches of OBJECT_BATCH_SIZE objects between the render stages and the write stage
+ROW_QUEUE_DEPTH = 2
+OBJECT_QUEUE_DEPTH = 8
+OBJECT_BATCH_SIZE = 32
+
+#number of threads writing object files
+WRITE_JOBS = 4
+
+#number of objects waiting to be written before extraction is blocked
+WRITE_QUEUE_DEPTH = 256
+
+#name of the file keeping the content hash of every object file of a remote
+MANIFEST_FILE = ".manifest.json"
+
+#maximum number of object id sent in a single IN list (sql server allow at most 2100 parameters)
+MODULE_BATCH_SIZE = 1000
+
+#name of the file keeping the module state of the last incremental run of a remote
+MODULE_STATE_FILE = ".state.json"
+
+#name of the file keeping the metrics of the last run of a remote
+REPORT_FILE = ".report.json"
+
+#seconds between two polls of the change marker in watch mode
+WATCH_INTERVAL = 10
+
+#maximum number of objects and bytes of definitions created in a single round trip by the apply command
+APPLY_BATCH_SIZE = 100
+APPLY_BATCH_BYTES = 512*1024
+
+#first bytes of a catalog snapshot file
+SNAPSHOT_MAGIC = b"DOSSNAP2"
+
+#seconds a cached catalog query result is used (--cache), and the suffix of the cache files
+CACHE_TTL = 300
+CACHE_FILE_SUFFIX = ".rows"
+
+#name of the files of the packed output of a remote, and their first bytes
+PACK_FILE = "objects.pack"
+PACK_INDEX_FILE = "objects.idx"
+PACK_MAGIC = b"DOSPACK1"
+PACK_INDEX_MAGIC = b"DOSPIDX1"
+
+#default branch of the git output, shared by all the remotes
+GIT_BRANCH = "dos"
+
+#folder of the git output repository keeping the report and module state of each remote, outside of the commits
+GIT_RUN_DIR = "dos"
+
+#replaced in the catalog queries by the predicates of the schema and name filters
+OBJECT_FILTER_MARKER = "/*object_filter*/"
+
+#database uri prefix of the SQLite synthetic catalogs generated by fake.py
+FAKE_DATABASE_PREFIX = "sqlite:///"
+
 GET_VIEW_CODE = """
 
 SELECT views.view_schema,
@@ -14,6 +89,8 @@ FROM
 )AS views
 INNER JOIN sys.sql_modules
 ON views.object_id = sql_modules.object_id
+WHERE 1=1
+/*object_filter*/
 ORDER BY views.view_schema,views.view_name;
 
 """
@@ -58,6 +135,8 @@ INNER JOIN
 )AS base_table
 ON COLUMNS.table_schema = base_table.table_schema
 AND COLUMNS.table_name = base_table.table_name
+WHERE 1=1
+/*object_filter*/
 ORDER BY COLUMNS.table_schema,
 COLUMNS.table_name,
 COLUMNS.ordinal_position;
@@ -83,6 +162,7 @@ WHERE type IN
 	--table-valued function
 	'TF'
 )
+/*object_filter*/
 ORDER BY SCHEMA_NAME(funcs.schema_id),
 OBJECT_NAME(funcs.object_id);
 """
@@ -123,7 +203,9 @@ AND indexes.type_desc IN
 	'NONCLUSTERED'
 )
 AND SCHEMA_NAME(objects.schema_id)!='sys'
+/*object_filter*/
 ORDER BY SCHEMA_NAME(objects.schema_id),
+objects.name,
 indexes.name,
 index_column.index_column_id;
 
@@ -147,6 +229,8 @@ FROM
 ) AS routines
 INNER JOIN sys.sql_modules
 ON routines.object_id = sql_modules.object_id
+WHERE 1=1
+/*object_filter*/
 ORDER BY routines.routine_schema,
 routines.routine_name;
 
@@ -161,6 +245,8 @@ credentials.name AS credential_name
 FROM sys.external_data_sources
 LEFT JOIN sys.database_scoped_credentials AS credentials
 ON external_data_sources.credential_id = credentials.credential_id
+WHERE 1=1
+/*object_filter*/
 ORDER BY external_data_sources.name;
 
 """
@@ -208,6 +294,8 @@ LEFT JOIN sys.all_columns
 ON external_tables.object_id = all_columns.object_id
 LEFT JOIN sys.types
 ON all_columns.user_type_id = types.user_type_id
+WHERE 1=1
+/*object_filter*/
 ORDER BY SCHEMA_NAME(external_tables.schema_id),
 external_tables.name,
 all_columns.column_id;
@@ -223,7 +311,303 @@ string_delimiter,
 use_type_default,
 first_row
 FROM sys.external_file_formats
+WHERE 1=1
+/*object_filter*/
 ORDER BY file_format_name;
 
 """
 
+GET_MODULE_STATE_SQL = """
+
+/*
+View, function and procedure last modification used by incremental extraction,
+with the size of their definition so they can be fetched in batches of bounded size
+*/
+SELECT objects.object_id,
+SCHEMA_NAME(objects.schema_id) AS object_schema,
+objects.name AS object_name,
+RTRIM(objects.type) AS object_type,
+objects.modify_date,
+DATALENGTH(sql_modules.definition) AS definition_length
+FROM sys.objects
+INNER JOIN sys.sql_modules
+ON objects.object_id = sql_modules.object_id
+WHERE objects.type IN 
+(
+	--view
+	'V',
+	--store procedure
+	'P',
+	--scalar function
+	'FN',
+	--inlined table-valued function
+	'IF',
+	--table-valued function
+	'TF'
+)
+AND objects.is_ms_shipped = 0
+/*object_filter*/
+ORDER BY objects.object_id;
+
+"""
+
+GET_OBJECT_STATE_SQL = """
+
+/*
+Table, external table, view, function and procedure last modification used by watch mode.
+Altering a column or creating, altering or dropping an index also update the modify_date of its table
+*/
+SELECT objects.object_id,
+SCHEMA_NAME(objects.schema_id) AS object_schema,
+objects.name AS object_name,
+RTRIM(objects.type) AS object_type,
+objects.modify_date,
+DATALENGTH(sql_modules.definition) AS definition_length
+FROM sys.objects
+LEFT JOIN sys.sql_modules
+ON objects.object_id = sql_modules.object_id
+WHERE objects.type IN ('U','ET','V','P','FN','IF','TF')
+AND objects.is_ms_shipped = 0
+/*object_filter*/
+ORDER BY objects.object_id;
+
+"""
+
+GET_CHANGE_MARKER_SQL = """
+
+/*
+Change indicator polled by watch mode and keying the query cache: a single row computed from sys.objects,
+sys.external_data_sources and sys.external_file_formats.
+A created or modified object move the last modification, a dropped one lower the count.
+External data sources and file formats have no modification date, so their rows are checksummed
+*/
+SELECT object_state.object_count,
+object_state.last_modify_date,
+data_source_state.data_source_count,
+data_source_state.data_source_checksum,
+file_format_state.file_format_count,
+file_format_state.file_format_checksum
+FROM
+(
+	SELECT COUNT(*) AS object_count,
+	MAX(objects.modify_date) AS last_modify_date
+	FROM sys.objects
+	WHERE objects.type IN ('U','ET','V','P','FN','IF','TF')
+	AND objects.is_ms_shipped = 0
+) AS object_state
+CROSS JOIN
+(
+	SELECT COUNT(*) AS data_source_count,
+	CHECKSUM_AGG(CHECKSUM(*)) AS data_source_checksum
+	FROM sys.external_data_sources
+) AS data_source_state
+CROSS JOIN
+(
+	SELECT COUNT(*) AS file_format_count,
+	CHECKSUM_AGG(CHECKSUM(*)) AS file_format_checksum
+	FROM sys.external_file_formats
+) AS file_format_state;
+
+"""
+
+GET_MODULE_PAGE_SQL = """
+
+/*
+Next page of the views, functions or procedures of :object_types by object id (keyset pagination),
+with the size of their definition so they can be fetched in batches of bounded size
+*/
+SELECT TOP (:page_size) objects.object_id,
+SCHEMA_NAME(objects.schema_id) AS object_schema,
+objects.name AS object_name,
+DATALENGTH(sql_modules.definition) AS definition_length
+FROM sys.objects
+INNER JOIN sys.sql_modules
+ON objects.object_id = sql_modules.object_id
+WHERE objects.type IN :object_types
+AND objects.is_ms_shipped = 0
+AND objects.object_id > :last_object_id
+/*object_filter*/
+ORDER BY objects.object_id;
+
+"""
+
+GET_MODULE_DEFINITION_SQL = """
+
+SELECT sql_modules.object_id,
+sql_modules.definition
+FROM sys.sql_modules
+WHERE sql_modules.object_id IN :object_ids
+ORDER BY sql_modules.object_id;
+
+"""
+
+#Server side rendering (--server-render) of the table, external table and index column lists.
+#Each column is rendered exactly like render.py and the columns are aggregated in ordinal order,
+#so the client receive a single row per object.
+#STRING_AGG only accept a literal separator, so every column is prefixed by a line feed and
+#the first one is removed with STUFF to get the ',<line feed>' separator of render_column_list
+
+GET_TABLE_DDL_SQL = """
+
+SELECT COLUMNS.table_schema,
+COLUMNS.table_name,
+STUFF(STRING_AGG(CAST(CONCAT(CHAR(10),
+'[',
+COLUMNS.column_name,
+'] ',
+COLUMNS.data_type,
+CASE
+	WHEN COLUMNS.data_type IN 
+	(
+		'char',
+		'varchar',
+		'nchar',
+		'nvarchar'
+	)
+	THEN 
+		CASE
+			WHEN COLUMNS.character_maximum_length = -1
+			THEN '(max)'
+			ELSE '('+CAST(COLUMNS.character_maximum_length AS nvarchar(10))+')'
+		END
+	WHEN COLUMNS.data_type IN 
+	(
+		'decimal',
+		'numeric'
+	)
+	THEN '('+CAST(COLUMNS.numeric_precision AS nvarchar(10)) + ',' + CAST(COLUMNS.numeric_scale AS nvarchar(10)) + ')'
+	ELSE ''
+END,
+' ',
+CASE
+	WHEN COLUMNS.is_nullable = 'YES'
+	THEN 'NULL'
+	ELSE 'NOT NULL'
+END) AS nvarchar(max)),',') WITHIN GROUP (ORDER BY COLUMNS.ordinal_position),1,1,'') AS column_list
+FROM INFORMATION_SCHEMA.COLUMNS
+INNER JOIN 
+(
+	SELECT table_schema,
+	table_name
+	FROM INFORMATION_SCHEMA.TABLES
+	WHERE table_type = 'BASE TABLE'
+)AS base_table
+ON COLUMNS.table_schema = base_table.table_schema
+AND COLUMNS.table_name = base_table.table_name
+WHERE 1=1
+/*object_filter*/
+GROUP BY COLUMNS.table_schema,
+COLUMNS.table_name
+ORDER BY COLUMNS.table_schema,
+COLUMNS.table_name;
+
+"""
+
+GET_EXTERNAL_TABLE_DDL_SQL = """
+
+SELECT SCHEMA_NAME(external_tables.schema_id) AS external_table_schema, 
+external_tables.name AS external_table_name,
+STUFF(STRING_AGG(CAST(CONCAT(CHAR(10),
+'[',
+all_columns.name,
+'] ',
+types.name,
+CASE
+	WHEN types.name IN 
+	(
+		'char',
+		'varchar',
+		'nchar',
+		'nvarchar'
+	)
+	THEN 
+		CASE
+			WHEN all_columns.max_length = -1
+			THEN '(max)'
+			ELSE '('+CAST(all_columns.max_length AS nvarchar(10))+')'
+		END
+	WHEN types.name IN 
+	(
+		'decimal',
+		'numeric'
+	)
+	THEN '('+CAST(all_columns.precision AS nvarchar(10)) + ',' + CAST(all_columns.scale AS nvarchar(10)) + ')'
+	ELSE ''
+END,
+' ',
+CASE
+	WHEN all_columns.is_nullable = 1
+	THEN 'NULL'
+	ELSE 'NOT NULL'
+END) AS nvarchar(max)),',') WITHIN GROUP (ORDER BY all_columns.column_id),1,1,'') AS column_list,
+external_tables.location AS external_location,
+external_data_sources.name AS external_data_source_name,
+external_file_formats.name AS file_format_name
+FROM sys.external_tables
+LEFT JOIN sys.external_data_sources 
+ON external_tables.data_source_id =  external_data_sources.data_source_id
+LEFT JOIN sys.external_file_formats
+ON external_tables.file_format_id = external_file_formats.file_format_id
+INNER JOIN sys.all_columns 
+ON external_tables.object_id = all_columns.object_id
+INNER JOIN sys.types
+ON all_columns.user_type_id = types.user_type_id
+WHERE 1=1
+/*object_filter*/
+GROUP BY external_tables.schema_id,
+external_tables.name,
+external_tables.location,
+external_data_sources.name,
+external_file_formats.name
+ORDER BY SCHEMA_NAME(external_tables.schema_id),
+external_tables.name;
+
+"""
+
+GET_INDEX_DDL_SQL = """
+
+SELECT SCHEMA_NAME(objects.schema_id) AS index_schema,
+objects.name AS table_name,
+indexes.name AS index_name,
+indexes.type_desc AS index_type,
+--STRING_AGG skip the NULL of the other kind of column
+STRING_AGG(CASE
+	WHEN index_column.is_included_column = 0
+	THEN CAST(CONCAT('[',columns.name,'] ',CASE WHEN index_column.is_descending_key = 1 THEN 'DESC' ELSE 'ASC' END) AS nvarchar(max))
+END,',') WITHIN GROUP (ORDER BY index_column.index_column_id) AS index_column_list,
+STRING_AGG(CASE
+	WHEN index_column.is_included_column = 1
+	THEN CAST(CONCAT('[',columns.name,'] ',CASE WHEN index_column.is_descending_key = 1 THEN 'DESC' ELSE 'ASC' END) AS nvarchar(max))
+END,',') WITHIN GROUP (ORDER BY index_column.index_column_id) AS include_column_list
+FROM sys.indexes 
+INNER JOIN sys.index_columns index_column 
+ON indexes.object_id = index_column.object_id 
+AND indexes.index_id = index_column.index_id
+INNER JOIN sys.columns
+ON index_column.object_id = columns.object_id 
+AND index_column.column_id = columns.column_id
+INNER JOIN sys.objects
+ON indexes.object_id = objects.object_id
+--exclude primary key index
+WHERE indexes.is_primary_key = 0 
+--exclude unique constraints
+AND indexes.is_unique = 0 
+--Consider only clustered and non-clustered indexes
+AND indexes.type_desc IN 
+(
+	'CLUSTERED',
+	'NONCLUSTERED'
+)
+AND SCHEMA_NAME(objects.schema_id)!='sys'
+/*object_filter*/
+GROUP BY objects.schema_id,
+objects.name,
+indexes.object_id,
+indexes.index_id,
+indexes.name,
+indexes.type_desc
+ORDER BY SCHEMA_NAME(objects.schema_id),
+objects.name,
+indexes.name;
+
+"""
@@ -1,11 +1,101 @@
 import urllib
-from sqlalchemy import create_engine,text
-from config import GET_VIEW_CODE,GET_TABLE_SQL,GET_FUNCTION_SQL,GET_PROCEDURE_SQL,GET_INDEX_SQL,GET_EXTERNAL_DATA_SOURCE_SQL
+import time
+from sqlalchemy import create_engine,text,event,bindparam
+from sqlalchemy.engine import Engine,Connection
+from sqlalchemy.exc import OperationalError,InterfaceError
+from config import POOL_SIZE,FETCH_BATCH_SIZE,GET_VIEW_CODE,GET_TABLE_SQL,GET_FUNCTION_SQL,GET_PROCEDURE_SQL,GET_INDEX_SQL,GET_EXTERNAL_DATA_SOURCE_SQL
 from config import GET_EXTERNAL_TABLE_SQL,GET_EXTERNAL_FILE_FORMAT_SQL
-from typing import List,Dict
-from model import DatabaseObject,ObjectType,TableInfo,IndexInfo,ExtDataSourceInfo,ExtTableInfo
-from func import group_by
-
+from config import GET_MODULE_STATE_SQL,GET_MODULE_DEFINITION_SQL,GET_MODULE_PAGE_SQL,GET_OBJECT_STATE_SQL,GET_CHANGE_MARKER_SQL
+from config import GET_TABLE_DDL_SQL,GET_EXTERNAL_TABLE_DDL_SQL,GET_INDEX_DDL_SQL,OBJECT_FILTER_MARKER
+from typing import List,Dict,Tuple,Iterator,Iterable,Sequence,Callable,Optional,Any
+from itertools import groupby
+from functools import lru_cache
+from model import DatabaseObject,ObjectType,TableInfo,IndexInfo,ExtDataSourceInfo,ExtTableInfo,ConnectionStats
+from model import ModuleState,ObjectFilter,FetchOptions
+from objectfilter import get_like_pattern
+from sqlalchemy.sql.elements import TextClause
+from render import render_column,render_table,render_external_table,render_index_column,render_index
+
+
+#sys.objects type of the objects stored in sys.sql_modules
+MODULE_OBJECT_TYPE:Dict[str,ObjectType] = {
+    "V":ObjectType.VIEW,
+    "P":ObjectType.PROCEDURE,
+    "FN":ObjectType.FUNCTION,
+    "IF":ObjectType.FUNCTION,
+    "TF":ObjectType.FUNCTION
+}
+
+#sys.objects type of the objects whose last modification is tracked by watch mode
+STATE_OBJECT_TYPE:Dict[str,ObjectType] = dict(MODULE_OBJECT_TYPE,U=ObjectType.TABLE,ET=ObjectType.EXTTABLE)
+
+#state queries by name, see get_object_state
+STATE_QUERY:Dict[str,str] = {
+    "GET_MODULE_STATE_SQL":GET_MODULE_STATE_SQL,
+    "GET_OBJECT_STATE_SQL":GET_OBJECT_STATE_SQL
+}
+
+#polled by watch mode, built once
+CHANGE_MARKER_STATEMENT = text(GET_CHANGE_MARKER_SQL)
+
+#sys.objects types of the module catalog queries, whose definitions are fetched by keyset pagination (GET_MODULE_PAGE_SQL)
+MODULE_QUERY_TYPES:Dict[str,List[str]] = {
+    "GET_VIEW_CODE":["V"],
+    "GET_FUNCTION_SQL":["FN","IF","TF"],
+    "GET_PROCEDURE_SQL":["P"]
+}
+
+#smallest object id, below every module
+MIN_OBJECT_ID = -2**31
+
+#catalog queries by name. The rows of each query are turned into objects by CATALOG_OBJECT_FUNC
+CATALOG_QUERY:Dict[str,str] = {
+    "GET_TABLE_SQL":GET_TABLE_SQL,
+    "GET_VIEW_CODE":GET_VIEW_CODE,
+    "GET_FUNCTION_SQL":GET_FUNCTION_SQL,
+    "GET_PROCEDURE_SQL":GET_PROCEDURE_SQL,
+    "GET_INDEX_SQL":GET_INDEX_SQL,
+    "GET_EXTERNAL_DATA_SOURCE_SQL":GET_EXTERNAL_DATA_SOURCE_SQL,
+    "GET_EXTERNAL_TABLE_SQL":GET_EXTERNAL_TABLE_SQL,
+    "GET_EXTERNAL_FILE_FORMAT_SQL":GET_EXTERNAL_FILE_FORMAT_SQL,
+    "GET_TABLE_DDL_SQL":GET_TABLE_DDL_SQL,
+    "GET_INDEX_DDL_SQL":GET_INDEX_DDL_SQL,
+    "GET_EXTERNAL_TABLE_DDL_SQL":GET_EXTERNAL_TABLE_DDL_SQL
+}
+
+#schema and name expressions of each catalog query filtered by an ObjectFilter (None when the objects have no schema)
+CATALOG_FILTER_COLUMN:Dict[str,Tuple[Optional[str],str]] = {
+    "GET_TABLE_SQL":("COLUMNS.table_schema","COLUMNS.table_name"),
+    "GET_VIEW_CODE":("views.view_schema","views.view_name"),
+    "GET_FUNCTION_SQL":("SCHEMA_NAME(funcs.schema_id)","OBJECT_NAME(funcs.object_id)"),
+    "GET_PROCEDURE_SQL":("routines.routine_schema","routines.routine_name"),
+    "GET_INDEX_SQL":("SCHEMA_NAME(objects.schema_id)","indexes.name"),
+    "GET_EXTERNAL_DATA_SOURCE_SQL":(None,"external_data_sources.name"),
+    "GET_EXTERNAL_TABLE_SQL":("SCHEMA_NAME(external_tables.schema_id)","external_tables.name"),
+    "GET_EXTERNAL_FILE_FORMAT_SQL":(None,"name"),
+    "GET_TABLE_DDL_SQL":("COLUMNS.table_schema","COLUMNS.table_name"),
+    "GET_INDEX_DDL_SQL":("SCHEMA_NAME(objects.schema_id)","indexes.name"),
+    "GET_EXTERNAL_TABLE_DDL_SQL":("SCHEMA_NAME(external_tables.schema_id)","external_tables.name"),
+    "GET_MODULE_STATE_SQL":("SCHEMA_NAME(objects.schema_id)","objects.name"),
+    "GET_OBJECT_STATE_SQL":("SCHEMA_NAME(objects.schema_id)","objects.name"),
+    "GET_MODULE_PAGE_SQL":("SCHEMA_NAME(objects.schema_id)","objects.name")
+}
+
+#position of the schema and name in the rows of each catalog query, for the providers which cannot filter on a server
+CATALOG_FILTER_INDEX:Dict[str,Tuple[Optional[int],int]] = {
+    "GET_TABLE_SQL":(0,1),
+    "GET_VIEW_CODE":(0,1),
+    "GET_FUNCTION_SQL":(0,1),
+    "GET_PROCEDURE_SQL":(0,1),
+    "GET_INDEX_SQL":(0,2),
+    "GET_EXTERNAL_DATA_SOURCE_SQL":(None,0),
+    "GET_EXTERNAL_TABLE_SQL":(0,1),
+    "GET_EXTERNAL_FILE_FORMAT_SQL":(None,0),
+    "GET_TABLE_DDL_SQL":(0,1),
+    "GET_INDEX_DDL_SQL":(0,2),
+    "GET_EXTERNAL_TABLE_DDL_SQL":(0,1),
+    "GET_MODULE_STATE_SQL":(1,2)
+}
 
 def get_connection_string(host:str,database_name:str,user:str,password:str)->str:
 
@@ -17,380 +107,510 @@ def get_connection_string(host:str,database_name:str,user:str,password:str)->str
 
     return connection_string
 
-def test_connection(connection_str:str)->bool:
+def create_database_engine(connection_str:str,pool_size:int=POOL_SIZE)->Tuple[Engine,ConnectionStats]:
+    """
+    Create the engine whose connection pool is shared by every query of an extraction run.
+    The returned stats count how many connections (logins) the pool actually opened
+    """
+
+    engine = create_engine(connection_str,\
+                           pool_size=pool_size,\
+                           max_overflow=0)
+
+    connection_stats = ConnectionStats()
+
+    def count_connection(dbapi_connection,connection_record):
+        connection_stats.connection_count+=1
+
+    event.listen(engine,"connect",count_connection)
+
+    return (engine,connection_stats)
+
+def test_connection(engine:Engine)->bool:
     """
     Test whether we can connect to database
     """
     try:
-        engine = create_engine(connection_str)
-
         with engine.connect() as connection:
             return True
     except:
         return False
 
-def get_view_object(connection_str:str)->List[DatabaseObject]:
+def get_filter_clause(schema_column:Optional[str],\
+                      name_column:str,\
+                      object_filter:Optional[ObjectFilter])->Tuple[str,Dict[str,Any]]:
+    """
+    Return the predicates of the schema and name filters, each starting with AND, and their parameters
+    """
 
-    result:List[DatabaseObject] = list()
+    predicates:List[str] = list()
 
-    engine = create_engine(connection_str)
+    parameters:Dict[str,Any] = dict()
 
-    with engine.connect() as connection:
-        result_set = connection.execute(statement=text(GET_VIEW_CODE))
+    if object_filter is None:
+        return ("",parameters)
 
-        for row in result_set:
-            result.append(DatabaseObject(object_schema=row[0],\
-                                     object_name=row[1],\
-                                    object_definition=row[2],\
-                                    object_type=ObjectType.VIEW))
+    if schema_column is not None and len(object_filter.include_schemas)>0:
+        predicates.append(f"AND {schema_column} IN :include_schemas")
+        parameters["include_schemas"] = object_filter.include_schemas
 
-    return result
+    if schema_column is not None and len(object_filter.exclude_schemas)>0:
+        predicates.append(f"AND {schema_column} NOT IN :exclude_schemas")
+        parameters["exclude_schemas"] = object_filter.exclude_schemas
 
-def get_procedure_object(connection_str:str)->List[DatabaseObject]:
+    if object_filter.name_pattern is not None:
+        predicates.append(f"AND {name_column} LIKE :name_pattern ESCAPE '\\'")
+        parameters["name_pattern"] = get_like_pattern(name_pattern=object_filter.name_pattern)
 
-    result:List[DatabaseObject] = list()
+    return ("\n".join(predicates),parameters)
 
-    engine = create_engine(connection_str)
+def get_filtered_statement(sql:str,\
+                           schema_column:Optional[str],\
+                           name_column:str,\
+                           object_filter:Optional[ObjectFilter],\
+                           expanding_names:Sequence[str]=(),\
+                           statement_cache:Optional[Dict[str,TextClause]]=None)->Tuple[TextClause,Dict[str,Any]]:
+    """
+    Replace the OBJECT_FILTER_MARKER of the query by the filter predicates.
+    expanding_names are the list parameters of the query itself.
+    The statement only depends on which filters are set, so a statement_cache keyed by the final query
+    lets repeated calls reuse the same statement and its compiled form
+    """
 
-    with engine.connect() as connection:
-        result_set = connection.execute(statement=text(GET_PROCEDURE_SQL))
+    filter_clause,parameters = get_filter_clause(schema_column=schema_column,\
+                                                 name_column=name_column,\
+                                                 object_filter=object_filter)
 
-        for row in result_set:
-            result.append(DatabaseObject(object_schema=row[0],\
-                                     object_name=row[1],\
-                                    object_definition=row[2],\
-                                    object_type=ObjectType.PROCEDURE))
+    filtered_sql = sql.replace(OBJECT_FILTER_MARKER,filter_clause)
 
-    return result
+    statement = statement_cache.get(filtered_sql) if statement_cache is not None else None
 
-def get_function_object(connection_str:str)->List[DatabaseObject]:
+    if statement is None:
 
-    result:List[DatabaseObject] = list()
+        statement = text(filtered_sql)
 
-    engine = create_engine(connection_str)
+        expanding_parameters = [bindparam(x,expanding=True) for x in list(expanding_names)+["include_schemas","exclude_schemas"]\
+                                if x in parameters or x in expanding_names]
 
-    with engine.connect() as connection:
-        result_set = connection.execute(statement=text(GET_FUNCTION_SQL))
+        if len(expanding_parameters)>0:
+            statement = statement.bindparams(*expanding_parameters)
 
-        for row in result_set:
-            result.append(DatabaseObject(object_schema=row[0],\
-                                     object_name=row[1],\
-                                    object_definition=row[2],\
-                                    object_type=ObjectType.FUNCTION))
+        if statement_cache is not None:
+            statement_cache[filtered_sql] = statement
 
-    return result
+    return (statement,parameters)
 
-def get_table_object(connection_str:str)->List[DatabaseObject]:
-    result:List[DatabaseObject] = list()
+def fetch_rows(engine:Engine,\
+               query_name:str,\
+               object_filter:Optional[ObjectFilter]=None,\
+               statement_cache:Optional[Dict[str,TextClause]]=None)->Iterator[Sequence]:
+    """
+    Stream the raw rows of a catalog query of CATALOG_QUERY, filtered on the server
+    """
 
-    engine = create_engine(connection_str)
+    schema_column,name_column = CATALOG_FILTER_COLUMN[query_name]
 
-    table_info:List[TableInfo] = list()
+    statement,parameters = get_filtered_statement(sql=CATALOG_QUERY[query_name],\
+                                                  schema_column=schema_column,\
+                                                  name_column=name_column,\
+                                                  object_filter=object_filter,\
+                                                  statement_cache=statement_cache)
 
     with engine.connect() as connection:
-        result_set = connection.execute(statement=text(GET_TABLE_SQL))
+        yield from connection.execution_options(yield_per=FETCH_BATCH_SIZE).execute(statement=statement,parameters=parameters)
 
-        for row in result_set:
-            table_info.append(TableInfo(
-                table_schema=row[0],
-                table_name=row[1],
-                column_name=row[2],
-                data_type=row[3],
-                data_type_length=row[4],
-                is_nullable=row[5],
-                ordinal_position=int(row[6])
-            ))
-
-    result = create_table_object(table_info=table_info)
+def execute_with_retry(engine:Engine,statement:TextClause,parameters:Dict[str,Any],fetch_options:FetchOptions)->List[Sequence]:
+    """
+    Return all the rows of a statement, executed again on a new connection when the connection fail
+    """
 
-    return result
+    for attempt in range(fetch_options.retry_count+1):
+        try:
+            with engine.connect() as connection:
+                return connection.execute(statement=statement,parameters=parameters).fetchall()
+        except (OperationalError,InterfaceError):
+            if attempt==fetch_options.retry_count:
+                raise
 
+            time.sleep(fetch_options.retry_delay*2**attempt)
 
-def get_index_object(connection_str:str)->List[DatabaseObject]:
-    result:List[DatabaseObject] = list()
+def split_module_batch(module_keys:Iterable[Sequence],fetch_options:FetchOptions)->Iterator[List[Sequence]]:
+    """
+    Split the object id,schema,name,definition length rows into batches of at most batch_size objects and batch_bytes bytes.
+    A definition larger than batch_bytes is a batch on its own
+    """
 
-    engine = create_engine(connection_str)
+    batch:List[Sequence] = list()
 
-    index_info:List[IndexInfo] = list()
+    batch_bytes = 0
 
-    with engine.connect() as connection:
-        result_set = connection.execute(statement=text(GET_INDEX_SQL))
+    for module_key in module_keys:
 
-        for row in result_set:
-            index_info.append(IndexInfo(
-                index_schema=row[0],
-                table_name=row[1],
-                index_name=row[2],
-                index_column_name=row[3],
-                index_type=row[4],
-                column_position=row[5],
-                is_included_column=row[6],
-                is_descending_key=row[7]
-            ))
-
-    result = create_index_object(index_info=index_info)
+        definition_length = module_key[3] or 0
 
-    return result
+        if len(batch)>0 and (len(batch)>=fetch_options.batch_size or batch_bytes+definition_length>fetch_options.batch_bytes):
+            yield batch
 
-def get_ext_data_source_object(connection_str:str)->List[DatabaseObject]:
+            batch = list()
+            batch_bytes = 0
 
-    result:List[DatabaseObject] = list()
+        batch.append(module_key)
 
-    engine = create_engine(connection_str)
+        batch_bytes+=definition_length
 
-    ext_data_source_info:List[ExtDataSourceInfo] = list()
+    if len(batch)>0:
+        yield batch
 
-    with engine.connect() as connection:
-        result_set = connection.execute(statement=text(GET_EXTERNAL_DATA_SOURCE_SQL))
+@lru_cache(maxsize=None)
+def get_definition_statement(definition_sql:str)->TextClause:
+    """
+    Statement of a module definition query, built once per query
+    """
 
-        for row in result_set:
-            ext_data_source_info.append(ExtDataSourceInfo(
-                external_data_source_name=row[0],
-                external_data_source_type=row[1],
-                external_data_source_location=row[2],
-                credential_name=row[3]
-            ))
+    return text(definition_sql).bindparams(bindparam("object_ids",expanding=True))
 
-    result = create_external_data_source_object(ext_data_source_info=ext_data_source_info)
+def fetch_module_rows(engine:Engine,\
+                      page_statement:TextClause,\
+                      page_parameters:Dict[str,Any],\
+                      fetch_options:FetchOptions,\
+                      definition_sql:str=GET_MODULE_DEFINITION_SQL)->Iterator[Tuple[str,str,str]]:
+    """
+    Stream the schema, name and definition of modules, in the shape of the rows of GET_VIEW_CODE.
+    page_statement return the object id, schema, name and definition length of the next :page_size modules whose id is above :last_object_id,
+    then the definitions of a page are fetched by batches (definition_sql as in get_module_object).
+    Every round trip is short, hold at most a batch in memory and is retried on its own
+    """
 
-    return result
+    definition_statement = get_definition_statement(definition_sql=definition_sql)
 
-def get_ext_table_object(connection_str:str)->List[DatabaseObject]:
-    result:List[DatabaseObject] = list()
+    last_object_id = MIN_OBJECT_ID
 
-    engine = create_engine(connection_str)
+    while True:
 
-    ext_table_info:List[ExtTableInfo] = list()
+        module_keys = execute_with_retry(engine=engine,\
+                                         statement=page_statement,\
+                                         parameters=dict(page_parameters,last_object_id=last_object_id,page_size=fetch_options.batch_size),\
+                                         fetch_options=fetch_options)
 
-    with engine.connect() as connection:
-        result_set = connection.execute(statement=text(GET_EXTERNAL_TABLE_SQL))
+        for batch in split_module_batch(module_keys=module_keys,fetch_options=fetch_options):
 
-        for row in result_set:
-            ext_table_info.append(ExtTableInfo(
-                external_table_schema=row[0],
-                external_table_name=row[1],
-                column_name=row[2],
-                data_type=row[3],
-                data_type_length=row[4],
-                is_nullable=bool(row[5]),
-                ordinal_position=int(row[6]),
-                external_location=row[7],
-                external_data_source_name=row[8],
-                file_format_name=row[9]
-            ))
-
-    result = create_external_table_object(ext_table_info=ext_table_info)
+            definitions = {int(x[0]):x[1] for x in execute_with_retry(engine=engine,\
+                                                                      statement=definition_statement,\
+                                                                      parameters={"object_ids":[int(y[0]) for y in batch]},\
+                                                                      fetch_options=fetch_options)}
 
-    return result
+            for module_key in batch:
+                #modules dropped since their page was read are skipped
+                if int(module_key[0]) in definitions:
+                    yield (module_key[1],module_key[2],definitions[int(module_key[0])])
+
+        if len(module_keys)<fetch_options.batch_size:
+            return
+
+        last_object_id = int(module_keys[-1][0])
+
+def get_view_object(rows:Iterable[Sequence])->Iterator[DatabaseObject]:
+
+    for row in rows:
+        yield DatabaseObject(object_schema=row[0],\
+                             object_name=row[1],\
+                             object_definition=row[2],\
+                             object_type=ObjectType.VIEW)
+
+def get_procedure_object(rows:Iterable[Sequence])->Iterator[DatabaseObject]:
+
+    for row in rows:
+        yield DatabaseObject(object_schema=row[0],\
+                             object_name=row[1],\
+                             object_definition=row[2],\
+                             object_type=ObjectType.PROCEDURE)
+
+def get_function_object(rows:Iterable[Sequence])->Iterator[DatabaseObject]:
 
-def get_ext_file_format_object(connection_str)->List[DatabaseObject]:
+    for row in rows:
+        yield DatabaseObject(object_schema=row[0],\
+                             object_name=row[1],\
+                             object_definition=row[2],\
+                             object_type=ObjectType.FUNCTION)
 
-    result:List[DatabaseObject] = list()
+def get_module_state(engine:Engine,\
+                     object_filter:Optional[ObjectFilter]=None,\
+                     statement_cache:Optional[Dict[str,TextClause]]=None)->List[ModuleState]:
+    """
+    Return the id and last modification date of every view, function and procedure matching the schema and name filters
+    """
+
+    return get_object_state(engine=engine,\
+                            query_name="GET_MODULE_STATE_SQL",\
+                            object_filter=object_filter,\
+                            statement_cache=statement_cache)
+
+def get_object_state(engine:Engine,\
+                     query_name:str="GET_OBJECT_STATE_SQL",\
+                     object_filter:Optional[ObjectFilter]=None,\
+                     statement_cache:Optional[Dict[str,TextClause]]=None)->List[ModuleState]:
+    """
+    Return the id and last modification date of the objects of a state query of STATE_QUERY matching the schema and name filters
+    """
+
+    result:List[ModuleState] = list()
 
-    engine = create_engine(connection_str)
+    schema_column,name_column = CATALOG_FILTER_COLUMN[query_name]
+
+    statement,parameters = get_filtered_statement(sql=STATE_QUERY[query_name],\
+                                                  schema_column=schema_column,\
+                                                  name_column=name_column,\
+                                                  object_filter=object_filter,\
+                                                  statement_cache=statement_cache)
 
     with engine.connect() as connection:
-        result_set = connection.execute(statement=text(GET_EXTERNAL_FILE_FORMAT_SQL))
+        result_set = connection.execute(statement=statement,parameters=parameters)
 
         for row in result_set:
+            result.append(ModuleState(object_id=int(row[0]),\
+                                      object_schema=row[1],\
+                                      object_name=row[2],\
+                                      object_type=STATE_OBJECT_TYPE[row[3]],\
+                                      modify_date=row[4].isoformat(),\
+                                      definition_length=row[5]))
 
-            file_format_name = row[0]
-
-            format_type = row[1]
+    return result
 
-            field_terminator = row[2]
+def get_change_marker(engine:Engine)->Tuple:
+    """
+    Return the object count and last modification date of the database, and the count and checksum of its external data sources and file formats,
+    which change whenever an object is created, altered or dropped
+    """
 
-            string_terminator = row[3]
+    with engine.connect() as connection:
+        return tuple(connection.execute(statement=CHANGE_MARKER_STATEMENT).one())
 
-            use_type_default = bool(row[4])
+def get_module_object(engine:Engine,\
+                      module_states:List[ModuleState],\
+                      definition_sql:str=GET_MODULE_DEFINITION_SQL,\
+                      fetch_options:Optional[FetchOptions]=None)->Iterator[DatabaseObject]:
+    """
+    Fetch the definition of the given views, functions and procedures only, by batches of at most batch_size objects and batch_bytes bytes
+    (see split_module_batch, a state without definition length only counts toward batch_size).
+    definition_sql return the object id and the definition of the objects whose id is in :object_ids
+    """
 
-            first_row = row[5]
+    if fetch_options is None:
+        fetch_options = FetchOptions()
 
-            has_format_option = field_terminator is not None or\
-                (string_terminator is not None and len(string_terminator)>0) or\
-                    use_type_default
-            
-            has_previous_format_field = False
+    statement = get_definition_statement(definition_sql=definition_sql)
 
-            object_definition = f"CREATE EXTERNAL FILE FORMAT [{file_format_name}]\n"
-            object_definition += "WITH\n(\n"
-            object_definition += f"FORMAT_TYPE = {format_type}"
+    module_keys = ((x.object_id,x.object_schema,x.object_name,x.definition_length) for x in module_states)
 
+    states:Dict[int,ModuleState] = {x.object_id:x for x in module_states}
 
-            #if there is at least 1 format option
+    for batch in split_module_batch(module_keys=module_keys,fetch_options=fetch_options):
 
-            if has_format_option:
-                object_definition += ",\n"
-                object_definition += "FORMAT_OPTIONS\n(\n"
+        rows = execute_with_retry(engine=engine,\
+                                  statement=statement,\
+                                  parameters={"object_ids":[x[0] for x in batch]},\
+                                  fetch_options=fetch_options)
 
-            if field_terminator is not None:
-                object_definition+= f"FIELD_TERMINATOR =  N\'{field_terminator}\'"
+        for row in rows:
 
-                has_previous_format_field = True
-            
-            if string_terminator is not None and len(string_terminator)>0:
+            module_state = states[int(row[0])]
 
-                if has_previous_format_field:
-                    object_definition += ",\n"
+            yield DatabaseObject(object_schema=module_state.object_schema,\
+                                 object_name=module_state.object_name,\
+                                 object_definition=row[1],\
+                                 object_type=module_state.object_type)
 
-                object_definition+= f"STRING_DELIMITER = N\'{string_terminator}\'"
+def get_table_object(rows:Iterable[Sequence])->Iterator[DatabaseObject]:
 
-                has_previous_format_field = True
+    yield from iter_table_object(table_info=(TableInfo(
+        table_schema=row[0],
+        table_name=row[1],
+        column_name=row[2],
+        data_type=row[3],
+        data_type_length=row[4],
+        is_nullable=row[5],
+        ordinal_position=int(row[6])
+    ) for row in rows))
 
+def get_index_object(rows:Iterable[Sequence])->Iterator[DatabaseObject]:
 
-            if first_row is not None:
+    yield from iter_index_object(index_info=(IndexInfo(
+        index_schema=row[0],
+        table_name=row[1],
+        index_name=row[2],
+        index_column_name=row[3],
+        index_type=row[4],
+        column_position=row[5],
+        is_included_column=row[6],
+        is_descending_key=row[7]
+    ) for row in rows))
 
-                if has_previous_format_field:
-                    object_definition += ",\n"
+def get_ext_data_source_object(rows:Iterable[Sequence])->Iterator[DatabaseObject]:
 
-                object_definition+= f"FIRST_ROW = {first_row}"
+    for row in rows:
+        yield from create_external_data_source_object(ext_data_source_info=[ExtDataSourceInfo(
+            external_data_source_name=row[0],
+            external_data_source_type=row[1],
+            external_data_source_location=row[2],
+            credential_name=row[3]
+        )])
 
-                has_previous_format_field = True
+def get_ext_table_object(rows:Iterable[Sequence])->Iterator[DatabaseObject]:
 
- 
-            if use_type_default:
+    yield from iter_external_table_object(ext_table_info=(ExtTableInfo(
+        external_table_schema=row[0],
+        external_table_name=row[1],
+        column_name=row[2],
+        data_type=row[3],
+        data_type_length=row[4],
+        is_nullable=bool(row[5]),
+        ordinal_position=int(row[6]),
+        external_location=row[7],
+        external_data_source_name=row[8],
+        file_format_name=row[9]
+    ) for row in rows))
 
-                if has_previous_format_field:
-                    object_definition += ",\n"
-                    
-                object_definition+= "USE_TYPE_DEFAULT = True\n"
+def get_ext_file_format_object(rows:Iterable[Sequence])->Iterator[DatabaseObject]:
 
-            if has_format_option:
-                object_definition += ")"
+    for row in rows:
 
-            object_definition += "\n);"
+        file_format_name = row[0]
 
-            result.append(DatabaseObject(object_schema=None,\
-                                     object_name=file_format_name,\
-                                    object_definition=object_definition,\
-                                    object_type=ObjectType.EXTFILEFORMAT))
+        format_type = row[1]
 
-    return result
+        field_terminator = row[2]
 
-def create_table_object(table_info:List[TableInfo])->List[DatabaseObject]:
+        string_terminator = row[3]
 
-    table_object:List[DatabaseObject] = list()
+        use_type_default = bool(row[4])
 
-    grouped_table_info:Dict[str,List[TableInfo]] = group_by(objects=table_info,\
-                                                            group_key_func=lambda x: x.table_schema+"."+x.table_name)
+        first_row = row[5]
 
-    for object_key in grouped_table_info:
-        sorted_table_info = sorted(grouped_table_info[object_key],\
-                                   key=lambda x:x.ordinal_position)
-        
-        first_object = sorted_table_info[0]
+        has_format_option = field_terminator is not None or\
+            (string_terminator is not None and len(string_terminator)>0) or\
+                use_type_default
         
-        table_definition = f"CREATE TABLE [{first_object.table_schema}].[{first_object.table_name}]\n(\n"
+        has_previous_format_field = False
 
-        for index in range(len(sorted_table_info)):
+        object_definition = f"CREATE EXTERNAL FILE FORMAT [{file_format_name}]\n"
+        object_definition += "WITH\n(\n"
+        object_definition += f"FORMAT_TYPE = {format_type}"
 
-            x = sorted_table_info[index]
 
-            if x.data_type_length is None:
-                table_definition+=f"[{x.column_name}] {x.data_type} "
-            else:
-                if x.data_type_length=="max":
-                    table_definition+=f"[{x.column_name}] {x.data_type}(max) "
-                else:
-                    if "(" not in x.data_type_length:
-                        x.data_type_length="("+x.data_type_length+")"
+        #if there is at least 1 format option
 
-                    table_definition+=f"[{x.column_name}] {x.data_type}{x.data_type_length} "
+        if has_format_option:
+            object_definition += ",\n"
+            object_definition += "FORMAT_OPTIONS\n(\n"
 
-            if x.is_nullable=="YES":
-                table_definition+="NULL"
-            else:
-                table_definition+="NOT NULL"
+        if field_terminator is not None:
+            object_definition+= f"FIELD_TERMINATOR =  N\'{field_terminator}\'"
 
-            is_last_column = index==len(sorted_table_info)-1
+            has_previous_format_field = True
+        
+        if string_terminator is not None and len(string_terminator)>0:
 
-            if not is_last_column:
-                table_definition+=","
-            
-            table_definition+="\n"
+            if has_previous_format_field:
+                object_definition += ",\n"
 
+            object_definition+= f"STRING_DELIMITER = N\'{string_terminator}\'"
 
-        table_definition+=");"
+            has_previous_format_field = True
 
-        table_object.append(DatabaseObject(object_schema=first_object.table_schema,\
-                                           object_name=first_object.table_name,\
-                                            object_definition=table_definition,\
-                                            object_type=ObjectType.TABLE))
-        
-    return table_object
 
-def create_index_object(index_info:List[IndexInfo])->List[DatabaseObject]:
+        if first_row is not None:
 
-    index_object:List[DatabaseObject] = list()
+            if has_previous_format_field:
+                object_definition += ",\n"
 
+            object_definition+= f"FIRST_ROW = {first_row}"
 
-    grouped_index_info:Dict[str,List[IndexInfo]] = group_by(objects=index_info,\
-                                                            group_key_func=lambda x: x.index_schema+"."+x.table_name+"."+x.index_name)
-    
-    for object_key in grouped_index_info:    
+            has_previous_format_field = True
 
-        sorted_index_column = sorted([x for x in grouped_index_info[object_key] if not x.is_included_column],\
-                                     key=lambda x:x.column_position)
+ 
+        if use_type_default:
 
-        sorted_include_column = sorted([x for x in grouped_index_info[object_key] if x.is_included_column],\
-                                     key=lambda x:x.column_position) 
+            if has_previous_format_field:
+                object_definition += ",\n"
+                
+            object_definition+= "USE_TYPE_DEFAULT = True\n"
 
-        first_object = grouped_index_info[object_key][0]
+        if has_format_option:
+            object_definition += ")"
 
-        index_definition = f"CREATE {first_object.index_type} INDEX [{first_object.index_name}]\n"
-        index_definition+= f"ON [{first_object.index_schema}].[{first_object.table_name}] ("
+        object_definition += "\n);"
 
-        for index in range(len(sorted_index_column)):
+        yield DatabaseObject(object_schema=None,\
+                             object_name=file_format_name,\
+                             object_definition=object_definition,\
+                             object_type=ObjectType.EXTFILEFORMAT)
 
-            x = sorted_index_column[index]
+def iter_table_object(table_info:Iterable[TableInfo])->Iterator[DatabaseObject]:
+    """
+    Render the tables in a single pass. Columns must be ordered by table and ordinal position as GET_TABLE_SQL return them
+    """
 
-            index_definition+=f"[{x.index_column_name}] "
+    for _,columns in groupby(table_info,key=lambda x:(x.table_schema,x.table_name)):
 
-            if x.is_descending_key:
-                index_definition+="DESC"
-            else:
-                index_definition+="ASC"
+        columns = list(columns)
 
-            is_last_column = index==len(sorted_index_column)-1
+        first_object = columns[0]
 
-            if not is_last_column:
-                index_definition+=","
+        table_definition = render_table(table_schema=first_object.table_schema,\
+                                        table_name=first_object.table_name,\
+                                        columns=[render_column(column_name=x.column_name,\
+                                                               data_type=x.data_type,\
+                                                               data_type_length=x.data_type_length,\
+                                                               is_nullable=x.is_nullable=="YES") for x in columns])
 
-        index_definition+=")"
+        yield DatabaseObject(object_schema=first_object.table_schema,\
+                             object_name=first_object.table_name,\
+                             object_definition=table_definition,\
+                             object_type=ObjectType.TABLE)
 
-        has_included_column = len(sorted_include_column)>0
+def create_table_object(table_info:Iterable[TableInfo])->List[DatabaseObject]:
 
-        if has_included_column:
-            index_definition+="\nINCLUDE ("
+    return list(iter_table_object(table_info=table_info))
 
-            for index in range(len(sorted_include_column)):
+def iter_index_object(index_info:Iterable[IndexInfo])->Iterator[DatabaseObject]:
+    """
+    Render the indexes in a single pass. Columns must be ordered by table, index and column position as GET_INDEX_SQL return them
+    """
 
-                x = sorted_include_column[index]
+    for _,columns in groupby(index_info,key=lambda x:(x.index_schema,x.table_name,x.index_name)):
 
-                index_definition+=f"[{x.index_column_name}] "
+        index_columns:List[str] = list()
 
-                if x.is_descending_key:
-                    index_definition+="DESC"
-                else:
-                    index_definition+="ASC"
+        include_columns:List[str] = list()
 
-                is_last_column = index==len(sorted_index_column)-1
+        for index_column in columns:
 
-                if not is_last_column:
-                    index_definition+=","
+            column = render_index_column(column_name=index_column.index_column_name,\
+                                         is_descending_key=index_column.is_descending_key)
 
+            if index_column.is_included_column:
+                include_columns.append(column)
+            else:
+                index_columns.append(column)
 
-            index_definition+=")"
-        
-        index_definition+=";"
+        #every column of the group share the same index
+        x = index_column
+
+        index_definition = render_index(index_type=x.index_type,\
+                                        index_name=x.index_name,\
+                                        index_schema=x.index_schema,\
+                                        table_name=x.table_name,\
+                                        index_columns=index_columns,\
+                                        include_columns=include_columns)
 
+        yield DatabaseObject(object_schema=x.index_schema,\
+                             object_name=x.index_name,\
+                             object_definition=index_definition,\
+                             object_type=ObjectType.INDEX)
 
-        index_object.append(DatabaseObject(object_schema=first_object.index_schema,\
-                                           object_name=first_object.index_name,\
-                                            object_definition=index_definition,\
-                                            object_type=ObjectType.INDEX))
+def create_index_object(index_info:Iterable[IndexInfo])->List[DatabaseObject]:
 
-    return index_object
+    return list(iter_index_object(index_info=index_info))
 
 def create_external_data_source_object(ext_data_source_info:List[ExtDataSourceInfo])->List[DatabaseObject]:
     ext_data_source_object:List[DatabaseObject] = list()
@@ -416,61 +636,92 @@ def create_external_data_source_object(ext_data_source_info:List[ExtDataSourceIn
 
     return ext_data_source_object
 
-def create_external_table_object(ext_table_info:List[ExtTableInfo])->List[DatabaseObject]:
-
-    ext_table_object:List[DatabaseObject] = list()
-
-    grouped_table_info:Dict[str,List[ExtTableInfo]] = group_by(objects=ext_table_info,\
-                                                            group_key_func=lambda x: x.external_table_schema+"."+x.external_table_name)
+def iter_external_table_object(ext_table_info:Iterable[ExtTableInfo])->Iterator[DatabaseObject]:
+    """
+    Render the external tables in a single pass. Columns must be ordered by table and ordinal position as GET_EXTERNAL_TABLE_SQL return them
+    """
 
-    for object_key in grouped_table_info:
+    for _,columns in groupby(ext_table_info,key=lambda x:(x.external_table_schema,x.external_table_name)):
 
-        sorted_table_info = sorted(grouped_table_info[object_key],\
-                                   key=lambda x:x.ordinal_position)
-        
-        first_object = sorted_table_info[0]
-        
-        table_definition = f"CREATE EXTERNAL TABLE [{first_object.external_table_schema}].[{first_object.external_table_name}]\n(\n"
+        columns = list(columns)
 
-        for index in range(len(sorted_table_info)):
+        first_object = columns[0]
 
-            x = sorted_table_info[index]
+        table_definition = render_external_table(table_schema=first_object.external_table_schema,\
+                                                 table_name=first_object.external_table_name,\
+                                                 columns=[render_column(column_name=x.column_name,\
+                                                                        data_type=x.data_type,\
+                                                                        data_type_length=x.data_type_length,\
+                                                                        is_nullable=x.is_nullable) for x in columns],\
+                                                 external_location=first_object.external_location,\
+                                                 external_data_source_name=first_object.external_data_source_name,\
+                                                 file_format_name=first_object.file_format_name)
 
-            if x.data_type_length is None:
-                table_definition+=f"[{x.column_name}] {x.data_type} "
-            else:
-                if x.data_type_length=="max":
-                    table_definition+=f"[{x.column_name}] {x.data_type}(max) "
-                else:
-                    if "(" not in x.data_type_length:
-                        x.data_type_length="("+x.data_type_length+")"
+        yield DatabaseObject(object_schema=first_object.external_table_schema,\
+                             object_name=first_object.external_table_name,\
+                             object_definition=table_definition,\
+                             object_type=ObjectType.EXTTABLE)
 
-                    table_definition+=f"[{x.column_name}] {x.data_type}{x.data_type_length} "
+def create_external_table_object(ext_table_info:Iterable[ExtTableInfo])->List[DatabaseObject]:
 
-            if x.is_nullable:
-                table_definition+="NULL"
-            else:
-                table_definition+="NOT NULL"
+    return list(iter_external_table_object(ext_table_info=ext_table_info))
 
-            is_last_column = index==len(sorted_table_info)-1
+def iter_server_rendered_table_object(rows:Iterable[Sequence])->Iterator[DatabaseObject]:
+    """
+    Render the tables from the rows of GET_TABLE_DDL_SQL whose column list is already assembled by the server
+    """
 
-            if not is_last_column:
-                table_definition+=","
-            
-            table_definition+="\n"
+    for row in rows:
+        yield DatabaseObject(object_schema=row[0],\
+                             object_name=row[1],\
+                             object_definition=render_table(table_schema=row[0],\
+                                                            table_name=row[1],\
+                                                            columns=[row[2]]),\
+                             object_type=ObjectType.TABLE)
 
+def iter_server_rendered_ext_table_object(rows:Iterable[Sequence])->Iterator[DatabaseObject]:
+    """
+    Render the external tables from the rows of GET_EXTERNAL_TABLE_DDL_SQL whose column list is already assembled by the server
+    """
 
-        table_definition+=")\n"
-        table_definition+="WITH\n"
-        table_definition+="(\n"
-        table_definition+=f"LOCATION = N\'{first_object.external_location}\',\n"
-        table_definition+=f"DATA_SOURCE = {first_object.external_data_source_name},\n"
-        table_definition+=f"FILE_FORMAT = N\'{first_object.file_format_name}\'\n"
-        table_definition+=");"
+    for row in rows:
+        yield DatabaseObject(object_schema=row[0],\
+                             object_name=row[1],\
+                             object_definition=render_external_table(table_schema=row[0],\
+                                                                     table_name=row[1],\
+                                                                     columns=[row[2]],\
+                                                                     external_location=row[3],\
+                                                                     external_data_source_name=row[4],\
+                                                                     file_format_name=row[5]),\
+                             object_type=ObjectType.EXTTABLE)
+
+def iter_server_rendered_index_object(rows:Iterable[Sequence])->Iterator[DatabaseObject]:
+    """
+    Render the indexes from the rows of GET_INDEX_DDL_SQL whose index and include column lists are already assembled by the server
+    """
 
-        ext_table_object.append(DatabaseObject(object_schema=first_object.external_table_schema,\
-                                           object_name=first_object.external_table_name,\
-                                            object_definition=table_definition,\
-                                            object_type=ObjectType.EXTTABLE))
-        
-    return ext_table_object
\ No newline at end of file
+    for row in rows:
+        yield DatabaseObject(object_schema=row[0],\
+                             object_name=row[2],\
+                             object_definition=render_index(index_type=row[3],\
+                                                            index_name=row[2],\
+                                                            index_schema=row[0],\
+                                                            table_name=row[1],\
+                                                            index_columns=[] if row[4] is None else [row[4]],\
+                                                            include_columns=[] if row[5] is None else [row[5]]),\
+                             object_type=ObjectType.INDEX)
+
+#turn the rows of each catalog query into database objects
+CATALOG_OBJECT_FUNC:Dict[str,Callable[[Iterable[Sequence]],Iterator[DatabaseObject]]] = {
+    "GET_TABLE_SQL":get_table_object,
+    "GET_VIEW_CODE":get_view_object,
+    "GET_FUNCTION_SQL":get_function_object,
+    "GET_PROCEDURE_SQL":get_procedure_object,
+    "GET_INDEX_SQL":get_index_object,
+    "GET_EXTERNAL_DATA_SOURCE_SQL":get_ext_data_source_object,
+    "GET_EXTERNAL_TABLE_SQL":get_ext_table_object,
+    "GET_EXTERNAL_FILE_FORMAT_SQL":get_ext_file_format_object,
+    "GET_TABLE_DDL_SQL":iter_server_rendered_table_object,
+    "GET_INDEX_DDL_SQL":iter_server_rendered_index_object,
+    "GET_EXTERNAL_TABLE_DDL_SQL":iter_server_rendered_ext_table_object
+}
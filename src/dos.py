@@ -1,22 +1,111 @@
+import os
 import sys
-from typing import Optional,List
-from model import ConnectionInfo,DatabaseObject,ObjectType
-from database import get_connection_string,test_connection,get_table_object
-from database import get_view_object,get_function_object,get_procedure_object,get_index_object,get_ext_data_source_object
-from database import get_ext_table_object,get_ext_file_format_object
-from config import REMOTE_DIR
+import subprocess
+from typing import Optional,List,Dict,Tuple,Callable,TextIO,Iterator,Iterable,Sequence
+import threading
+import time
+from datetime import datetime,timezone
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from model import DatabaseObject,ObjectType,ModuleState,WriteOptions,ExtractOptions,CategoryMetrics,RunMetrics
+from model import ObjectFilter,FetchOptions,QueueStats
+from pipeline import StageQueue,END_OF_QUEUE,fetch_stage,render_stage,write_stage
+from objectfilter import is_filtered,is_type_match,is_object_file_match
+from database import CATALOG_OBJECT_FUNC,get_connection_string,create_database_engine
+from model import FleetEntry
+from config import ROW_QUEUE_DEPTH,OBJECT_QUEUE_DEPTH,GIT_BRANCH,MODULE_BATCH_SIZE,MODULE_BATCH_BYTES,FETCH_RETRY_COUNT,REMOTE_DIR,REPORT_FILE,FLEET_MAX_PARALLEL,FLEET_MAX_PER_HOST,MODULE_STATE_FILE,WRITE_JOBS,WRITE_QUEUE_DEPTH,WATCH_INTERVAL,CACHE_TTL,APPLY_BATCH_SIZE,GIT_RUN_DIR
+from fleet import read_fleet_manifest,run_fleet,print_fleet_summary
+from incremental import load_module_state,save_module_state,diff_module_state,is_module_match
+from provider import CatalogProvider,SnapshotCatalogProvider,CaptureCatalogProvider,CachedCatalogProvider
+from snapshot import SnapshotWriter
+from writer import DatabaseObjectWriter,parse_database_object_file
+from pack import PackReader,PackWriter,extract_pack_object,export_pack
+from gitimport import GitImportWriter
+from compare import ObjectSource,diff_content_hash,get_unified_diff
+from inventory import list_object
+from extractor import Extractor,EXTRACT_CATEGORIES,SERVER_RENDER_QUERY,get_connection_info,create_provider
+from watch import watch_remote,get_watched_state
+from apply import apply_object
+from func import get_peak_memory
+from metrics import save_run_report,save_prometheus_textfile
 from pathlib import Path
 import sys
 
+#object types extracted from sys.sql_modules which incremental extraction only fetch when modified
+MODULE_OBJECT_TYPES = {ObjectType.VIEW,ObjectType.FUNCTION,ObjectType.PROCEDURE}
+
+#options which does not take a value
+FLAG_OPTIONS = {"--incremental","--fsync","--server-render","--pack","--name-only","--dry-run"}
+
 def help_command():
-    print("Usage: python dos.py <remote> <database_uri>")
+    print("Usage: python dos.py <remote> <database_uri> [options]")
+    print("       python dos.py fleet <manifest> [options]")
+    print("       python dos.py replay <remote> <snapshot> [options]")
+    print("       python dos.py pack list|cat|extract|export <remote> [arguments]")
+    print("       python dos.py diff <remote> <remote> [--name-only] [filters]")
+    print("       python dos.py list <database_uri> [filters]")
+    print("       python dos.py watch <remote> <database_uri> [--interval N] [options]")
+    print("       python dos.py apply <remote> <database_uri> [--jobs N] [--apply-batch N] [filters]")
+    print("       python dos.py apply <remote> [<database_uri>] --dry-run [filters]")
     print()
     print("Arguments:")
     print("  <remote>        : An identifier for the remote database")
     print("  <database_uri>  : The URI used to connect to the database, in the format 'user:password@host/databaseName'")
+    print("                    or 'sqlite:///<path>' for a synthetic catalog generated by fake.py")
+    print("  <manifest>      : A file with one '<remote> <database_uri>' entry per line ('-' to read from stdin)")
+    print("  <snapshot>      : A catalog snapshot saved with --capture, rendered again without connecting to the database")
+    print("  pack list <remote>              : List the objects of the pack of a remote")
+    print("  pack cat <remote> <object>      : Print an object of the pack, e.g. table/dbo.customer.sql")
+    print("  pack extract <remote> <pattern> <dir>: Write the objects matching the pattern (* and ? wildcards) into <dir>")
+    print("  pack export <remote>            : Write every object of the pack as files under the remote folder")
+    print("  diff <remote> <remote>          : Compare the objects extracted for two remotes (or two remote folders) by content hash,")
+    print("                                    with the unified diff of the changed ones. Exit code 1 when they differ")
+    print("  list <database_uri>             : Print the type, name and last modification of the views, functions and procedures")
+    print("                                    without fetching their definitions")
+    print("  watch <remote> <database_uri>   : Extract the remote, then poll the database and write the objects created, altered or dropped")
+    print("                                    since the previous poll until interrupted")
+    print("  apply <remote> <database_uri>   : Create the objects extracted for a remote (or a remote folder) in a database,")
+    print("                                    by waves of objects whose dependencies were created by the previous waves")
+    print()
+    print("Options:")
+    print("  --jobs <N>      : Number of object categories extracted concurrently, each using its own connection (default 1)")
+    print(f"  --parallel <N>  : fleet only. Number of remotes extracted concurrently (default {FLEET_MAX_PARALLEL})")
+    print(f"  --per-host <N>  : fleet only. Number of remotes extracted concurrently from the same host (default {FLEET_MAX_PER_HOST})")
+    print("  --incremental   : Only fetch the views, functions and procedures modified since the last incremental run")
+    print(f"  --write-jobs <N>: Number of threads writing object files (default {WRITE_JOBS})")
+    print(f"  --write-queue <N>: Number of objects waiting to be written before extraction is paused (default {WRITE_QUEUE_DEPTH})")
+    print("  --fsync         : Flush the written files to disk in one batch at the end of the run")
+    print("  --server-render : Assemble the column lists of tables and indexes on the server (STRING_AGG) to transfer one row per object")
+    print("  --prometheus <dir>: Also save the metrics of the run as a Prometheus textfile <dir>/dos_<remote>.prom")
+    print("  --include-schema <s1,s2>: Only extract the objects of these schemas")
+    print("  --exclude-schema <s1,s2>: Do not extract the objects of these schemas")
+    print("  --name <pattern>: Only extract the objects whose name match the pattern (* and ? wildcards)")
+    print("  --types <t1,t2> : Only extract these object types: "+",".join(x.value for x in ObjectType))
+    print(f"  --module-batch <N>: Number of view, function and procedure definitions fetched per round trip (default and maximum {MODULE_BATCH_SIZE})")
+    print(f"  --module-batch-bytes <N>: Maximum size of the definitions fetched per round trip (default {MODULE_BATCH_BYTES})")
+    print(f"  --retries <N>   : Number of times a failed batch of definitions is fetched again (default {FETCH_RETRY_COUNT})")
+    print("  --capture <file>: Also save the raw rows of the catalog queries into a snapshot file (not with --incremental)")
+    print("  --pack          : Write all the objects into a single indexed pack file instead of one file per object")
+    print("  --git <repo>    : Commit the objects into a git repository (created bare if missing) with git fast-import instead of writing files")
+    print(f"  --git-branch <name>: Branch of the git output (default {GIT_BRANCH})")
+    print("  --cache <dir>   : Read the catalog query results from a local cache when the database did not change since they were saved")
+    print(f"  --cache-ttl <N> : Seconds a cached query result is used (default {CACHE_TTL})")
+    print("  --name-only     : diff only. List the added, removed and changed objects without their unified diff")
+    print(f"  --interval <N>  : watch only. Seconds between two polls of the database (default {WATCH_INTERVAL})")
+    print(f"  --apply-batch <N>: apply only. Number of objects created per round trip and transaction (default {APPLY_BATCH_SIZE})")
+    print("  --dry-run       : apply only. Print the waves without connecting to the database, whose uri can be omitted")
     print()
     print("Example:")
     print("  python dos.py my_remote_db user:password@host/mydatabase")
+    print("  python dos.py my_remote_db user:password@host/mydatabase --jobs 4")
+    print("  python dos.py fleet databases.txt --parallel 16 --per-host 4")
+    print("  python dos.py my_remote_db user:password@host/mydatabase --capture mydatabase.snapshot")
+    print("  python dos.py replay my_remote_db mydatabase.snapshot")
+    print("  python dos.py pack cat my_remote_db view/dbo.sales.sql")
+    print("  python dos.py diff dev_db prod_db --types view,procedure")
+    print("  python dos.py list user:password@host/mydatabase --include-schema sales")
+    print("  python dos.py watch my_remote_db user:password@host/mydatabase --interval 30")
+    print("  python dos.py apply my_remote_db user:password@host/mytestdatabase --jobs 8")
     print()
     print("Explanation:")
     print("  - The '<remote>' argument is used to label and organize the output files in a directory named after this identifier")
@@ -26,202 +115,915 @@ def help_command():
     print("    - 'host' is the address of the database server")
     print("    - 'databaseName' is the name of the specific database to connect to")
 
-def get_connection_info(database_uri:str)->Optional[ConnectionInfo]:
+def parse_argument(argv:List[str])->Optional[Tuple[List[str],Dict[str,str]]]:
     """
-    Return host,database,user,password
+    Split the arguments into positional arguments and '--name value' options.
+    Flag options are stored with an empty value.
+    Return None when an option is missing its value
     """
 
-    host_separator = database_uri.rfind("@")
+    arguments:List[str] = list()
 
-    if host_separator<=0:
-        return None
-    
-    host_block = database_uri[host_separator+1:]
+    options:Dict[str,str] = dict()
 
-    database_separator = host_block.rfind("/")
+    index = 0
 
-    if database_separator<=0:
-        return None
+    while index<len(argv):
 
-    host = host_block[:database_separator]
+        if argv[index] in FLAG_OPTIONS:
 
-    database = host_block[database_separator+1:]
+            options[argv[index]] = ""
 
-    credential_block = database_uri[:host_separator]
+            index+=1
 
+        elif argv[index].startswith("--"):
 
-    user_separator = credential_block.rfind(":")
+            if index+1>=len(argv):
+                return None
 
-    if user_separator<=0:
-        return None
-    
-    #print(credential_block)
+            options[argv[index]] = argv[index+1]
 
-    user = credential_block[:user_separator]
+            index+=2
+        else:
+            arguments.append(argv[index])
 
-    password = credential_block[user_separator+1:]
+            index+=1
 
-    return ConnectionInfo(host=host,\
-                          database=database,\
-                          user=user,\
-                          password=password)
+    return (arguments,options)
 
+def extract_database_object(jobs:int,\
+                            consume_func:Callable[[DatabaseObject],None],\
+                            extract_categories:List[Tuple[str,Optional[ObjectType],Callable[[],Iterable[Sequence]],Optional[Callable[[Iterable[Sequence]],Iterator[DatabaseObject]]]]],\
+                            output:TextIO=sys.stdout,\
+                            category_metrics:Optional[List[CategoryMetrics]]=None,\
+                            queue_stats:Optional[List[QueueStats]]=None)->bool:
+    """
+    Stream the objects of the categories into consume_func through the stages of pipeline.py.
+    A category is made of a function returning its rows and the function rendering them (None when the rows are already objects).
+    At most `jobs` categories are fetched and rendered concurrently, and their objects are consumed by a single write stage.
+    Progress is reported in category order regardless of completion order.
+    The metrics of every category are recorded into category_metrics (same order as the categories) if given,
+    and the stats of the queues into queue_stats.
+    Return False when a category fail
+    """
 
-    
-def main(argv)->int:
+    if category_metrics is None:
+        category_metrics = [CategoryMetrics(category=x[0]) for x in extract_categories]
 
-    if len(argv)==2:
-        remote_name = argv[0]
+    if queue_stats is None:
+        queue_stats = list()
 
-        database_uri = argv[1]
+    #a failed category stop the fetch and render stages, the objects already rendered are still written
+    stage_stop_event = threading.Event()
 
-        connection_info = get_connection_info(database_uri=database_uri)
+    row_queues = [StageQueue(name=f"{x[0]} rows",capacity=ROW_QUEUE_DEPTH,stop_event=stage_stop_event) for x in extract_categories]
 
-        if connection_info is None:
-            help_command()
-            return 1
-        
-        connection_str = get_connection_string(host=connection_info.host,\
-                                               database_name=connection_info.database,\
-                                               user=connection_info.user,\
-                                               password=connection_info.password)
+    object_queue = StageQueue(name="objects",capacity=OBJECT_QUEUE_DEPTH,stop_event=threading.Event())
 
+    queue_stats.extend([x.stats for x in row_queues]+[object_queue.stats])
 
-        print("testing connection:",end="")
-        
-        if test_connection(connection_str=connection_str):
-            print("success")
-        else:
-            print("fail")
-            return 1
-        
-        database_objects:List[DatabaseObject] = list()
+    is_success = True
 
-        print("extracting tables:",end="")
+    with ThreadPoolExecutor(max_workers=jobs) as fetch_executor,\
+         ThreadPoolExecutor(max_workers=jobs) as render_executor,\
+         ThreadPoolExecutor(max_workers=1) as write_executor:
 
-        try:
-            database_objects.extend(get_table_object(connection_str=connection_str))
-            print("success")
-        except:
-            print("fail")
-            return 1
-        
+        write_future = write_executor.submit(write_stage,consume_func,object_queue)
 
-        print("extracting views:",end="")
+        fetch_futures = [fetch_executor.submit(fetch_stage,fetch_func,row_queue,metrics)\
+                         for (_,_,fetch_func,_),row_queue,metrics in zip(extract_categories,row_queues,category_metrics)]
 
-        try:
-            database_objects.extend(get_view_object(connection_str=connection_str))
-            print("success")
-        except:
-            print("fail")
-            return 1
-        
-        print("extracting functions:",end="")
+        render_futures = [render_executor.submit(render_stage,render_func,row_queue,object_queue,metrics)\
+                          for (_,_,_,render_func),row_queue,metrics in zip(extract_categories,row_queues,category_metrics)]
 
-        try:
-            database_objects.extend(get_function_object(connection_str=connection_str))
-            print("success")
-        except:
-            print("fail")
-            return 1
-        
-        print("extracting procedures:",end="")
+        for (category,_,_,_),fetch_future,render_future in zip(extract_categories,fetch_futures,render_futures):
 
-        try:
-            database_objects.extend(get_procedure_object(connection_str=connection_str))
-            print("success")
-        except:
-            print("fail")
-            return 1
+            print(f"extracting {category}:",end="",file=output)
+
+            try:
+                render_future.result()
+                fetch_future.result()
+                print("success",file=output)
+            except:
+                print("fail",file=output)
+
+                stage_stop_event.set()
 
-        print("extracting indexes:",end="")
+                for pending_future in fetch_futures+render_futures:
+                    pending_future.cancel()
+
+                is_success = False
+
+                break
+
+        render_executor.shutdown(wait=True)
 
         try:
-            database_objects.extend(get_index_object(connection_str=connection_str))
-            print("success")
+            object_queue.put(END_OF_QUEUE)
+            write_future.result()
         except:
-            print("fail")
-            return 1
-        
-        print("extracting external data source:",end="")
+            if is_success:
+                print("writing objects:fail",file=output)
+
+            is_success = False
+
+    return is_success
+
+def extract_remote(remote_name:str,\
+                   provider:CatalogProvider,\
+                   extract_options:ExtractOptions,\
+                   output:TextIO=sys.stdout,\
+                   close_provider:bool=True)->int:
+    """
+    Extract the database objects of a single remote into REMOTE_DIR/<remote>.
+    Objects are written while they are extracted.
+    With incremental, only the views, functions and procedures modified since the last incremental run are fetched
+    and the files of the dropped ones are deleted.
+    With server_render, the column lists of tables and indexes are assembled by the server.
+    The provider is closed once the objects are extracted, unless close_provider is False (the caller keeps using it).
+    The metrics of the run are saved to REPORT_FILE in the run folder of the remote and to the Prometheus textfile directory if any.
+    Return the exit code
+    """
+
+    run_metrics = RunMetrics(remote_name=remote_name,\
+                             started_at=datetime.now(timezone.utc).isoformat(timespec="seconds"))
+
+    start_time = time.perf_counter()
+
+    try:
+        exit_code = run_extraction(remote_name=remote_name,\
+                                   provider=provider,\
+                                   extract_options=extract_options,\
+                                   run_metrics=run_metrics,\
+                                   output=output)
+    finally:
+        if close_provider:
+            provider.close()
+
+    run_metrics.is_success = exit_code==0
+    run_metrics.duration = time.perf_counter()-start_time
+    run_metrics.peak_memory = get_peak_memory()
+
+    try:
+        save_run_report(report_path=get_run_dir(remote_name=remote_name,extract_options=extract_options)/REPORT_FILE,run_metrics=run_metrics)
+
+        if extract_options.prometheus_dir is not None:
+            save_prometheus_textfile(prometheus_dir=extract_options.prometheus_dir,run_metrics=run_metrics)
+    except OSError:
+        print("cannot save run report",file=output)
+
+    return exit_code
+
+def get_run_dir(remote_name:str,extract_options:ExtractOptions)->Path:
+    """
+    Return the folder of the report and module state of a remote: its remote folder,
+    or with the git output a folder of the repository, so REMOTE_DIR holds no remote without objects
+    """
+
+    if extract_options.git_dir is not None:
+        return Path(extract_options.git_dir)/GIT_RUN_DIR/remote_name
+
+    return Path(REMOTE_DIR)/remote_name
+
+def create_object_writer(remote_name:str,extract_options:ExtractOptions):
+    """
+    Return the consumer of the extracted objects: files, pack or git commit
+    """
+
+    if extract_options.git_dir is not None:
+        return GitImportWriter(git_dir=extract_options.git_dir,\
+                               remote_name=remote_name,\
+                               branch=extract_options.git_branch,\
+                               write_options=extract_options.write_options)
+
+    writer_class = PackWriter if extract_options.pack else DatabaseObjectWriter
+
+    return writer_class(root_dir=REMOTE_DIR,\
+                        remote_name=remote_name,\
+                        write_options=extract_options.write_options)
+
+def run_extraction(remote_name:str,\
+                   provider:CatalogProvider,\
+                   extract_options:ExtractOptions,\
+                   run_metrics:RunMetrics,\
+                   output:TextIO)->int:
+
+    state_path = get_run_dir(remote_name=remote_name,extract_options=extract_options)/MODULE_STATE_FILE
+
+    print("testing connection:",end="",file=output)
+
+    connect_start_time = time.perf_counter()
+
+    is_connected = provider.test_connection()
+
+    run_metrics.connect_duration = time.perf_counter()-connect_start_time
+    
+    if is_connected:
+        print("success",file=output)
+    else:
+        print("fail",file=output)
+        return 1
+
+    dos_path = Path(REMOTE_DIR)
+
+    if extract_options.git_dir is None and not dos_path.exists():
+        print(f"No {dos_path} folder is found.create {dos_path} folder",file=output)
+        dos_path.mkdir(exist_ok=True)
+
+    try:
+        database_object_writer = create_object_writer(remote_name=remote_name,extract_options=extract_options)
+    except (OSError,ValueError,subprocess.SubprocessError):
+        print(f"cannot open the output of {remote_name}",file=output)
+        return 1
+
+    object_filter = extract_options.object_filter
+
+    #categories which were not requested are not queried at all
+    extract_categories = [x for x in EXTRACT_CATEGORIES if is_type_match(object_filter=object_filter,object_type=x[1])]
+
+    if extract_options.server_render:
+        extract_categories = [(category,object_type,SERVER_RENDER_QUERY.get(object_type,query_name))\
+                              for category,object_type,query_name in extract_categories]
+
+    run_metrics.categories = [CategoryMetrics(category=x[0]) for x in extract_categories]
+
+    extract_categories = [(category,\
+                           object_type,\
+                           partial(provider.fetch_rows,query_name=query_name,object_filter=object_filter),\
+                           CATALOG_OBJECT_FUNC[query_name])\
+                          for category,object_type,query_name in extract_categories]
+
+    module_states:List[ModuleState] = list()
+
+    is_module_requested = any(is_type_match(object_filter=object_filter,object_type=x) for x in MODULE_OBJECT_TYPES)
+
+    if extract_options.incremental and is_module_requested:
+
+        print("checking modified modules:",end="",file=output)
 
         try:
-            database_objects.extend(get_ext_data_source_object(connection_str=connection_str))
-            print("success")
+            module_states = [x for x in provider.get_module_state(object_filter=object_filter)\
+                             if is_type_match(object_filter=object_filter,object_type=x.object_type)]
+
+            previous_states = load_module_state(state_path=state_path)
+
+            out_of_scope_states:List[ModuleState] = list()
+
+            #modules out of the filters are neither extracted nor dropped, their state is carried over
+            if previous_states is not None:
+
+                current_object_ids = {x.object_id for x in module_states}
+
+                out_of_scope_states = [x for x in previous_states if not is_module_match(object_filter=object_filter,module_state=x)\
+                                       and x.object_id not in current_object_ids]
+
+                previous_states = [x for x in previous_states if is_module_match(object_filter=object_filter,module_state=x)]
+
+            changed_states,dropped_states = diff_module_state(previous_states=previous_states,\
+                                                              current_states=module_states)
+
+            module_states = module_states+out_of_scope_states
+
+            print(f"success ({len(changed_states)} modified,{len(dropped_states)} dropped)",file=output)
         except:
-            print("fail")
+            print("fail",file=output)
             return 1
-        
-        print("extracting external table:",end="")
 
-        try:
-            database_objects.extend(get_ext_table_object(connection_str=connection_str))
-            print("success")
-        except:
-            print("fail")
+        #delete before writing as a module can be dropped and re-created under the same name
+        for module_state in dropped_states:
+            database_object_writer.delete(object_schema=module_state.object_schema,\
+                                          object_name=module_state.object_name,\
+                                          object_type=module_state.object_type)
+
+        changed_object_ids = {x.object_id for x in changed_states}
+
+        for module_state in module_states:
+            if module_state.object_id not in changed_object_ids:
+                database_object_writer.keep(object_schema=module_state.object_schema,\
+                                            object_name=module_state.object_name,\
+                                            object_type=module_state.object_type)
+
+        run_metrics.categories = [y for x,y in zip(extract_categories,run_metrics.categories) if x[1] not in MODULE_OBJECT_TYPES]+\
+            [CategoryMetrics(category="modified modules")]
+
+        extract_categories = [x for x in extract_categories if x[1] not in MODULE_OBJECT_TYPES]+\
+            [("modified modules",None,partial(provider.get_module_object,module_states=changed_states),None)]
+
+    is_success = extract_database_object(jobs=extract_options.jobs,\
+                                         consume_func=database_object_writer.write,\
+                                         extract_categories=extract_categories,\
+                                         output=output,\
+                                         category_metrics=run_metrics.categories,\
+                                         queue_stats=run_metrics.queues)
+
+    connection_count = provider.get_connection_count()
+
+    run_metrics.connection_count = connection_count
+
+    if connection_count is not None:
+        print(f"opened connections:{connection_count}",file=output)
+
+    if isinstance(provider,CachedCatalogProvider):
+
+        run_metrics.cached_query_count = provider.hit_count
+
+        print(f"cached queries:{provider.hit_count}",file=output)
+
+    print("saving database objects:",end="",file=output)
+
+    run_metrics.write_stats = database_object_writer.stats
+
+    try:
+        #stale files are only known when every category was completely extracted,
+        #and only for the objects matching the filters
+        database_object_writer.close(delete_stale=is_success,\
+                                     is_in_scope=partial(is_object_file_match,object_filter) if is_filtered(object_filter=object_filter) else None)
+
+        if is_success and extract_options.incremental and is_module_requested:
+            save_module_state(state_path=state_path,module_states=module_states)
+    except:
+        print("fail",file=output)
+        return 1
+
+    if not is_success:
+        print("fail",file=output)
+        return 1
+
+    write_stats = database_object_writer.stats
+
+    file_count = write_stats.written_count+write_stats.unchanged_count
+
+    print(f"success ({write_stats.written_count} written,"+\
+          f"{write_stats.unchanged_count} unchanged,"+\
+          f"{write_stats.deleted_count} deleted,"+\
+          f"{file_count/max(write_stats.duration,1e-6):.0f} files/s)",file=output)
+
+    return 0
+
+def print_peak_memory():
+
+    peak_memory = get_peak_memory()
+
+    if peak_memory is not None:
+        print(f"peak memory:{peak_memory/(1024*1024):.1f} MB")
+
+def get_positive_option(options:Dict[str,str],name:str,default:int)->Optional[int]:
+    """
+    Return the value of a positive integer option or None when it is invalid
+    """
+
+    value = options.get(name,str(default))
+
+    if not value.isdigit() or int(value)<1:
+        return None
+
+    return int(value)
+
+def get_list_option(options:Dict[str,str],name:str)->List[str]:
+    """
+    Return the comma separated values of an option
+    """
+
+    return [x.strip() for x in options.get(name,"").split(",") if len(x.strip())>0]
+
+def get_object_filter(options:Dict[str,str])->Optional[ObjectFilter]:
+    """
+    Return the object filter or None when an object type is unknown
+    """
+
+    object_type_names = get_list_option(options=options,name="--types")
+
+    if any(x not in {y.value for y in ObjectType} for x in object_type_names):
+        return None
+
+    return ObjectFilter(include_schemas=get_list_option(options=options,name="--include-schema"),\
+                        exclude_schemas=get_list_option(options=options,name="--exclude-schema"),\
+                        name_pattern=options.get("--name"),\
+                        object_types=[ObjectType(x) for x in object_type_names])
+
+def get_extract_options(options:Dict[str,str])->Optional[ExtractOptions]:
+    """
+    Return the extraction options or None when one of them is invalid
+    """
+
+    jobs = get_positive_option(options=options,name="--jobs",default=1)
+
+    write_jobs = get_positive_option(options=options,name="--write-jobs",default=WRITE_JOBS)
+
+    queue_depth = get_positive_option(options=options,name="--write-queue",default=WRITE_QUEUE_DEPTH)
+
+    cache_ttl = get_positive_option(options=options,name="--cache-ttl",default=CACHE_TTL)
+
+    object_filter = get_object_filter(options=options)
+
+    #sql server accept at most 2100 parameters, so the object ids of a batch are capped
+    module_batch = get_positive_option(options=options,name="--module-batch",default=MODULE_BATCH_SIZE)
+
+    module_batch_bytes = get_positive_option(options=options,name="--module-batch-bytes",default=MODULE_BATCH_BYTES)
+
+    retries = options.get("--retries",str(FETCH_RETRY_COUNT))
+
+    if jobs is None or write_jobs is None or queue_depth is None or cache_ttl is None or object_filter is None:
+        return None
+
+    if module_batch is None or module_batch>MODULE_BATCH_SIZE or module_batch_bytes is None or not retries.isdigit():
+        return None
+
+    #a single output is written
+    if "--pack" in options and "--git" in options:
+        return None
+
+    return ExtractOptions(jobs=jobs,\
+                          incremental="--incremental" in options,\
+                          server_render="--server-render" in options,\
+                          prometheus_dir=options.get("--prometheus"),\
+                          pack="--pack" in options,\
+                          git_dir=options.get("--git"),\
+                          git_branch=options.get("--git-branch",GIT_BRANCH),\
+                          cache_dir=options.get("--cache"),\
+                          cache_ttl=cache_ttl,\
+                          object_filter=object_filter,\
+                          fetch_options=FetchOptions(batch_size=module_batch,\
+                                                     batch_bytes=module_batch_bytes,\
+                                                     retry_count=int(retries)),\
+                          write_options=WriteOptions(write_jobs=write_jobs,\
+                                                     queue_depth=queue_depth,\
+                                                     fsync="--fsync" in options))
+
+def fleet_command(manifest_path:str,options:Dict[str,str])->int:
+
+    max_parallel = get_positive_option(options=options,name="--parallel",default=FLEET_MAX_PARALLEL)
+
+    max_per_host = get_positive_option(options=options,name="--per-host",default=FLEET_MAX_PER_HOST)
+
+    extract_options = get_extract_options(options=options)
+
+    if max_parallel is None or max_per_host is None or extract_options is None:
+        help_command()
+        return 1
+
+    try:
+        if manifest_path=="-":
+            fleet_entries = read_fleet_manifest(lines=sys.stdin)
+        else:
+            with open(manifest_path,"r") as file:
+                fleet_entries = read_fleet_manifest(lines=file)
+    except OSError:
+        print(f"cannot read fleet manifest {manifest_path}")
+        return 1
+
+    if fleet_entries is None:
+        print(f"invalid fleet manifest {manifest_path}")
+        return 1
+
+    def extract_fleet_entry(fleet_entry:FleetEntry,output:TextIO)->int:
+
+        provider = create_provider(database_uri=fleet_entry.database_uri,extract_options=extract_options)
+
+        if provider is None:
+            print("invalid database uri",file=output)
             return 1
-        
-        print("extracting external file format:",end="")
+
+        return extract_remote(remote_name=fleet_entry.remote_name,\
+                              provider=provider,\
+                              extract_options=extract_options,\
+                              output=output)
+
+    def get_fleet_entry_host(fleet_entry:FleetEntry)->str:
+
+        connection_info = get_connection_info(database_uri=fleet_entry.database_uri)
+
+        if connection_info is None:
+            return ""
+
+        return connection_info.host
+
+    fleet_results = run_fleet(fleet_entries=fleet_entries,\
+                              extract_func=extract_fleet_entry,\
+                              host_func=get_fleet_entry_host,\
+                              max_parallel=max_parallel,\
+                              max_per_host=max_per_host)
+
+    print_fleet_summary(fleet_results=fleet_results)
+
+    print_peak_memory()
+
+    if any(not x.is_success for x in fleet_results):
+        return 1
+
+    return 0
+    
+def replay_command(remote_name:str,snapshot_path:str,options:Dict[str,str])->int:
+    """
+    Render and write the objects of a snapshot without connecting to the database
+    """
+
+    extract_options = get_extract_options(options=options)
+
+    if extract_options is None or extract_options.incremental:
+        help_command()
+        return 1
+
+    try:
+        provider = SnapshotCatalogProvider(snapshot_path=snapshot_path)
+    except (OSError,ValueError):
+        print(f"cannot read snapshot {snapshot_path}")
+        return 1
+
+    #render the categories the way they were captured
+    extract_options.server_render = all(provider.has_query(query_name=x) for x in SERVER_RENDER_QUERY.values())
+
+    exit_code = extract_remote(remote_name=remote_name,\
+                               provider=provider,\
+                               extract_options=extract_options)
+
+    print_peak_memory()
+
+    return exit_code
+
+def pack_command(command:str,remote_name:str,arguments:List[str],options:Dict[str,str])->int:
+    """
+    Read the pack of a remote: list its objects, print one, extract the matching ones or export all of them as files
+    """
+
+    extract_options = get_extract_options(options=options)
+
+    expected_argument_count = {"list":0,"cat":1,"extract":2,"export":0}
+
+    if extract_options is None or expected_argument_count.get(command)!=len(arguments):
+        help_command()
+        return 1
+
+    try:
+        pack_reader = PackReader.open(remote_dir=Path(REMOTE_DIR)/remote_name)
+    except (OSError,ValueError):
+        pack_reader = None
+
+    if pack_reader is None:
+        print(f"cannot read the pack of {remote_name}")
+        return 1
+
+    try:
+        if command=="list":
+            for key in pack_reader.iter_key():
+                print(key)
+
+        elif command=="cat":
+            definition = pack_reader.get_definition(key=arguments[0])
+
+            if definition is None:
+                print(f"{arguments[0]} is not in the pack of {remote_name}")
+                return 1
+
+            sys.stdout.write(definition)
+
+        elif command=="extract":
+            object_count = extract_pack_object(pack_reader=pack_reader,pattern=arguments[0],target_dir=arguments[1])
+
+            print(f"{object_count} objects extracted")
+
+        else:
+            print("exporting database objects:",end="")
+
+            try:
+                write_stats = export_pack(pack_reader=pack_reader,\
+                                          root_dir=REMOTE_DIR,\
+                                          remote_name=remote_name,\
+                                          write_options=extract_options.write_options)
+            except:
+                print("fail")
+                return 1
+
+            print(f"success ({write_stats.written_count} written,"+\
+                  f"{write_stats.unchanged_count} unchanged,"+\
+                  f"{write_stats.deleted_count} deleted)")
+    finally:
+        pack_reader.close()
+
+    return 0
+
+def diff_command(remote_a:str,remote_b:str,options:Dict[str,str])->int:
+    """
+    Print the objects added, removed and changed from remote_a to remote_b grouped by type.
+    A remote is looked up in REMOTE_DIR, otherwise it is the path of a remote folder (e.g. a copy of a previous run)
+    """
+
+    object_filter = get_object_filter(options=options)
+
+    if object_filter is None:
+        help_command()
+        return 1
+
+    object_sources:List[ObjectSource] = list()
+
+    for remote in [remote_a,remote_b]:
+
+        remote_dir = Path(REMOTE_DIR)/remote
 
         try:
-            database_objects.extend(get_ext_file_format_object(connection_str=connection_str))
-            print("success")
-        except:
-            print("fail")
+            object_sources.append(ObjectSource(remote_dir=remote_dir if remote_dir.is_dir() else Path(remote)))
+        except (OSError,ValueError):
+            print(f"cannot read the objects of {remote}")
+
+            for object_source in object_sources:
+                object_source.close()
+
             return 1
-        
-        dos_path = Path(REMOTE_DIR)
 
-        if not dos_path.exists():
-            print(f"No {dos_path} folder is found.create {dos_path} folder")
-            dos_path.mkdir()
+    source_a,source_b = object_sources
+
+    try:
+        object_type_diffs = diff_content_hash(content_hash_a=source_a.get_content_hash(),\
+                                              content_hash_b=source_b.get_content_hash(),\
+                                              object_filter=object_filter if is_filtered(object_filter=object_filter) else None)
+
+        for object_type_diff in object_type_diffs:
+
+            print(f"{object_type_diff.object_type.value}: {len(object_type_diff.added)} added,"+\
+                  f"{len(object_type_diff.removed)} removed,"+\
+                  f"{len(object_type_diff.changed)} changed")
+
+            for prefix,object_files in [("+",object_type_diff.added),("-",object_type_diff.removed),("~",object_type_diff.changed)]:
+                for object_file in object_files:
+                    print(f"  {prefix} {object_file}")
+
+        if "--name-only" not in options:
+            for object_file in (x for y in object_type_diffs for x in y.changed):
+                sys.stdout.writelines(get_unified_diff(source_a=source_a,\
+                                                       source_b=source_b,\
+                                                       object_file=object_file,\
+                                                       label_a=remote_a,\
+                                                       label_b=remote_b))
+                print()
+    finally:
+        source_a.close()
+        source_b.close()
+
+    if len(object_type_diffs)==0:
+        print("no difference")
+        return 0
+
+    return 1
+
+def close_broken_stdout():
+    """
+    The reader of the output exited early (e.g. piped into head): send the rest of the output to devnull,
+    so flushing stdout on exit does not fail again
+    """
+
+    os.dup2(os.open(os.devnull,os.O_WRONLY),sys.stdout.fileno())
+
+def list_command(database_uri:str,options:Dict[str,str])->int:
+    """
+    Print the inventory of the modules of a database. Only sys.objects is read, no definition is transferred
+    """
+
+    extract_options = get_extract_options(options=options)
+
+    if extract_options is None:
+        help_command()
+        return 1
+
+    provider = create_provider(database_uri=database_uri,extract_options=extract_options)
+
+    if provider is None:
+        help_command()
+        return 1
+
+    try:
+        object_handles = list_object(provider=provider,object_filter=extract_options.object_filter)
+    except:
+        print("cannot list the objects of the database")
+        return 1
+    finally:
+        provider.close()
+
+    try:
+        for object_handle in object_handles:
+            print(f"{object_handle.object_type.value}\t{object_handle.object_schema}.{object_handle.object_name}\t{object_handle.modify_date}")
+
+        sys.stdout.flush()
+    except BrokenPipeError:
+        close_broken_stdout()
+
+    return 0
+
+def watch_command(remote_name:str,database_uri:str,options:Dict[str,str])->int:
+    """
+    Extract a remote then keep it in sync with the database until interrupted
+    """
+
+    interval = get_positive_option(options=options,name="--interval",default=WATCH_INTERVAL)
+
+    extract_options = get_extract_options(options=options)
+
+    if interval is None or extract_options is None:
+        help_command()
+        return 1
+
+    provider = create_provider(database_uri=database_uri,extract_options=extract_options)
+
+    if provider is None:
+        help_command()
+        return 1
 
-        print("saving database objects:",end="")
+    extractor = Extractor(provider=provider,server_render=extract_options.server_render)
 
+    #the extraction and the polls share the provider, closed once the watch ends
+    try:
+        #read before extracting, so the changes made during the extraction are seen by the first poll
         try:
-            for database_object in database_objects:
-                write_database_object(root_dir=REMOTE_DIR,\
-                                    remote_name=remote_name,\
-                                    database_object=database_object)
-            print("success")
+            change_marker = provider.get_change_marker()
+
+            object_states = get_watched_state(extractor=extractor,object_filter=extract_options.object_filter)
         except:
-            print("fail")
+            print("cannot read the object states of the database")
             return 1
-        
 
+        exit_code = extract_remote(remote_name=remote_name,\
+                                   provider=provider,\
+                                   extract_options=extract_options,\
+                                   close_provider=False)
+
+        if exit_code!=0:
+            return exit_code
+
+        print(f"watching every {interval}s")
+
+        watch_stats = watch_remote(extractor=extractor,\
+                                   object_filter=extract_options.object_filter,\
+                                   writer_func=partial(create_object_writer,remote_name=remote_name,extract_options=extract_options),\
+                                   object_states=object_states,\
+                                   change_marker=change_marker,\
+                                   interval=interval)
+    finally:
+        extractor.close()
+
+    print(f"polls:{watch_stats.poll_count} ({watch_stats.failed_poll_count} failed),"+\
+          f"{watch_stats.poll_duration/max(watch_stats.poll_count,1)*1000:.1f} ms mean,"+\
+          f"{watch_stats.max_poll_duration*1000:.1f} ms max")
+    print(f"syncs:{watch_stats.sync_count},{watch_stats.written_count} written,{watch_stats.deleted_count} deleted,"+\
+          f"{watch_stats.sync_duration:.2f}s")
+
+    return 0
+
+def apply_command(remote_name:str,database_uri:Optional[str],options:Dict[str,str])->int:
+    """
+    Create the objects of a remote in a database, e.g. to rebuild a test database from a production extraction.
+    The remote is looked up in REMOTE_DIR, otherwise it is the path of a remote folder.
+    A dry run only plans the waves, so it needs no database uri
+    """
+
+    extract_options = get_extract_options(options=options)
+
+    batch_size = get_positive_option(options=options,name="--apply-batch",default=APPLY_BATCH_SIZE)
+
+    dry_run = "--dry-run" in options
+
+    #objects are only applied to sql server
+    connection_info = None if dry_run or database_uri is None else get_connection_info(database_uri=database_uri)
+
+    if extract_options is None or batch_size is None or (not dry_run and connection_info is None):
+        help_command()
+        return 1
+
+    remote_dir = Path(REMOTE_DIR)/remote_name
+
+    try:
+        object_source = ObjectSource(remote_dir=remote_dir if remote_dir.is_dir() else Path(remote_name))
+    except (OSError,ValueError):
+        print(f"cannot read the objects of {remote_name}")
+        return 1
+
+    try:
+        object_files = [x for x in sorted(object_source.get_content_hash().keys())\
+                        if parse_database_object_file(object_file=x) is not None and\
+                        is_object_file_match(object_filter=extract_options.object_filter,object_file=x)]
+
+        object_definitions = {x:object_source.get_definition(object_file=x) for x in object_files}
+    except:
+        print(f"cannot read the objects of {remote_name}")
+        return 1
+    finally:
+        object_source.close()
+
+    engine = None
+
+    if not dry_run:
+        engine,_ = create_database_engine(connection_str=get_connection_string(host=connection_info.host,\
+                                                                              database_name=connection_info.database,\
+                                                                              user=connection_info.user,\
+                                                                              password=connection_info.password),\
+                                          pool_size=extract_options.jobs)
+
+    try:
+        apply_stats,failures = apply_object(engine=engine,\
+                                            object_definitions=object_definitions,\
+                                            jobs=extract_options.jobs,\
+                                            batch_size=batch_size,\
+                                            dry_run=dry_run,\
+                                            output=sys.stdout)
+    except BrokenPipeError:
+        #the waves of a dry run piped into e.g. head
+        if not dry_run:
+            raise
+
+        close_broken_stdout()
         return 0
+    finally:
+        if engine is not None:
+            engine.dispose()
 
-    else:
+    for failure in failures:
+        print(f"failed {failure.object_file}: {failure.error}")
+
+    print(f"apply: {apply_stats.object_count} objects,{apply_stats.wave_count} waves,{apply_stats.batch_count} batches,"+\
+          f"{apply_stats.applied_count} applied,{apply_stats.failed_count} failed ({apply_stats.duration:.2f}s)")
+
+    return 0 if len(failures)==0 else 1
+
+def main(argv)->int:
+
+    parsed_argument = parse_argument(argv=argv)
+
+    if parsed_argument is None:
         help_command()
         return 1
-    
 
-def write_database_object(root_dir:str,remote_name:str,database_object:DatabaseObject):
+    arguments,options = parsed_argument
 
-    database_object_folder = {
-        ObjectType.TABLE:"table",
-        ObjectType.VIEW:"view",
-        ObjectType.FUNCTION:"func",
-        ObjectType.PROCEDURE:"procedure",
-        ObjectType.INDEX:"index",
-        ObjectType.EXTDATASOURCE:"ext_data_source",
-        ObjectType.EXTTABLE:"ext_table",
-        ObjectType.EXTFILEFORMAT:"ext_file_format"
-    }
+    if len(arguments)==2 and arguments[0]=="fleet":
+        return fleet_command(manifest_path=arguments[1],options=options)
 
-    file_name = f"{database_object.object_name}.sql"
+    if len(arguments)>=3 and arguments[0]=="pack":
+        return pack_command(command=arguments[1],remote_name=arguments[2],arguments=arguments[3:],options=options)
 
-    if database_object.object_schema is not None:
-        file_name = f"{database_object.object_schema}.{database_object.object_name}.sql"
+    if len(arguments)==3 and arguments[0]=="diff":
+        return diff_command(remote_a=arguments[1],remote_b=arguments[2],options=options)
 
-    database_file_path = Path(f"{root_dir}/{remote_name}/{database_object_folder[database_object.object_type]}"+\
-                         f"/{file_name}")
-    
-    database_file_path.parent.mkdir(parents=True, exist_ok=True)
+    if len(arguments)==2 and arguments[0]=="list":
+        return list_command(database_uri=arguments[1],options=options)
+
+    if len(arguments)==3 and arguments[0]=="watch":
+        return watch_command(remote_name=arguments[1],database_uri=arguments[2],options=options)
 
-    with database_file_path.open("w") as file:
-        file.write(database_object.object_definition)
+    if len(arguments) in (2,3) and arguments[0]=="apply":
+        return apply_command(remote_name=arguments[1],database_uri=arguments[2] if len(arguments)==3 else None,options=options)
 
+    if len(arguments)==3 and arguments[0]=="replay":
+        return replay_command(remote_name=arguments[1],snapshot_path=arguments[2],options=options)
+
+    if len(arguments)==2:
+        remote_name = arguments[0]
+
+        database_uri = arguments[1]
+
+        extract_options = get_extract_options(options=options)
+
+        #modules fetched by incremental extraction are not catalog queries and cannot be captured
+        if extract_options is None or ("--capture" in options and extract_options.incremental):
+            help_command()
+            return 1
+
+        provider = create_provider(database_uri=database_uri,extract_options=extract_options)
+
+        if provider is None:
+            help_command()
+            return 1
+
+        snapshot_writer = None
+
+        if "--capture" in options:
+            snapshot_writer = SnapshotWriter(snapshot_path=options["--capture"])
+
+            provider = CaptureCatalogProvider(provider=provider,snapshot_writer=snapshot_writer)
+
+        exit_code = extract_remote(remote_name=remote_name,\
+                                   provider=provider,\
+                                   extract_options=extract_options)
+
+        if snapshot_writer is not None:
+
+            if exit_code==0:
+                print("saving snapshot:",end="")
+
+                try:
+                    snapshot_writer.save()
+                    print("success")
+                except:
+                    print("fail")
+                    exit_code = 1
+
+            snapshot_writer.close()
+
+        print_peak_memory()
+
+        return exit_code
+
+    else:
+        help_command()
+        return 1
+    
 
 if __name__=="__main__":
-    sys.exit(main(sys.argv[1:]))
\ No newline at end of file
+    sys.exit(main(sys.argv[1:]))
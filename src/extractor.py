@@ -0,0 +1,187 @@
+"""
+Extraction as a library. An Extractor keeps its provider, so its connection pool and prepared catalog statements,
+across calls: a long-running service opens it once and every later extraction skip connecting and building the queries
+"""
+from pathlib import Path
+from typing import List,Dict,Tuple,Optional,Iterator
+from model import ConnectionInfo,DatabaseObject,ObjectType,ObjectFilter,ExtractOptions,FetchOptions
+from objectfilter import is_type_match
+from database import get_connection_string
+from provider import CatalogProvider,DatabaseCatalogProvider,SqliteCatalogProvider,CachedCatalogProvider
+from config import FAKE_DATABASE_PREFIX
+
+#extraction order of the object categories and the catalog query of each one
+EXTRACT_CATEGORIES:List[Tuple[str,ObjectType,str]] = [
+    ("tables",ObjectType.TABLE,"GET_TABLE_SQL"),
+    ("views",ObjectType.VIEW,"GET_VIEW_CODE"),
+    ("functions",ObjectType.FUNCTION,"GET_FUNCTION_SQL"),
+    ("procedures",ObjectType.PROCEDURE,"GET_PROCEDURE_SQL"),
+    ("indexes",ObjectType.INDEX,"GET_INDEX_SQL"),
+    ("external data source",ObjectType.EXTDATASOURCE,"GET_EXTERNAL_DATA_SOURCE_SQL"),
+    ("external table",ObjectType.EXTTABLE,"GET_EXTERNAL_TABLE_SQL"),
+    ("external file format",ObjectType.EXTFILEFORMAT,"GET_EXTERNAL_FILE_FORMAT_SQL")
+]
+
+#catalog query of the categories whose definition can be assembled by the server
+SERVER_RENDER_QUERY:Dict[ObjectType,str] = {
+    ObjectType.TABLE:"GET_TABLE_DDL_SQL",
+    ObjectType.INDEX:"GET_INDEX_DDL_SQL",
+    ObjectType.EXTTABLE:"GET_EXTERNAL_TABLE_DDL_SQL"
+}
+
+def get_connection_info(database_uri:str)->Optional[ConnectionInfo]:
+    """
+    Return host,database,user,password
+    """
+
+    host_separator = database_uri.rfind("@")
+
+    if host_separator<=0:
+        return None
+
+    host_block = database_uri[host_separator+1:]
+
+    database_separator = host_block.rfind("/")
+
+    if database_separator<=0:
+        return None
+
+    host = host_block[:database_separator]
+
+    database = host_block[database_separator+1:]
+
+    credential_block = database_uri[:host_separator]
+
+    user_separator = credential_block.rfind(":")
+
+    if user_separator<=0:
+        return None
+
+    user = credential_block[:user_separator]
+
+    password = credential_block[user_separator+1:]
+
+    return ConnectionInfo(host=host,\
+                          database=database,\
+                          user=user,\
+                          password=password)
+
+def create_provider(database_uri:str,extract_options:ExtractOptions)->Optional[CatalogProvider]:
+    """
+    Return the provider of the database uri, with one pooled connection per concurrent category
+    and the query cache of extract_options if any, or None when the uri is invalid
+    """
+
+    if database_uri.startswith(FAKE_DATABASE_PREFIX):
+
+        database_path = database_uri[len(FAKE_DATABASE_PREFIX):]
+
+        provider = SqliteCatalogProvider(database_path=database_path,\
+                                         pool_size=extract_options.jobs,\
+                                         fetch_options=extract_options.fetch_options)
+
+        source_name = str(Path(database_path).resolve())
+    else:
+        connection_info = get_connection_info(database_uri=database_uri)
+
+        if connection_info is None:
+            return None
+
+        connection_str = get_connection_string(host=connection_info.host,\
+                                               database_name=connection_info.database,\
+                                               user=connection_info.user,\
+                                               password=connection_info.password)
+
+        provider = DatabaseCatalogProvider(connection_str=connection_str,\
+                                           pool_size=extract_options.jobs,\
+                                           fetch_options=extract_options.fetch_options)
+
+        source_name = f"{connection_info.host}/{connection_info.database}"
+
+    if extract_options.cache_dir is not None:
+        return CachedCatalogProvider(provider=provider,\
+                                     cache_dir=extract_options.cache_dir,\
+                                     source_name=source_name,\
+                                     ttl=extract_options.cache_ttl)
+
+    return provider
+
+class Extractor:
+    """
+    Return the objects of a database by category or one at a time. Methods can be called concurrently,
+    up to the pool size of the provider
+    """
+
+    def __init__(self,provider:CatalogProvider,server_render:bool=False):
+
+        self.provider = provider
+
+        self.query_names:Dict[ObjectType,str] = {object_type:SERVER_RENDER_QUERY.get(object_type,query_name) if server_render else query_name\
+                                                 for _,object_type,query_name in EXTRACT_CATEGORIES}
+
+    @staticmethod
+    def open(database_uri:str,\
+             pool_size:int=1,\
+             fetch_options:Optional[FetchOptions]=None,\
+             server_render:bool=False)->Optional["Extractor"]:
+        """
+        Return the extractor of a database uri (as on the command line) or None when the uri is invalid.
+        No connection is opened until the first call
+        """
+
+        provider = create_provider(database_uri=database_uri,\
+                                   extract_options=ExtractOptions(jobs=pool_size,\
+                                                                  fetch_options=fetch_options if fetch_options is not None else FetchOptions()))
+
+        if provider is None:
+            return None
+
+        return Extractor(provider=provider,server_render=server_render)
+
+    def iter_category_object(self,object_type:ObjectType,object_filter:Optional[ObjectFilter]=None)->Iterator[DatabaseObject]:
+        """
+        Stream the objects of a type matching the schema and name filters
+        """
+
+        return self.provider.get_object(query_name=self.query_names[object_type],object_filter=object_filter)
+
+    def get_category_object(self,object_type:ObjectType,object_filter:Optional[ObjectFilter]=None)->List[DatabaseObject]:
+
+        return list(self.iter_category_object(object_type=object_type,object_filter=object_filter))
+
+    def get_object(self,object_type:ObjectType,object_name:str,object_schema:Optional[str]=None)->Optional[DatabaseObject]:
+        """
+        Return a single object or None when it does not exist. Only the rows of objects with this name are fetched.
+        Names are compared case-insensitively, and object_schema is ignored for the types without schema
+        """
+
+        object_filter = ObjectFilter(include_schemas=[] if object_schema is None else [object_schema],name_pattern=object_name)
+
+        for database_object in self.get_category_object(object_type=object_type,object_filter=object_filter):
+
+            #the name pattern may match more objects when the name contains * or ?
+            if database_object.object_name.lower()!=object_name.lower():
+                continue
+
+            if object_schema is None or database_object.object_schema is None or database_object.object_schema.lower()==object_schema.lower():
+                return database_object
+
+        return None
+
+    def extract(self,object_filter:Optional[ObjectFilter]=None)->Iterator[DatabaseObject]:
+        """
+        Stream the objects of every category matching the filter, in the order of EXTRACT_CATEGORIES
+        """
+
+        if object_filter is None:
+            object_filter = ObjectFilter()
+
+        for _,object_type,_ in EXTRACT_CATEGORIES:
+            if is_type_match(object_filter=object_filter,object_type=object_type):
+                yield from self.iter_category_object(object_type=object_type,object_filter=object_filter)
+
+    def get_connection_count(self)->Optional[int]:
+        return self.provider.get_connection_count()
+
+    def close(self):
+        self.provider.close()
@@ -0,0 +1,237 @@
+"""
+Synthetic catalogs of any size saved to a SQLite database, so the whole extraction can run without SQL Server.
+The database has one table per catalog query (named after it) whose rows have the same shape and order as the query,
+plus the tables of the incremental queries
+"""
+import sys
+import sqlite3
+from datetime import datetime,timedelta
+from pathlib import Path
+from typing import List,Dict,Tuple,Iterator,Iterable,Sequence
+from itertools import groupby
+from render import render_column,render_index_column
+
+DATA_TYPES = [("int",None),("nvarchar","50"),("varchar","max"),("decimal","(18,2)"),("datetime2",None)]
+
+MODULE_DATE = datetime(2024,1,1)
+
+def generate_table_rows(table_count:int,column_count:int)->Iterator[Tuple]:
+    """
+    Rows shaped like GET_TABLE_SQL. Like a database driver, every row has its own string objects
+    """
+
+    for table_no in range(table_count):
+        for column_no in range(column_count):
+
+            data_type,data_type_length = DATA_TYPES[column_no%len(DATA_TYPES)]
+
+            yield (f"schema{table_no%10}",\
+                   f"table{table_no}",\
+                   f"column{column_no}",\
+                   "".join(data_type),\
+                   None if data_type_length is None else "".join(data_type_length),\
+                   "YES" if column_no%2==0 else "NO",\
+                   column_no+1)
+
+def generate_index_rows(index_count:int,column_count:int,duplicate_index_count:int=0)->Iterator[Tuple]:
+    """
+    Rows shaped like GET_INDEX_SQL. Like a database driver, every row has its own string objects.
+    Index names are only unique per table, so the first duplicate_index_count indexes are named after their schema
+    and share their name with the other indexes of the schema among them
+    """
+
+    for index_no in range(index_count):
+        for column_no in range(column_count):
+            yield (f"schema{index_no%10}",\
+                   f"table{index_no//2}",\
+                   f"index{index_no%10 if index_no<duplicate_index_count else index_no}",\
+                   f"column{column_no}",\
+                   "".join("NONCLUSTERED"),\
+                   column_no+1,\
+                   column_no>=column_count//2,\
+                   column_no%3==0)
+
+def generate_module_rows(module_type:str,module_count:int)->Iterator[Tuple]:
+    """
+    Rows shaped like GET_VIEW_CODE, GET_FUNCTION_SQL and GET_PROCEDURE_SQL
+    """
+
+    for module_no in range(module_count):
+
+        module_name = f"{module_type.lower()}{module_no}"
+
+        yield (f"schema{module_no%10}",\
+               module_name,\
+               f"CREATE {module_type} [schema{module_no%10}].[{module_name}]\nAS\nSELECT {module_no} AS [value]")
+
+def generate_ext_table_rows(table_count:int,column_count:int)->Iterator[Tuple]:
+    """
+    Rows shaped like GET_EXTERNAL_TABLE_SQL
+    """
+
+    for table_no,column_no in ((x,y) for x in range(table_count) for y in range(column_count)):
+
+        data_type,data_type_length = DATA_TYPES[column_no%len(DATA_TYPES)]
+
+        yield (f"ext{table_no%10}",\
+               f"ext_table{table_no}",\
+               f"column{column_no}",\
+               data_type,\
+               data_type_length,\
+               column_no%2==0,\
+               column_no+1,\
+               f"/data/ext_table{table_no}/",\
+               f"data_source{table_no%2}",\
+               f"format{table_no%2}")
+
+def get_table_ddl_rows(table_rows:Iterable[Sequence])->Iterator[Tuple]:
+    """
+    Rows of GET_TABLE_DDL_SQL assembled from the rows of GET_TABLE_SQL
+    """
+
+    for (table_schema,table_name),columns in groupby(table_rows,key=lambda x:(x[0],x[1])):
+        yield (table_schema,\
+               table_name,\
+               ",\n".join(render_column(column_name=x[2],data_type=x[3],data_type_length=x[4],is_nullable=x[5]=="YES") for x in columns))
+
+def get_ext_table_ddl_rows(ext_table_rows:Iterable[Sequence])->Iterator[Tuple]:
+    """
+    Rows of GET_EXTERNAL_TABLE_DDL_SQL assembled from the rows of GET_EXTERNAL_TABLE_SQL
+    """
+
+    for _,columns in groupby(ext_table_rows,key=lambda x:(x[0],x[1])):
+
+        columns = list(columns)
+
+        x = columns[0]
+
+        yield (x[0],\
+               x[1],\
+               ",\n".join(render_column(column_name=y[2],data_type=y[3],data_type_length=y[4],is_nullable=bool(y[5])) for y in columns),\
+               x[7],\
+               x[8],\
+               x[9])
+
+def get_index_ddl_rows(index_rows:Iterable[Sequence])->Iterator[Tuple]:
+    """
+    Rows of GET_INDEX_DDL_SQL assembled from the rows of GET_INDEX_SQL
+    """
+
+    def aggregate_column(columns:List[Sequence])->str:
+
+        if len(columns)==0:
+            return None
+
+        return ",".join(render_index_column(column_name=x[3],is_descending_key=bool(x[7])) for x in columns)
+
+    for _,columns in groupby(index_rows,key=lambda x:(x[0],x[1],x[2])):
+
+        columns = list(columns)
+
+        x = columns[0]
+
+        yield (x[0],\
+               x[1],\
+               x[2],\
+               x[4],\
+               aggregate_column(columns=[y for y in columns if not y[6]]),\
+               aggregate_column(columns=[y for y in columns if y[6]]))
+
+def generate_catalog_rows(table_count:int,column_count:int,duplicate_index_count:int=0)->Dict[str,List[Tuple]]:
+    """
+    Rows of every catalog query for table_count tables of column_count columns.
+    There are as many views, functions, procedures and indexes as tables and one external table per 10 tables
+    """
+
+    table_rows = list(generate_table_rows(table_count=table_count,column_count=column_count))
+
+    index_rows = list(generate_index_rows(index_count=table_count,\
+                                          column_count=min(column_count,4),\
+                                          duplicate_index_count=duplicate_index_count))
+
+    ext_table_rows = list(generate_ext_table_rows(table_count=table_count//10,column_count=column_count))
+
+    module_rows = {x:list(generate_module_rows(module_type=x,module_count=table_count)) for x in ["VIEW","FUNCTION","PROCEDURE"]}
+
+    module_state_rows:List[Tuple] = list()
+
+    module_definition_rows:List[Tuple] = list()
+
+    for module_type,sys_type in [("VIEW","V"),("FUNCTION","FN"),("PROCEDURE","P")]:
+        for module_no,row in enumerate(module_rows[module_type]):
+
+            object_id = len(module_state_rows)+1
+
+            module_state_rows.append((object_id,row[0],row[1],sys_type,(MODULE_DATE+timedelta(seconds=module_no)).isoformat()))
+
+            module_definition_rows.append((object_id,row[2]))
+
+    return {
+        "GET_TABLE_SQL":table_rows,
+        "GET_VIEW_CODE":module_rows["VIEW"],
+        "GET_FUNCTION_SQL":module_rows["FUNCTION"],
+        "GET_PROCEDURE_SQL":module_rows["PROCEDURE"],
+        "GET_INDEX_SQL":index_rows,
+        "GET_EXTERNAL_DATA_SOURCE_SQL":[(f"data_source{x}","HADOOP" if x==0 else "NONE",f"abfss://data{x}@account.dfs.core.windows.net",f"credential{x}") for x in range(2)],
+        "GET_EXTERNAL_TABLE_SQL":ext_table_rows,
+        "GET_EXTERNAL_FILE_FORMAT_SQL":[("format0","DELIMITEDTEXT",",","\"",True,2),("format1","PARQUET",None,None,False,None)],
+        "GET_TABLE_DDL_SQL":list(get_table_ddl_rows(table_rows=table_rows)),
+        "GET_INDEX_DDL_SQL":list(get_index_ddl_rows(index_rows=index_rows)),
+        "GET_EXTERNAL_TABLE_DDL_SQL":list(get_ext_table_ddl_rows(ext_table_rows=ext_table_rows)),
+        "GET_MODULE_STATE_SQL":module_state_rows,
+        "GET_MODULE_DEFINITION_SQL":module_definition_rows
+    }
+
+def save_catalog_rows(database_path:str,catalog_rows:Dict[str,List[Tuple]]):
+    """
+    Save the rows into one table per query, replacing the existing ones. Columns are named c0,c1,...
+    """
+
+    Path(database_path).parent.mkdir(parents=True,exist_ok=True)
+
+    with sqlite3.connect(database_path) as connection:
+
+        for query_name,rows in catalog_rows.items():
+
+            connection.execute(f"DROP TABLE IF EXISTS \"{query_name}\"")
+
+            column_count = len(rows[0]) if len(rows)>0 else 1
+
+            connection.execute(f"CREATE TABLE \"{query_name}\" ({','.join(f'c{x}' for x in range(column_count))})")
+
+            connection.executemany(f"INSERT INTO \"{query_name}\" VALUES ({','.join('?'*column_count)})",rows)
+
+            #modules are paged and looked up by object id, which sql server keep in a clustered index
+            if query_name in ["GET_MODULE_STATE_SQL","GET_MODULE_DEFINITION_SQL"]:
+                connection.execute(f"CREATE INDEX \"{query_name}_c0\" ON \"{query_name}\" (c0)")
+
+    connection.close()
+
+def create_fake_catalog(database_path:str,table_count:int,column_count:int,duplicate_index_count:int=0)->Dict[str,int]:
+    """
+    Generate a synthetic catalog into a SQLite database and return the number of rows per query
+    """
+
+    catalog_rows = generate_catalog_rows(table_count=table_count,column_count=column_count,duplicate_index_count=duplicate_index_count)
+
+    save_catalog_rows(database_path=database_path,catalog_rows=catalog_rows)
+
+    return {x:len(y) for x,y in catalog_rows.items()}
+
+def main(argv)->int:
+
+    if len(argv)<1:
+        print("Usage: python fake.py <database_path> [table_count] [column_count]")
+        return 1
+
+    table_count = int(argv[1]) if len(argv)>1 else 1000
+
+    column_count = int(argv[2]) if len(argv)>2 else 30
+
+    for query_name,row_count in create_fake_catalog(database_path=argv[0],table_count=table_count,column_count=column_count).items():
+        print(f"{query_name}:{row_count} rows")
+
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,132 @@
+import io
+import time
+from typing import List,Dict,Optional,Iterable,Callable,TextIO
+from concurrent.futures import ThreadPoolExecutor,Future,wait,FIRST_COMPLETED
+from model import FleetEntry,FleetResult
+
+
+def read_fleet_manifest(lines:Iterable[str])->Optional[List[FleetEntry]]:
+    """
+    Read '<remote> <database_uri>' entries. Blank lines and lines starting with '#' are ignored.
+    Return None when an entry is malformed or a remote is listed twice
+    """
+
+    fleet_entries:List[FleetEntry] = list()
+
+    remote_names = set()
+
+    for line in lines:
+
+        line = line.strip()
+
+        if len(line)==0 or line.startswith("#"):
+            continue
+
+        fields = line.split()
+
+        if len(fields)!=2 or fields[0] in remote_names:
+            return None
+
+        remote_names.add(fields[0])
+
+        fleet_entries.append(FleetEntry(remote_name=fields[0],\
+                                        database_uri=fields[1]))
+
+    return fleet_entries
+
+def run_fleet(fleet_entries:List[FleetEntry],\
+              extract_func:Callable[[FleetEntry,TextIO],int],\
+              host_func:Callable[[FleetEntry],str],\
+              max_parallel:int,\
+              max_per_host:int)->List[FleetResult]:
+    """
+    Extract every entry with at most `max_parallel` extractions in flight and at most
+    `max_per_host` of them against the same host.
+    Entries whose host is busy are skipped over so they never hold a slot another host could use.
+    Results are returned in manifest order
+    """
+
+    pending_entries:List[FleetEntry] = list(fleet_entries)
+
+    running:Dict[Future,FleetEntry] = dict()
+
+    host_running:Dict[str,int] = dict()
+
+    results:Dict[str,FleetResult] = dict()
+
+    def run_entry(fleet_entry:FleetEntry)->FleetResult:
+
+        output = io.StringIO()
+
+        start_time = time.perf_counter()
+
+        try:
+            is_success = extract_func(fleet_entry,output)==0
+        except Exception as ex:
+            print(f"fail:{ex}",file=output)
+            is_success = False
+
+        return FleetResult(remote_name=fleet_entry.remote_name,\
+                           host=host_func(fleet_entry),\
+                           is_success=is_success,\
+                           duration=time.perf_counter()-start_time,\
+                           log=output.getvalue())
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+
+        while len(pending_entries)>0 or len(running)>0:
+
+            index = 0
+
+            while len(running)<max_parallel and index<len(pending_entries):
+
+                host = host_func(pending_entries[index])
+
+                if host_running.get(host,0)>=max_per_host:
+                    index+=1
+                    continue
+
+                fleet_entry = pending_entries.pop(index)
+
+                host_running[host] = host_running.get(host,0)+1
+
+                running[executor.submit(run_entry,fleet_entry)] = fleet_entry
+
+            done_futures,_ = wait(running.keys(),return_when=FIRST_COMPLETED)
+
+            for future in done_futures:
+
+                fleet_entry = running.pop(future)
+
+                fleet_result = future.result()
+
+                host_running[fleet_result.host]-=1
+
+                results[fleet_entry.remote_name] = fleet_result
+
+    return [results[x.remote_name] for x in fleet_entries]
+
+def print_fleet_summary(fleet_results:List[FleetResult]):
+
+    remote_width = max([len("remote")]+[len(x.remote_name) for x in fleet_results])
+
+    host_width = max([len("host")]+[len(x.host) for x in fleet_results])
+
+    print()
+    print(f"{'remote':<{remote_width}}  {'host':<{host_width}}  {'status':<7}  duration")
+
+    for x in fleet_results:
+
+        status = "success" if x.is_success else "fail"
+
+        print(f"{x.remote_name:<{remote_width}}  {x.host:<{host_width}}  {status:<7}  {x.duration:.2f}s")
+
+    failed_results = [x for x in fleet_results if not x.is_success]
+
+    print()
+    print(f"{len(fleet_results)-len(failed_results)} succeeded, {len(failed_results)} failed")
+
+    for x in failed_results:
+        print()
+        print(f"[{x.remote_name}]")
+        print(x.log,end="")
@@ -1,4 +1,5 @@
-from typing import List,Dict,Callable,TypeVar
+from typing import List,Dict,Callable,TypeVar,Optional
+import sys
 
 Input = TypeVar("Input")
 
@@ -17,4 +18,22 @@ def group_by(objects:List[Input],\
 
         grouped[group_key].append(obj)
 
-    return grouped
\ No newline at end of file
+    return grouped
+
+def get_peak_memory()->Optional[int]:
+    """
+    Return the peak resident memory of the process in bytes or None when the platform does not report it
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    #linux report kilobytes while macos report bytes
+    if sys.platform!="darwin":
+        peak_memory*=1024
+
+    return peak_memory
@@ -0,0 +1,225 @@
+"""
+Git output: the objects of a run are streamed into a local repository through git fast-import
+and recorded as a single commit, without writing any file nor touching a working tree.
+Each remote is saved under <remote>/ on a branch shared by all the remotes
+"""
+import time
+import hashlib
+import threading
+import subprocess
+from pathlib import Path
+from typing import Dict,Optional,Set,Callable
+from model import DatabaseObject,ObjectType,WriteStats,WriteOptions
+from config import GIT_BRANCH
+from writer import get_database_object_file
+
+#the commits of concurrent remotes (fleet mode) are made one at a time so each one has the branch tip as parent
+COMMIT_LOCK = threading.Lock()
+
+def run_git(git_dir:str,arguments:list)->bytes:
+    """
+    Return the standard output of a git command, raise OSError when it fails
+    """
+
+    result = subprocess.run(["git","-C",git_dir]+arguments,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+
+    if result.returncode!=0:
+        raise OSError(f"git {arguments[0]} failed: {result.stderr.decode('utf-8','replace').strip()}")
+
+    return result.stdout
+
+def get_blob_hash(data:bytes)->str:
+    """
+    Object id git gives to a blob, so unchanged objects are never sent to git
+    """
+
+    return hashlib.sha1(b"blob %d\0"%len(data)+data).hexdigest()
+
+#escapes of a C-style quoted path, other control and non-ASCII bytes are written in octal
+GIT_PATH_ESCAPES = {ord("\""):b"\\\"",ord("\\"):b"\\\\",ord("\a"):b"\\a",ord("\b"):b"\\b",ord("\t"):b"\\t",\
+                    ord("\n"):b"\\n",ord("\v"):b"\\v",ord("\f"):b"\\f",ord("\r"):b"\\r"}
+
+def get_git_path(path:str)->bytes:
+    """
+    Path of a fast-import file command, C-style quoted like git does when it starts with a double quote or holds a control character
+    """
+
+    data = path.encode("utf-8")
+
+    if not path.startswith("\"") and not any(x<0x20 or x==0x7f for x in data):
+        return data
+
+    return b"\""+b"".join(GIT_PATH_ESCAPES.get(x,b"\\%03o"%x if x<0x20 or x>=0x7f else bytes([x])) for x in data)+b"\""
+
+def get_branch_commit(git_dir:str,branch:str)->Optional[str]:
+    """
+    Return the commit of the tip of the branch or None when the branch does not exist
+    """
+
+    result = subprocess.run(["git","-C",git_dir,"rev-parse","--verify","--quiet",f"refs/heads/{branch}^{{commit}}"],\
+                            stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+
+    if result.returncode!=0:
+        return None
+
+    return result.stdout.decode("utf-8").strip()
+
+def get_tree_files(git_dir:str,branch:str,remote_name:str)->Dict[str,str]:
+    """
+    Return the blob hash of every file of the remote folder at the tip of the branch, keyed by path relative to the folder
+    """
+
+    if get_branch_commit(git_dir=git_dir,branch=branch) is None:
+        return dict()
+
+    tree_files:Dict[str,str] = dict()
+
+    for entry in run_git(git_dir=git_dir,arguments=["ls-tree","-r","-z",f"refs/heads/{branch}","--",f"{remote_name}/"]).split(b"\0"):
+
+        if len(entry)==0:
+            continue
+
+        info,path = entry.split(b"\t",1)
+
+        tree_files[path.decode("utf-8")[len(remote_name)+1:]] = info.split(b" ")[2].decode("ascii")
+
+    return tree_files
+
+class GitImportWriter:
+    """
+    Stream the objects of a run into a git repository, created bare if missing.
+    Same interface as DatabaseObjectWriter: only the objects whose blob differ from the branch tip are sent,
+    and close record the written and deleted objects as one commit (none when nothing changed)
+    """
+
+    def __init__(self,git_dir:str,remote_name:str,branch:str=GIT_BRANCH,write_options:Optional[WriteOptions]=None):
+
+        self.git_dir = git_dir
+
+        self.remote_name = remote_name
+
+        self.branch = branch
+
+        #the folder may already hold the run reports of a failed first run
+        if not (Path(git_dir)/"HEAD").is_file():
+            subprocess.run(["git","init","--bare","--quiet",git_dir],check=True,stdout=subprocess.DEVNULL)
+
+        self.tree_files = get_tree_files(git_dir=git_dir,branch=branch,remote_name=remote_name)
+
+        self.process = subprocess.Popen(["git","-C",git_dir,"fast-import","--quiet","--done"],\
+                                        stdin=subprocess.PIPE,\
+                                        stdout=subprocess.DEVNULL)
+
+        #object file -> mark of its blob
+        self.written_files:Dict[str,int] = dict()
+
+        self.kept_files:Set[str] = set()
+
+        self.deleted_files:Set[str] = set()
+
+        self.lock = threading.Lock()
+
+        self.stats = WriteStats()
+
+        self.start_time = time.perf_counter()
+
+    def write(self,database_object:DatabaseObject):
+
+        object_file = get_database_object_file(object_schema=database_object.object_schema,\
+                                               object_name=database_object.object_name,\
+                                               object_type=database_object.object_type)
+
+        data = database_object.object_definition.encode("utf-8")
+
+        is_unchanged = self.tree_files.get(object_file)==get_blob_hash(data=data)
+
+        with self.lock:
+
+            if is_unchanged:
+                self.kept_files.add(object_file)
+                self.written_files.pop(object_file,None)
+                self.stats.unchanged_count+=1
+                return
+
+            mark = self.stats.written_count+1
+
+            self.process.stdin.write(b"blob\nmark :%d\ndata %d\n"%(mark,len(data))+data+b"\n")
+
+            self.written_files[object_file] = mark
+
+            self.stats.written_count+=1
+            self.stats.written_bytes+=len(data)
+
+    def keep(self,object_schema:Optional[str],object_name:str,object_type:ObjectType):
+
+        with self.lock:
+            self.kept_files.add(get_database_object_file(object_schema=object_schema,\
+                                                         object_name=object_name,\
+                                                         object_type=object_type))
+
+    def delete(self,object_schema:Optional[str],object_name:str,object_type:ObjectType):
+
+        with self.lock:
+            self.deleted_files.add(get_database_object_file(object_schema=object_schema,\
+                                                            object_name=object_name,\
+                                                            object_type=object_type))
+
+            self.stats.deleted_count+=1
+
+    def get_commit_message(self)->bytes:
+
+        return f"dos {self.remote_name}: {self.stats.written_count} written,{self.stats.deleted_count} deleted".encode("utf-8")
+
+    def close(self,delete_stale:bool=True,is_in_scope:Optional[Callable[[str],bool]]=None):
+        """
+        Commit the written objects and delete the dropped and stale ones (files of the branch tip neither written nor kept).
+        Without delete_stale, or when is_in_scope return False, those files are left in the tree.
+        Raise OSError when git fail
+        """
+
+        deleted_files = {x for x in self.deleted_files if x in self.tree_files}
+
+        for object_file in self.tree_files:
+
+            if object_file in self.written_files or object_file in self.kept_files or object_file in self.deleted_files:
+                continue
+
+            if delete_stale and (is_in_scope is None or is_in_scope(object_file)):
+                deleted_files.add(object_file)
+
+                self.stats.deleted_count+=1
+
+        with COMMIT_LOCK:
+
+            try:
+                if len(self.written_files)>0 or len(deleted_files)>0:
+
+                    commit_message = self.get_commit_message()
+
+                    commands = [b"commit refs/heads/%s"%self.branch.encode("utf-8"),\
+                                b"committer dos <dos@localhost> %d +0000"%int(time.time()),\
+                                b"data %d"%len(commit_message)+b"\n"+commit_message]
+
+                    parent_commit = get_branch_commit(git_dir=self.git_dir,branch=self.branch)
+
+                    if parent_commit is not None:
+                        commands.append(b"from "+parent_commit.encode("ascii"))
+
+                    for object_file in sorted(deleted_files):
+                        commands.append(b"D "+get_git_path(path=f"{self.remote_name}/{object_file}"))
+
+                    for object_file,mark in sorted(self.written_files.items()):
+                        commands.append(b"M 100644 :%d "%mark+get_git_path(path=f"{self.remote_name}/{object_file}"))
+
+                    self.process.stdin.write(b"\n".join(commands)+b"\n\n")
+
+                self.process.stdin.write(b"done\n")
+
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+            if self.process.wait()!=0:
+                raise OSError(f"git fast-import failed for {self.remote_name}")
+
+        self.stats.duration = time.perf_counter()-self.start_time
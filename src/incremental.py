@@ -0,0 +1,74 @@
+import json
+from pathlib import Path
+from typing import List,Dict,Tuple,Optional
+from model import ModuleState,ObjectType,ObjectFilter
+from objectfilter import is_type_match,is_object_match
+
+
+def load_module_state(state_path:Path)->Optional[List[ModuleState]]:
+    """
+    Return the module state saved by the last incremental run or None when there is no usable state
+    """
+
+    if not state_path.exists():
+        return None
+
+    try:
+        with state_path.open("r") as file:
+            return [ModuleState(object_id=x["object_id"],\
+                                object_schema=x["object_schema"],\
+                                object_name=x["object_name"],\
+                                object_type=ObjectType(x["object_type"]),\
+                                modify_date=x["modify_date"]) for x in json.load(file)]
+    except (ValueError,KeyError,TypeError):
+        return None
+
+def save_module_state(state_path:Path,module_states:List[ModuleState]):
+
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+
+    temp_path = state_path.with_name(state_path.name+".tmp")
+
+    with temp_path.open("w") as file:
+        json.dump([{"object_id":x.object_id,\
+                    "object_schema":x.object_schema,\
+                    "object_name":x.object_name,\
+                    "object_type":x.object_type.value,\
+                    "modify_date":x.modify_date} for x in module_states],file)
+
+    #replace the old state only once the new one is completely written
+    temp_path.replace(state_path)
+
+def diff_module_state(previous_states:Optional[List[ModuleState]],\
+                      current_states:List[ModuleState])->Tuple[List[ModuleState],List[ModuleState]]:
+    """
+    Return (changed,dropped).
+    changed are the current modules which are new or modified since the previous state.
+    dropped are the previous modules whose file no longer exist under the same name.
+    A renamed module is both dropped (old name) and changed (new name)
+    """
+
+    if previous_states is None:
+        return (list(current_states),list())
+
+    previous:Dict[int,ModuleState] = {x.object_id:x for x in previous_states}
+
+    current:Dict[int,ModuleState] = {x.object_id:x for x in current_states}
+
+    changed = [x for x in current_states if previous.get(x.object_id)!=x]
+
+    dropped = [x for x in previous_states if x.object_id not in current or\
+               not is_same_module_file(x,current[x.object_id])]
+
+    return (changed,dropped)
+
+def is_same_module_file(x:ModuleState,y:ModuleState)->bool:
+
+    return x.object_schema==y.object_schema and\
+        x.object_name==y.object_name and\
+        x.object_type==y.object_type
+
+def is_module_match(object_filter:ObjectFilter,module_state:ModuleState)->bool:
+
+    return is_type_match(object_filter=object_filter,object_type=module_state.object_type) and\
+        is_object_match(object_filter=object_filter,object_schema=module_state.object_schema,object_name=module_state.object_name)
@@ -0,0 +1,140 @@
+"""
+Object inventory without definitions. The views, functions and procedures are listed from sys.objects alone
+and each handle fetch its definition only when it is accessed, together with the next handles of the listing
+so touching many handles costs one round trip per batch
+"""
+import threading
+from typing import List,Dict,Optional
+from model import DatabaseObject,ModuleState,ObjectFilter
+from objectfilter import is_type_match
+from provider import CatalogProvider
+from config import MODULE_BATCH_SIZE
+
+
+class ObjectHandle:
+    """
+    Schema, name, type and last modification of an object. object_definition is fetched on first access
+    """
+
+    __slots__ = ("module_state","loader","definition","is_loaded")
+
+    def __init__(self,module_state:ModuleState,loader:"DefinitionLoader"):
+
+        self.module_state = module_state
+
+        self.loader = loader
+
+        self.definition:Optional[str] = None
+
+        self.is_loaded = False
+
+    @property
+    def object_schema(self)->str:
+        return self.module_state.object_schema
+
+    @property
+    def object_name(self)->str:
+        return self.module_state.object_name
+
+    @property
+    def object_type(self):
+        return self.module_state.object_type
+
+    @property
+    def modify_date(self)->str:
+        return self.module_state.modify_date
+
+    @property
+    def object_definition(self)->Optional[str]:
+        """
+        None when the object was dropped since it was listed or its definition is encrypted
+        """
+
+        if not self.is_loaded:
+            self.loader.load(handle=self)
+
+        return self.definition
+
+    def get_database_object(self)->DatabaseObject:
+
+        return DatabaseObject(object_schema=self.object_schema,\
+                              object_name=self.object_name,\
+                              object_definition=self.object_definition,\
+                              object_type=self.object_type)
+
+class DefinitionLoader:
+    """
+    Fetch the definitions of the handles of a listing by batches of prefetch_size handles, in listing order
+    """
+
+    def __init__(self,provider:CatalogProvider,prefetch_size:int=MODULE_BATCH_SIZE):
+
+        self.provider = provider
+
+        self.prefetch_size = prefetch_size
+
+        self.handles:List[ObjectHandle] = list()
+
+        self.handle_index:Dict[int,int] = dict()
+
+        self.batch_count = 0
+
+        self.lock = threading.Lock()
+
+    def add(self,module_state:ModuleState)->ObjectHandle:
+
+        handle = ObjectHandle(module_state=module_state,loader=self)
+
+        self.handle_index[module_state.object_id] = len(self.handles)
+
+        self.handles.append(handle)
+
+        return handle
+
+    def load(self,handle:ObjectHandle):
+        """
+        Fetch the definition of the handle and of the next handles not loaded yet, prefetch_size handles in one round trip
+        """
+
+        with self.lock:
+
+            if handle.is_loaded:
+                return
+
+            start_index = self.handle_index[handle.module_state.object_id]
+
+            batch_handles:List[ObjectHandle] = list()
+
+            for batch_handle in self.handles[start_index:]:
+
+                if len(batch_handles)>=self.prefetch_size:
+                    break
+
+                if not batch_handle.is_loaded:
+                    batch_handles.append(batch_handle)
+
+            definitions = {(x.object_type,x.object_schema,x.object_name):x.object_definition\
+                           for x in self.provider.get_module_object(module_states=[y.module_state for y in batch_handles])}
+
+            for batch_handle in batch_handles:
+
+                batch_handle.definition = definitions.get((batch_handle.object_type,batch_handle.object_schema,batch_handle.object_name))
+
+                batch_handle.is_loaded = True
+
+            self.batch_count+=1
+
+def list_object(provider:CatalogProvider,\
+                object_filter:Optional[ObjectFilter]=None,\
+                prefetch_size:int=MODULE_BATCH_SIZE)->List[ObjectHandle]:
+    """
+    Return a handle for every view, function and procedure matching the filter, without fetching any definition
+    """
+
+    if object_filter is None:
+        object_filter = ObjectFilter()
+
+    loader = DefinitionLoader(provider=provider,prefetch_size=prefetch_size)
+
+    return [loader.add(module_state=x) for x in provider.get_module_state(object_filter=object_filter)\
+            if is_type_match(object_filter=object_filter,object_type=x.object_type)]
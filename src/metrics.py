@@ -0,0 +1,133 @@
+"""
+Per phase metrics of an extraction run, saved as a JSON run report and optionally as a Prometheus textfile
+"""
+import os
+import json
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import List,Iterator,Iterable,Sequence
+from model import CategoryMetrics,RunMetrics
+
+
+def measure_rows(rows:Iterable[Sequence],category_metrics:CategoryMetrics)->Iterator[Sequence]:
+    """
+    Yield the rows unchanged while counting them and the time spent fetching them
+    """
+
+    iterator = iter(rows)
+
+    while True:
+
+        start_time = time.perf_counter()
+
+        try:
+            row = next(iterator)
+        except StopIteration:
+            category_metrics.fetch_duration+=time.perf_counter()-start_time
+            return
+
+        duration = time.perf_counter()-start_time
+
+        if category_metrics.row_count==0:
+            category_metrics.query_duration = duration
+
+        category_metrics.fetch_duration+=duration
+
+        category_metrics.row_count+=1
+
+        yield row
+
+def save_run_report(report_path:Path,run_metrics:RunMetrics):
+
+    report_path.parent.mkdir(parents=True,exist_ok=True)
+
+    temp_path = report_path.with_name(report_path.name+".tmp")
+
+    with open(temp_path,"w") as file:
+        json.dump(asdict(run_metrics),file,indent=4)
+
+    os.replace(temp_path,report_path)
+
+def get_label_value(value:str)->str:
+
+    return value.replace("\\","\\\\").replace("\"","\\\"").replace("\n","\\n")
+
+def format_prometheus_metrics(run_metrics:RunMetrics)->str:
+    """
+    Render the metrics in the Prometheus text exposition format, every sample labelled by remote (and category)
+    """
+
+    remote_label = f"remote=\"{get_label_value(run_metrics.remote_name)}\""
+
+    lines:List[str] = list()
+
+    def add_metric(name:str,help_text:str,samples:List[tuple]):
+
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+
+        for labels,value in samples:
+            lines.append(f"{name}{{{labels}}} {value}")
+
+    def add_run_metric(name:str,help_text:str,value):
+
+        if value is not None:
+            add_metric(name=name,help_text=help_text,samples=[(remote_label,value)])
+
+    def add_category_metric(name:str,help_text:str,value_func):
+
+        add_metric(name=name,\
+                   help_text=help_text,\
+                   samples=[(f"{remote_label},category=\"{get_label_value(x.category)}\"",value_func(x)) for x in run_metrics.categories])
+
+    def add_queue_metric(name:str,help_text:str,value_func):
+
+        add_metric(name=name,\
+                   help_text=help_text,\
+                   samples=[(f"{remote_label},queue=\"{get_label_value(x.name)}\"",value_func(x)) for x in run_metrics.queues])
+
+    write_stats = run_metrics.write_stats
+
+    add_run_metric("dos_run_success","1 when the last run succeeded",int(run_metrics.is_success))
+    add_run_metric("dos_run_duration_seconds","Duration of the last run",round(run_metrics.duration,6))
+    add_run_metric("dos_run_timestamp_seconds","Time the last run finished",round(time.time(),3))
+    add_run_metric("dos_connect_duration_seconds","Duration of the connection test",round(run_metrics.connect_duration,6))
+    add_run_metric("dos_connections_opened","Number of database connections opened",run_metrics.connection_count)
+    add_run_metric("dos_cached_queries","Number of catalog queries read from the cache",run_metrics.cached_query_count)
+    add_run_metric("dos_peak_memory_bytes","Peak resident memory of the process",run_metrics.peak_memory)
+    add_category_metric("dos_category_success","1 when the category was completely extracted",lambda x:int(x.is_success))
+    add_category_metric("dos_category_duration_seconds","Duration of the category extraction",lambda x:round(x.duration,6))
+    add_category_metric("dos_category_query_duration_seconds","Time until the first row of the category",lambda x:round(x.query_duration,6))
+    add_category_metric("dos_category_fetch_duration_seconds","Time spent fetching the rows of the category",lambda x:round(x.fetch_duration,6))
+    add_category_metric("dos_category_render_duration_seconds","Time spent rendering the objects of the category",lambda x:round(x.render_duration,6))
+    add_category_metric("dos_category_rows","Number of rows fetched",lambda x:x.row_count)
+    add_category_metric("dos_category_objects","Number of objects produced",lambda x:x.object_count)
+    add_category_metric("dos_category_bytes","Size of the object definitions produced",lambda x:x.definition_bytes)
+    add_queue_metric("dos_queue_max_depth","Maximum number of items in the pipeline queue",lambda x:x.max_depth)
+    add_queue_metric("dos_queue_mean_depth","Mean number of items in the pipeline queue",lambda x:round(x.mean_depth,3))
+    add_queue_metric("dos_queue_put_wait_seconds","Time the producers waited for room in the queue (its consumer is the bottleneck)",lambda x:round(x.put_wait_duration,6))
+    add_queue_metric("dos_queue_get_wait_seconds","Time the consumer waited for items in the queue (its producer is the bottleneck)",lambda x:round(x.get_wait_duration,6))
+    add_run_metric("dos_write_duration_seconds","Duration of the object file writing",round(write_stats.duration,6))
+    add_run_metric("dos_written_files","Number of files written",write_stats.written_count)
+    add_run_metric("dos_unchanged_files","Number of files left unchanged",write_stats.unchanged_count)
+    add_run_metric("dos_deleted_files","Number of files deleted",write_stats.deleted_count)
+    add_run_metric("dos_written_bytes","Number of bytes written",write_stats.written_bytes)
+
+    return "\n".join(lines)+"\n"
+
+def save_prometheus_textfile(prometheus_dir:str,run_metrics:RunMetrics):
+    """
+    Save the metrics as <prometheus_dir>/dos_<remote>.prom, replaced atomically as the textfile collector may read it at any time
+    """
+
+    textfile_path = Path(prometheus_dir)/f"dos_{run_metrics.remote_name}.prom"
+
+    textfile_path.parent.mkdir(parents=True,exist_ok=True)
+
+    temp_path = textfile_path.with_name(textfile_path.name+".tmp")
+
+    with open(temp_path,"w") as file:
+        file.write(format_prometheus_metrics(run_metrics=run_metrics))
+
+    os.replace(temp_path,textfile_path)
@@ -1,5 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass,field
 from enum import Enum
+from typing import List,Optional
+from config import WRITE_JOBS,WRITE_QUEUE_DEPTH,GIT_BRANCH,CACHE_TTL
+from config import MODULE_BATCH_SIZE,MODULE_BATCH_BYTES,FETCH_RETRY_COUNT,FETCH_RETRY_DELAY
 
 class ObjectType(str,Enum):
     TABLE="table",
@@ -20,6 +23,16 @@ class DatabaseObject:
     object_type:ObjectType
 
 @dataclass
+class ModuleState:
+    object_id:int
+    object_schema:str
+    object_name:str
+    object_type:ObjectType
+    modify_date:str
+    #size in bytes of the definition of a view, function or procedure, None when unknown. Not part of the state compared by incremental runs
+    definition_length:Optional[int] = field(default=None,compare=False)
+
+@dataclass(slots=True)
 class TableInfo:
     table_schema:str
     table_name:str
@@ -30,7 +43,7 @@ class TableInfo:
     ordinal_position:int
 
 
-@dataclass
+@dataclass(slots=True)
 class IndexInfo:
     index_schema:str
     table_name:str
@@ -58,6 +71,162 @@ class ConnectionInfo:
 
 
 @dataclass
+class ConnectionStats:
+    connection_count:int=0
+
+
+@dataclass
+class WriteStats:
+    written_count:int=0
+    unchanged_count:int=0
+    deleted_count:int=0
+    written_bytes:int=0
+    duration:float=0
+
+
+@dataclass
+class WriteOptions:
+    write_jobs:int=WRITE_JOBS
+    queue_depth:int=WRITE_QUEUE_DEPTH
+    fsync:bool=False
+
+
+@dataclass
+class FetchOptions:
+    """
+    Batches of module definitions: at most batch_size objects and batch_bytes bytes per round trip,
+    each batch fetched up to retry_count more times when the connection fail
+    """
+    batch_size:int=MODULE_BATCH_SIZE
+    batch_bytes:int=MODULE_BATCH_BYTES
+    retry_count:int=FETCH_RETRY_COUNT
+    retry_delay:float=FETCH_RETRY_DELAY
+
+
+@dataclass
+class ObjectFilter:
+    """
+    Empty lists and a None pattern do not filter anything.
+    name_pattern is matched against the object name with * and ? wildcards
+    """
+    include_schemas:List[str]=field(default_factory=list)
+    exclude_schemas:List[str]=field(default_factory=list)
+    name_pattern:Optional[str]=None
+    object_types:List[ObjectType]=field(default_factory=list)
+
+
+@dataclass
+class ExtractOptions:
+    jobs:int=1
+    incremental:bool=False
+    server_render:bool=False
+    prometheus_dir:Optional[str]=None
+    pack:bool=False
+    git_dir:Optional[str]=None
+    git_branch:str=GIT_BRANCH
+    cache_dir:Optional[str]=None
+    cache_ttl:int=CACHE_TTL
+    object_filter:ObjectFilter=field(default_factory=ObjectFilter)
+    fetch_options:FetchOptions=field(default_factory=FetchOptions)
+    write_options:WriteOptions=field(default_factory=WriteOptions)
+
+
+@dataclass
+class CategoryMetrics:
+    """
+    Durations are in seconds. query_duration is the time until the first row,
+    render_duration excludes the time spent fetching rows and waiting for the writer
+    """
+    category:str
+    is_success:bool=False
+    duration:float=0
+    query_duration:float=0
+    fetch_duration:float=0
+    render_duration:float=0
+    write_wait_duration:float=0
+    row_count:int=0
+    object_count:int=0
+    definition_bytes:int=0
+
+
+@dataclass
+class QueueStats:
+    """
+    Bounded queue of batches between two pipeline stages. put_wait_duration is the time producers waited for room (the consumer is slower),
+    get_wait_duration the time the consumer waited for items (the producer is slower)
+    """
+    name:str
+    capacity:int
+    item_count:int=0
+    max_depth:int=0
+    mean_depth:float=0
+    put_wait_duration:float=0
+    get_wait_duration:float=0
+
+
+@dataclass
+class WatchStats:
+    """
+    Durations are in seconds. poll_duration is the time spent reading the change marker,
+    sync_count the polls which found a change and sync_duration the time spent writing those changes
+    """
+    poll_count:int=0
+    poll_duration:float=0
+    max_poll_duration:float=0
+    failed_poll_count:int=0
+    sync_count:int=0
+    sync_duration:float=0
+    written_count:int=0
+    deleted_count:int=0
+
+
+@dataclass
+class ApplyStats:
+    wave_count:int=0
+    object_count:int=0
+    applied_count:int=0
+    failed_count:int=0
+    batch_count:int=0
+    duration:float=0
+
+
+@dataclass
+class ApplyFailure:
+    object_file:str
+    error:str
+
+
+@dataclass
+class RunMetrics:
+    remote_name:str
+    started_at:str
+    is_success:bool=False
+    duration:float=0
+    connect_duration:float=0
+    connection_count:Optional[int]=None
+    cached_query_count:Optional[int]=None
+    peak_memory:Optional[int]=None
+    categories:List[CategoryMetrics]=field(default_factory=list)
+    queues:List[QueueStats]=field(default_factory=list)
+    write_stats:WriteStats=field(default_factory=WriteStats)
+
+
+@dataclass
+class FleetEntry:
+    remote_name:str
+    database_uri:str
+
+
+@dataclass
+class FleetResult:
+    remote_name:str
+    host:str
+    is_success:bool
+    duration:float
+    log:str
+
+
+@dataclass(slots=True)
 class ExtTableInfo:
     external_table_schema:str
     external_table_name:str
@@ -70,3 +239,14 @@ class ExtTableInfo:
     external_data_source_name:str
     file_format_name:str
 
+
+
+@dataclass
+class ObjectTypeDiff:
+    """
+    Object files (relative to the remote folder) of a type which differ between two remotes
+    """
+    object_type:ObjectType
+    added:List[str]=field(default_factory=list)
+    removed:List[str]=field(default_factory=list)
+    changed:List[str]=field(default_factory=list)
@@ -0,0 +1,77 @@
+"""
+Schema, name and object type filters. Catalog queries apply them on the server,
+the functions below apply the same rules to what is already on the client (snapshot rows, files of the previous run).
+Like the default SQL Server collation, names are compared case-insensitively
+"""
+from fnmatch import fnmatchcase
+from typing import Optional
+from model import ObjectFilter,ObjectType
+from writer import parse_database_object_file
+
+
+def is_filtered(object_filter:ObjectFilter)->bool:
+
+    return len(object_filter.include_schemas)>0 or\
+        len(object_filter.exclude_schemas)>0 or\
+        object_filter.name_pattern is not None or\
+        len(object_filter.object_types)>0
+
+def is_type_match(object_filter:ObjectFilter,object_type:ObjectType)->bool:
+
+    return len(object_filter.object_types)==0 or object_type in object_filter.object_types
+
+def is_object_match(object_filter:ObjectFilter,object_schema:Optional[str],object_name:str)->bool:
+    """
+    Objects without schema (external data sources and file formats) are only filtered by name
+    """
+
+    if object_schema is not None:
+
+        object_schema = object_schema.lower()
+
+        if len(object_filter.include_schemas)>0 and object_schema not in (x.lower() for x in object_filter.include_schemas):
+            return False
+
+        if object_schema in (x.lower() for x in object_filter.exclude_schemas):
+            return False
+
+    if object_filter.name_pattern is not None:
+        #[ is a literal character in the name pattern, as in get_like_pattern
+        return fnmatchcase(object_name.lower(),object_filter.name_pattern.lower().replace("[","[[]"))
+
+    return True
+
+def get_like_pattern(name_pattern:str)->str:
+    """
+    Translate the * and ? wildcards to a LIKE pattern escaped with \\
+    """
+
+    like_pattern = ""
+
+    for character in name_pattern:
+
+        if character=="*":
+            like_pattern+="%"
+        elif character=="?":
+            like_pattern+="_"
+        elif character in "%_[\\":
+            like_pattern+="\\"+character
+        else:
+            like_pattern+=character
+
+    return like_pattern
+
+def is_object_file_match(object_filter:ObjectFilter,object_file:str)->bool:
+    """
+    Whether the object saved in the file (path relative to the remote folder) match the filter
+    """
+
+    parsed_file = parse_database_object_file(object_file=object_file)
+
+    if parsed_file is None:
+        return False
+
+    object_schema,object_name,object_type = parsed_file
+
+    return is_type_match(object_filter=object_filter,object_type=object_type) and\
+        is_object_match(object_filter=object_filter,object_schema=object_schema,object_name=object_name)
@@ -0,0 +1,385 @@
+"""
+Packed output: every definition of a remote in a single file instead of one file per object.
+The pack is PACK_MAGIC followed by records made of the key length, the definition length (4 bytes each), the key and the definition.
+The key of an object is its file path in the directory layout (e.g. table/dbo.customer.sql).
+The index is an open addressing hash table of the keys, memory-mapped so an object is found in O(1) without reading the pack:
+PACK_INDEX_MAGIC, the size of the pack it indexes and the slot count (8 bytes each),
+then the slots made of the key hash and the record offset (8 bytes each, an offset of 0 is an empty slot)
+"""
+import os
+import mmap
+import struct
+import hashlib
+import threading
+import time
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import List,Dict,Tuple,Optional,Iterator,Callable,Set
+from model import DatabaseObject,ObjectType,WriteStats,WriteOptions
+from config import PACK_FILE,PACK_INDEX_FILE,PACK_MAGIC,PACK_INDEX_MAGIC
+from writer import DatabaseObjectWriter,get_database_object_file,parse_database_object_file
+
+RECORD_HEADER = struct.Struct("<II")
+
+INDEX_HEADER = struct.Struct("<QQ")
+
+INDEX_SLOT = struct.Struct("<QQ")
+
+def get_key_hash(key:str)->int:
+    """
+    Stable 64 bits hash of a key (the built-in hash change between processes)
+    """
+
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"),digest_size=8).digest(),"little")
+
+def get_slot_count(key_count:int)->int:
+    """
+    Power of two keeping the table at most half full
+    """
+
+    slot_count = 1
+
+    while slot_count<key_count*2:
+        slot_count*=2
+
+    return slot_count
+
+def build_index(entries:Dict[str,Tuple[int,int]],pack_size:int)->bytes:
+    """
+    entries map each key to its hash and record offset
+    """
+
+    slot_count = get_slot_count(key_count=len(entries))
+
+    slots = [(0,0)]*slot_count
+
+    for key_hash,offset in entries.values():
+
+        slot = key_hash&(slot_count-1)
+
+        while slots[slot][1]!=0:
+            slot = (slot+1)&(slot_count-1)
+
+        slots[slot] = (key_hash,offset)
+
+    return b"".join([PACK_INDEX_MAGIC,INDEX_HEADER.pack(pack_size,slot_count)]+[INDEX_SLOT.pack(*x) for x in slots])
+
+class PackReader:
+    """
+    Read the objects of a pack through its memory-mapped index. Raise ValueError when the files are not a valid pack
+    """
+
+    def __init__(self,pack_path:Path,index_path:Path):
+
+        self.pack_file = open(pack_path,"rb")
+
+        self.index_file = open(index_path,"rb")
+
+        try:
+            self.pack = mmap.mmap(self.pack_file.fileno(),0,access=mmap.ACCESS_READ)
+
+            self.index = mmap.mmap(self.index_file.fileno(),0,access=mmap.ACCESS_READ)
+
+            if self.pack[:len(PACK_MAGIC)]!=PACK_MAGIC or self.index[:len(PACK_INDEX_MAGIC)]!=PACK_INDEX_MAGIC:
+                raise ValueError(f"{pack_path} is not a pack")
+
+            pack_size,self.slot_count = INDEX_HEADER.unpack_from(self.index,len(PACK_INDEX_MAGIC))
+
+            if pack_size!=len(self.pack):
+                raise ValueError(f"{index_path} does not index {pack_path}")
+        except:
+            self.close()
+            raise
+
+        self.slot_start = len(PACK_INDEX_MAGIC)+INDEX_HEADER.size
+
+    @staticmethod
+    def open(remote_dir:Path)->Optional["PackReader"]:
+        """
+        Return the reader of the pack of a remote folder or None when there is no pack
+        """
+
+        pack_path = remote_dir/PACK_FILE
+
+        index_path = remote_dir/PACK_INDEX_FILE
+
+        if not pack_path.is_file() or not index_path.is_file():
+            return None
+
+        return PackReader(pack_path=pack_path,index_path=index_path)
+
+    def read_record(self,offset:int)->Tuple[str,bytes]:
+
+        key_length,data_length = RECORD_HEADER.unpack_from(self.pack,offset)
+
+        key_start = offset+RECORD_HEADER.size
+
+        data_start = key_start+key_length
+
+        return (self.pack[key_start:data_start].decode("utf-8"),self.pack[data_start:data_start+data_length])
+
+    def find_offset(self,key:str)->Optional[int]:
+
+        key_hash = get_key_hash(key=key)
+
+        slot = key_hash&(self.slot_count-1)
+
+        while True:
+
+            slot_hash,offset = INDEX_SLOT.unpack_from(self.index,self.slot_start+slot*INDEX_SLOT.size)
+
+            if offset==0:
+                return None
+
+            if slot_hash==key_hash and self.read_record(offset=offset)[0]==key:
+                return offset
+
+            slot = (slot+1)&(self.slot_count-1)
+
+    def get_data(self,key:str)->Optional[bytes]:
+
+        offset = self.find_offset(key=key)
+
+        if offset is None:
+            return None
+
+        return self.read_record(offset=offset)[1]
+
+    def get_definition(self,key:str)->Optional[str]:
+
+        data = self.get_data(key=key)
+
+        if data is None:
+            return None
+
+        return data.decode("utf-8")
+
+    def iter_record(self)->Iterator[Tuple[str,bytes]]:
+        """
+        Yield the key and definition of every object in pack order
+        """
+
+        #a key written twice is only indexed at its last record
+        indexed_offsets = {x[1] for x in INDEX_SLOT.iter_unpack(self.index[self.slot_start:])}
+
+        offset = len(PACK_MAGIC)
+
+        while offset<len(self.pack):
+
+            key,data = self.read_record(offset=offset)
+
+            if offset in indexed_offsets:
+                yield (key,data)
+
+            offset+=RECORD_HEADER.size+len(key.encode("utf-8"))+len(data)
+
+    def iter_key(self)->Iterator[str]:
+
+        for key,_ in self.iter_record():
+            yield key
+
+    def close(self):
+
+        for mapped in [getattr(self,"pack",None),getattr(self,"index",None)]:
+            if mapped is not None:
+                mapped.close()
+
+        self.pack_file.close()
+        self.index_file.close()
+
+class PackWriter:
+    """
+    Write the objects of a run into a new pack replacing the previous one at close.
+    Same interface as DatabaseObjectWriter: objects of the previous pack that are kept, out of scope
+    or not extracted by a failed run are copied into the new pack
+    """
+
+    def __init__(self,root_dir:str,remote_name:str,write_options:Optional[WriteOptions]=None):
+
+        self.write_options = write_options if write_options is not None else WriteOptions()
+
+        self.remote_dir = Path(root_dir)/remote_name
+
+        self.remote_dir.mkdir(parents=True,exist_ok=True)
+
+        self.pack_path = self.remote_dir/PACK_FILE
+
+        self.index_path = self.remote_dir/PACK_INDEX_FILE
+
+        self.previous_pack = PackReader.open(remote_dir=self.remote_dir)
+
+        self.temp_pack_path = self.pack_path.with_name(self.pack_path.name+".tmp")
+
+        self.pack_file = open(self.temp_pack_path,"wb")
+
+        self.pack_file.write(PACK_MAGIC)
+
+        self.pack_size = len(PACK_MAGIC)
+
+        #key -> (key hash,record offset)
+        self.entries:Dict[str,Tuple[int,int]] = dict()
+
+        self.deleted_files:Set[str] = set()
+
+        self.lock = threading.Lock()
+
+        self.stats = WriteStats()
+
+        self.start_time = time.perf_counter()
+
+    def append_record(self,key:str,data:bytes):
+
+        key_bytes = key.encode("utf-8")
+
+        with self.lock:
+
+            self.pack_file.write(RECORD_HEADER.pack(len(key_bytes),len(data)))
+            self.pack_file.write(key_bytes)
+            self.pack_file.write(data)
+
+            self.entries[key] = (get_key_hash(key=key),self.pack_size)
+
+            self.pack_size+=RECORD_HEADER.size+len(key_bytes)+len(data)
+
+            self.stats.written_bytes+=RECORD_HEADER.size+len(key_bytes)+len(data)
+
+    def write(self,database_object:DatabaseObject):
+
+        key = get_database_object_file(object_schema=database_object.object_schema,\
+                                       object_name=database_object.object_name,\
+                                       object_type=database_object.object_type)
+
+        data = database_object.object_definition.encode("utf-8")
+
+        is_unchanged = self.previous_pack is not None and self.previous_pack.get_data(key=key)==data
+
+        self.append_record(key=key,data=data)
+
+        with self.lock:
+            if is_unchanged:
+                self.stats.unchanged_count+=1
+            else:
+                self.stats.written_count+=1
+
+    def copy_previous(self,key:str):
+
+        data = self.previous_pack.get_data(key=key) if self.previous_pack is not None else None
+
+        if data is not None:
+            self.append_record(key=key,data=data)
+
+    def keep(self,object_schema:Optional[str],object_name:str,object_type:ObjectType):
+
+        self.copy_previous(key=get_database_object_file(object_schema=object_schema,\
+                                                        object_name=object_name,\
+                                                        object_type=object_type))
+
+    def delete(self,object_schema:Optional[str],object_name:str,object_type:ObjectType):
+
+        with self.lock:
+            self.deleted_files.add(get_database_object_file(object_schema=object_schema,\
+                                                            object_name=object_name,\
+                                                            object_type=object_type))
+
+            self.stats.deleted_count+=1
+
+    def close(self,delete_stale:bool=True,is_in_scope:Optional[Callable[[str],bool]]=None):
+        """
+        Carry over the objects of the previous pack neither written nor kept (unless they are stale),
+        then replace the previous pack and index
+        """
+
+        try:
+            if self.previous_pack is not None:
+
+                for key in list(self.previous_pack.iter_key()):
+
+                    if key in self.entries or key in self.deleted_files:
+                        continue
+
+                    if delete_stale and (is_in_scope is None or is_in_scope(key)):
+                        self.stats.deleted_count+=1
+                    else:
+                        self.copy_previous(key=key)
+
+                self.previous_pack.close()
+
+            index = build_index(entries=self.entries,pack_size=self.pack_size)
+
+            self.pack_file.flush()
+
+            if self.write_options.fsync:
+                os.fsync(self.pack_file.fileno())
+        finally:
+            self.pack_file.close()
+
+        temp_index_path = self.index_path.with_name(self.index_path.name+".tmp")
+
+        with open(temp_index_path,"wb") as file:
+
+            file.write(index)
+
+            if self.write_options.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+
+        #the index record the pack size, so a pack replaced without its index is detected
+        os.replace(self.temp_pack_path,self.pack_path)
+        os.replace(temp_index_path,self.index_path)
+
+        self.stats.duration = time.perf_counter()-self.start_time
+
+def extract_pack_object(pack_reader:PackReader,pattern:str,target_dir:str)->int:
+    """
+    Write the objects whose key match the pattern (* and ? wildcards) as <target_dir>/<key>. Return the number of objects
+    """
+
+    object_count = 0
+
+    for key,data in pack_reader.iter_record():
+
+        if not fnmatchcase(key,pattern):
+            continue
+
+        object_path = Path(target_dir)/key
+
+        object_path.parent.mkdir(parents=True,exist_ok=True)
+
+        object_path.write_bytes(data)
+
+        object_count+=1
+
+    return object_count
+
+def export_pack(pack_reader:PackReader,root_dir:str,remote_name:str,write_options:Optional[WriteOptions]=None)->WriteStats:
+    """
+    Write every object of a pack into the directory layout of <root_dir>/<remote>, with its manifest,
+    as a run without pack would have
+    """
+
+    database_object_writer = DatabaseObjectWriter(root_dir=root_dir,\
+                                                  remote_name=remote_name,\
+                                                  write_options=write_options)
+
+    try:
+        for key,data in pack_reader.iter_record():
+
+            object_file = parse_database_object_file(object_file=key)
+
+            if object_file is None:
+                continue
+
+            object_schema,object_name,object_type = object_file
+
+            database_object_writer.write(DatabaseObject(object_schema=object_schema,\
+                                                        object_name=object_name,\
+                                                        object_type=object_type,\
+                                                        object_definition=data.decode("utf-8")))
+    except:
+        #files missing from a partial export are not stale
+        database_object_writer.close(delete_stale=False)
+        raise
+
+    database_object_writer.close()
+
+    return database_object_writer.stats
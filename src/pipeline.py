@@ -0,0 +1,205 @@
+"""
+Stages of the extraction pipeline. For each category a fetch stage streams the rows from the provider
+and a render stage turns them into objects, while a single write stage hands every object to the writer.
+Each stage runs in its own thread and stages are connected by bounded queues, so network waits, rendering
+and writing overlap and a slow stage pauses the stages before it
+"""
+import time
+import queue
+import threading
+from typing import List,Iterator,Iterable,Sequence,Callable,Optional,Any
+from model import DatabaseObject,CategoryMetrics,QueueStats
+from metrics import measure_rows
+from config import FETCH_BATCH_SIZE,OBJECT_BATCH_SIZE
+
+#last item of a queue
+END_OF_QUEUE = object()
+
+#how often a stage blocked on a queue checks whether the pipeline was stopped, in seconds
+QUEUE_POLL_INTERVAL = 0.1
+
+class PipelineStopped(Exception):
+    """
+    Raised in a stage blocked on a queue when another stage failed
+    """
+
+class StageQueue:
+    """
+    Bounded queue recording its depth and the time its producers and consumer waited
+    """
+
+    def __init__(self,name:str,capacity:int,stop_event:threading.Event):
+
+        self.queue = queue.Queue(maxsize=capacity)
+
+        self.stop_event = stop_event
+
+        self.stats = QueueStats(name=name,capacity=capacity)
+
+        self.depth_sum = 0
+
+        self.lock = threading.Lock()
+
+    def put(self,item:Any):
+
+        start_time = time.perf_counter()
+
+        while True:
+
+            if self.stop_event.is_set():
+                raise PipelineStopped()
+
+            try:
+                self.queue.put(item,timeout=QUEUE_POLL_INTERVAL)
+                break
+            except queue.Full:
+                pass
+
+        if item is END_OF_QUEUE:
+            return
+
+        depth = self.queue.qsize()
+
+        with self.lock:
+            self.stats.put_wait_duration+=time.perf_counter()-start_time
+
+            self.stats.item_count+=1
+
+            self.stats.max_depth = max(self.stats.max_depth,depth)
+
+            self.depth_sum+=depth
+
+            self.stats.mean_depth = self.depth_sum/self.stats.item_count
+
+    def get(self)->Any:
+
+        start_time = time.perf_counter()
+
+        while True:
+
+            if self.stop_event.is_set():
+                raise PipelineStopped()
+
+            try:
+                item = self.queue.get(timeout=QUEUE_POLL_INTERVAL)
+                break
+            except queue.Empty:
+                pass
+
+        with self.lock:
+            self.stats.get_wait_duration+=time.perf_counter()-start_time
+
+        return item
+
+def iter_stage_queue(stage_queue:StageQueue)->Iterator[Any]:
+    """
+    Yield the items of the batches of a queue until its end, raise the error of the producer if any
+    """
+
+    while True:
+
+        item = stage_queue.get()
+
+        if item is END_OF_QUEUE:
+            return
+
+        if isinstance(item,BaseException):
+            raise item
+
+        yield from item
+
+def fetch_stage(fetch_func:Callable[[],Iterable[Sequence]],row_queue:StageQueue,category_metrics:CategoryMetrics):
+    """
+    Stream the rows of a category into the row queue by batches of FETCH_BATCH_SIZE rows
+    """
+
+    rows = None
+
+    batch:List[Sequence] = list()
+
+    try:
+        #inside the try, so an error raised before the first row also reach the render stage
+        rows = fetch_func()
+
+        for row in measure_rows(rows=rows,category_metrics=category_metrics):
+
+            batch.append(row)
+
+            if len(batch)>=FETCH_BATCH_SIZE:
+                row_queue.put(batch)
+
+                batch = list()
+
+        if len(batch)>0:
+            row_queue.put(batch)
+
+        row_queue.put(END_OF_QUEUE)
+    except PipelineStopped:
+        raise
+    except Exception as ex:
+        #the rows fetched before the error are rendered, then the render stage fail with the error of the fetch
+        if len(batch)>0:
+            row_queue.put(batch)
+
+        row_queue.put(ex)
+        raise
+    finally:
+        #release the connection of an interrupted result set
+        if hasattr(rows,"close"):
+            rows.close()
+
+def render_stage(render_func:Optional[Callable[[Iterable[Sequence]],Iterator[DatabaseObject]]],\
+                 row_queue:StageQueue,\
+                 object_queue:StageQueue,\
+                 category_metrics:CategoryMetrics):
+    """
+    Render the rows of the row queue (already objects when render_func is None) into the object queue.
+    The category is complete once all its objects are queued
+    """
+
+    start_time = time.perf_counter()
+
+    rows = iter_stage_queue(stage_queue=row_queue)
+
+    batch:List[DatabaseObject] = list()
+
+    def put_batch():
+
+        put_start_time = time.perf_counter()
+
+        object_queue.put(batch)
+
+        category_metrics.write_wait_duration+=time.perf_counter()-put_start_time
+
+    try:
+        for database_object in (rows if render_func is None else render_func(rows)):
+
+            category_metrics.object_count+=1
+            category_metrics.definition_bytes+=len(database_object.object_definition.encode("utf-8"))
+
+            batch.append(database_object)
+
+            if len(batch)>=OBJECT_BATCH_SIZE:
+                put_batch()
+
+                batch = list()
+    finally:
+        #the objects rendered before an error are written
+        if len(batch)>0:
+            put_batch()
+
+    category_metrics.duration = time.perf_counter()-start_time
+    category_metrics.render_duration = category_metrics.duration-category_metrics.write_wait_duration-row_queue.stats.get_wait_duration
+    category_metrics.is_success = True
+
+def write_stage(consume_func:Callable[[DatabaseObject],None],object_queue:StageQueue):
+    """
+    Consume the objects until the end of the queue. A failed write stop the queue, so the render stages fail too
+    """
+
+    try:
+        for database_object in iter_stage_queue(stage_queue=object_queue):
+            consume_func(database_object)
+    except:
+        object_queue.stop_event.set()
+        raise
@@ -0,0 +1,439 @@
+"""
+Sources of the catalog rows. Every provider return the rows of the CATALOG_QUERY queries in the shape the database return them,
+so the same renderers and writer run whether the rows come from the database or from a snapshot
+"""
+import json
+import time
+import hashlib
+import threading
+from dataclasses import asdict
+from pathlib import Path
+from typing import List,Dict,Tuple,Optional,Iterator,Iterable,Sequence
+from model import DatabaseObject,ModuleState,CategoryMetrics,ObjectFilter,FetchOptions
+from metrics import measure_rows
+from objectfilter import is_object_match
+from config import FETCH_BATCH_SIZE,OBJECT_FILTER_MARKER,GET_MODULE_PAGE_SQL,GET_MODULE_DEFINITION_SQL,CACHE_TTL,CACHE_FILE_SUFFIX
+from database import create_database_engine,test_connection,fetch_rows,fetch_module_rows,get_module_state,get_module_object,get_filtered_statement
+from database import get_object_state,get_change_marker
+from database import CATALOG_QUERY,CATALOG_OBJECT_FUNC,CATALOG_FILTER_INDEX,CATALOG_FILTER_COLUMN,MODULE_OBJECT_TYPE,MODULE_QUERY_TYPES
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+from snapshot import SnapshotReader,SnapshotWriter
+
+
+def filter_rows(rows:Iterable[Sequence],query_name:str,object_filter:ObjectFilter)->Iterator[Sequence]:
+    """
+    Apply the schema and name filters on the client
+    """
+
+    schema_index,name_index = CATALOG_FILTER_INDEX[query_name]
+
+    for row in rows:
+        if is_object_match(object_filter=object_filter,\
+                           object_schema=None if schema_index is None else row[schema_index],\
+                           object_name=row[name_index]):
+            yield row
+
+class CatalogProvider:
+    """
+    Interface of the catalog sources. fetch_rows is the only method a provider must implement,
+    incremental extraction also needs get_module_state and get_module_object, watch mode get_object_state and get_change_marker.
+    Rows and module states are restricted to the schema and name filters of object_filter if given
+    """
+
+    def test_connection(self)->bool:
+        return True
+
+    def has_query(self,query_name:str)->bool:
+        return True
+
+    def fetch_rows(self,query_name:str,object_filter:Optional[ObjectFilter]=None)->Iterator[Sequence]:
+        raise NotImplementedError()
+
+    def get_object(self,\
+                   query_name:str,\
+                   category_metrics:Optional[CategoryMetrics]=None,\
+                   object_filter:Optional[ObjectFilter]=None)->Iterator[DatabaseObject]:
+        """
+        Render the objects of a catalog query, counting its rows into category_metrics if given
+        """
+
+        rows = self.fetch_rows(query_name=query_name,object_filter=object_filter)
+
+        if category_metrics is not None:
+            rows = measure_rows(rows=rows,category_metrics=category_metrics)
+
+        return CATALOG_OBJECT_FUNC[query_name](rows)
+
+    def get_module_state(self,object_filter:Optional[ObjectFilter]=None)->List[ModuleState]:
+        raise NotImplementedError()
+
+    def get_module_object(self,module_states:List[ModuleState])->Iterator[DatabaseObject]:
+        raise NotImplementedError()
+
+    def get_object_state(self,object_filter:Optional[ObjectFilter]=None)->List[ModuleState]:
+        """
+        Last modification of the tables, external tables and modules
+        """
+        raise NotImplementedError()
+
+    def get_change_marker(self)->Tuple:
+        """
+        Small value which change whenever an object is created, altered or dropped
+        """
+        raise NotImplementedError()
+
+    def get_connection_count(self)->Optional[int]:
+        """
+        Number of connections opened so far or None when the provider does not connect to a database
+        """
+        return None
+
+    def close(self):
+        pass
+
+class DatabaseCatalogProvider(CatalogProvider):
+    """
+    Catalog rows queried from the database through a single shared engine.
+    The definitions of views, functions and procedures are fetched by keyset pagination in batches of fetch_options.
+    The filtered statements are built once and reused by every later query with the same filters
+    """
+
+    #object id and definition of the modules whose id is in :object_ids
+    module_definition_sql = GET_MODULE_DEFINITION_SQL
+
+    def __init__(self,connection_str:str,pool_size:int,fetch_options:Optional[FetchOptions]=None):
+
+        self.engine,self.connection_stats = create_database_engine(connection_str=connection_str,\
+                                                                   pool_size=pool_size)
+
+        self.fetch_options = fetch_options if fetch_options is not None else FetchOptions()
+
+        self.statement_cache:Dict[str,TextClause] = dict()
+
+    def test_connection(self)->bool:
+        return test_connection(engine=self.engine)
+
+    def get_module_page_statement(self,query_name:str,object_filter:Optional[ObjectFilter]):
+        """
+        Statement of the pages of the modules of a catalog query, see fetch_module_rows
+        """
+
+        schema_column,name_column = CATALOG_FILTER_COLUMN["GET_MODULE_PAGE_SQL"]
+
+        return get_filtered_statement(sql=GET_MODULE_PAGE_SQL,\
+                                      schema_column=schema_column,\
+                                      name_column=name_column,\
+                                      object_filter=object_filter,\
+                                      expanding_names=["object_types"],\
+                                      statement_cache=self.statement_cache)
+
+    def fetch_rows(self,query_name:str,object_filter:Optional[ObjectFilter]=None)->Iterator[Sequence]:
+
+        if query_name in MODULE_QUERY_TYPES:
+
+            page_statement,page_parameters = self.get_module_page_statement(query_name=query_name,object_filter=object_filter)
+
+            page_parameters["object_types"] = MODULE_QUERY_TYPES[query_name]
+
+            return fetch_module_rows(engine=self.engine,\
+                                     page_statement=page_statement,\
+                                     page_parameters=page_parameters,\
+                                     fetch_options=self.fetch_options,\
+                                     definition_sql=self.module_definition_sql)
+
+        return fetch_rows(engine=self.engine,query_name=query_name,object_filter=object_filter,statement_cache=self.statement_cache)
+
+    def get_module_state(self,object_filter:Optional[ObjectFilter]=None)->List[ModuleState]:
+        return get_module_state(engine=self.engine,object_filter=object_filter,statement_cache=self.statement_cache)
+
+    def get_module_object(self,module_states:List[ModuleState])->Iterator[DatabaseObject]:
+        return get_module_object(engine=self.engine,\
+                                 module_states=module_states,\
+                                 definition_sql=self.module_definition_sql,\
+                                 fetch_options=self.fetch_options)
+
+    def get_object_state(self,object_filter:Optional[ObjectFilter]=None)->List[ModuleState]:
+        return get_object_state(engine=self.engine,object_filter=object_filter,statement_cache=self.statement_cache)
+
+    def get_change_marker(self)->Tuple:
+        return get_change_marker(engine=self.engine)
+
+    def get_connection_count(self)->Optional[int]:
+        return self.connection_stats.connection_count
+
+    def close(self):
+        self.engine.dispose()
+
+class SqliteCatalogProvider(DatabaseCatalogProvider):
+    """
+    Catalog rows of a SQLite database made by fake.py, which has one table per catalog query.
+    Rows go through the same pooled engine, streaming and module pagination as a SQL Server database.
+    Only the modules have a last modification, so watch mode only see the changes of modules, external data sources and file formats
+    """
+
+    module_definition_sql = "SELECT * FROM \"GET_MODULE_DEFINITION_SQL\" WHERE c0 IN :object_ids"
+
+    #same columns as GET_CHANGE_MARKER_SQL, the external rows are concatenated instead of checksummed
+    change_marker_statement = text("SELECT (SELECT COUNT(*) FROM \"GET_MODULE_STATE_SQL\"),"+\
+                                   "(SELECT MAX(c4) FROM \"GET_MODULE_STATE_SQL\"),"+\
+                                   "(SELECT COUNT(*) FROM \"GET_EXTERNAL_DATA_SOURCE_SQL\"),"+\
+                                   "(SELECT group_concat(quote(c0)||quote(c1)||quote(c2)||quote(c3),',') FROM \"GET_EXTERNAL_DATA_SOURCE_SQL\"),"+\
+                                   "(SELECT COUNT(*) FROM \"GET_EXTERNAL_FILE_FORMAT_SQL\"),"+\
+                                   "(SELECT group_concat(quote(c0)||quote(c1)||quote(c2)||quote(c3)||quote(c4)||quote(c5),',') FROM \"GET_EXTERNAL_FILE_FORMAT_SQL\")")
+
+    def __init__(self,database_path:str,pool_size:int,fetch_options:Optional[FetchOptions]=None):
+
+        self.database_path = Path(database_path)
+
+        super().__init__(connection_str=f"sqlite:///{database_path}",pool_size=pool_size,fetch_options=fetch_options)
+
+    def test_connection(self)->bool:
+        #sqlite would create a missing database
+        return self.database_path.is_file() and super().test_connection()
+
+    def get_table_statement(self,query_name:str,object_filter:Optional[ObjectFilter]):
+        """
+        Select the rows of the table of the query, filtered on the columns holding the schema and name
+        """
+
+        schema_index,name_index = CATALOG_FILTER_INDEX[query_name]
+
+        return get_filtered_statement(sql=f"SELECT * FROM \"{query_name}\" WHERE 1=1\n{OBJECT_FILTER_MARKER}\nORDER BY rowid",\
+                                      schema_column=None if schema_index is None else f"c{schema_index}",\
+                                      name_column=f"c{name_index}",\
+                                      object_filter=object_filter,\
+                                      statement_cache=self.statement_cache)
+
+    def get_module_page_statement(self,query_name:str,object_filter:Optional[ObjectFilter]):
+
+        return get_filtered_statement(sql="SELECT state.c0,state.c1,state.c2,LENGTH(CAST(definition.c1 AS BLOB))\n"+\
+                                          "FROM \"GET_MODULE_STATE_SQL\" AS state\n"+\
+                                          "INNER JOIN \"GET_MODULE_DEFINITION_SQL\" AS definition ON state.c0 = definition.c0\n"+\
+                                          "WHERE state.c3 IN :object_types AND state.c0 > :last_object_id\n"+\
+                                          f"{OBJECT_FILTER_MARKER}\nORDER BY state.c0 LIMIT :page_size",\
+                                      schema_column="state.c1",\
+                                      name_column="state.c2",\
+                                      object_filter=object_filter,\
+                                      expanding_names=["object_types"],\
+                                      statement_cache=self.statement_cache)
+
+    def fetch_rows(self,query_name:str,object_filter:Optional[ObjectFilter]=None)->Iterator[Sequence]:
+
+        if query_name in MODULE_QUERY_TYPES:
+            return super().fetch_rows(query_name=query_name,object_filter=object_filter)
+
+        return self.fetch_table_rows(query_name=query_name,object_filter=object_filter)
+
+    def fetch_table_rows(self,query_name:str,object_filter:Optional[ObjectFilter])->Iterator[Sequence]:
+
+        statement,parameters = self.get_table_statement(query_name=query_name,object_filter=object_filter)
+
+        with self.engine.connect() as connection:
+            yield from connection.execution_options(yield_per=FETCH_BATCH_SIZE).execute(statement=statement,parameters=parameters)
+
+    def get_module_state(self,object_filter:Optional[ObjectFilter]=None)->List[ModuleState]:
+
+        statement,parameters = get_filtered_statement(sql="SELECT state.c0,state.c1,state.c2,state.c3,state.c4,LENGTH(CAST(definition.c1 AS BLOB))\n"+\
+                                                          "FROM \"GET_MODULE_STATE_SQL\" AS state\n"+\
+                                                          "LEFT JOIN \"GET_MODULE_DEFINITION_SQL\" AS definition ON state.c0 = definition.c0\n"+\
+                                                          f"WHERE 1=1\n{OBJECT_FILTER_MARKER}\nORDER BY state.rowid",\
+                                                      schema_column="state.c1",\
+                                                      name_column="state.c2",\
+                                                      object_filter=object_filter,\
+                                                      statement_cache=self.statement_cache)
+
+        with self.engine.connect() as connection:
+            result_set = connection.execute(statement=statement,parameters=parameters)
+
+            return [ModuleState(object_id=int(row[0]),\
+                                object_schema=row[1],\
+                                object_name=row[2],\
+                                object_type=MODULE_OBJECT_TYPE[row[3]],\
+                                modify_date=row[4],\
+                                definition_length=row[5]) for row in result_set]
+
+    def get_object_state(self,object_filter:Optional[ObjectFilter]=None)->List[ModuleState]:
+        return self.get_module_state(object_filter=object_filter)
+
+    def get_change_marker(self)->Tuple:
+
+        with self.engine.connect() as connection:
+            return tuple(connection.execute(statement=self.change_marker_statement).one())
+
+class SnapshotCatalogProvider(CatalogProvider):
+    """
+    Catalog rows read back from a snapshot, without any database
+    """
+
+    def __init__(self,snapshot_path:str):
+
+        self.snapshot_reader = SnapshotReader(snapshot_path=snapshot_path)
+
+    def has_query(self,query_name:str)->bool:
+        return query_name in self.snapshot_reader.get_query_names()
+
+    def fetch_rows(self,query_name:str,object_filter:Optional[ObjectFilter]=None)->Iterator[Sequence]:
+
+        rows = self.snapshot_reader.read_rows(query_name=query_name)
+
+        if object_filter is None:
+            return rows
+
+        return filter_rows(rows=rows,query_name=query_name,object_filter=object_filter)
+
+class CaptureCatalogProvider(CatalogProvider):
+    """
+    Save the rows fetched from another provider into a snapshot
+    """
+
+    def __init__(self,provider:CatalogProvider,snapshot_writer:SnapshotWriter):
+
+        self.provider = provider
+
+        self.snapshot_writer = snapshot_writer
+
+    def test_connection(self)->bool:
+        return self.provider.test_connection()
+
+    def has_query(self,query_name:str)->bool:
+        return self.provider.has_query(query_name=query_name)
+
+    def fetch_rows(self,query_name:str,object_filter:Optional[ObjectFilter]=None)->Iterator[Sequence]:
+        return self.snapshot_writer.capture(query_name=query_name,\
+                                            rows=self.provider.fetch_rows(query_name=query_name,object_filter=object_filter))
+
+    def get_connection_count(self)->Optional[int]:
+        return self.provider.get_connection_count()
+
+    def close(self):
+        self.provider.close()
+
+def get_cache_key(values:list)->str:
+
+    return hashlib.sha256(json.dumps(values,default=str).encode("utf-8")).hexdigest()[:32]
+
+class CachedCatalogProvider(CatalogProvider):
+    """
+    Serve the rows of the catalog queries of another provider from files of cache_dir, as single query snapshots.
+    An entry is keyed by the source (server and database), the query text, the filters and the change marker of the database,
+    so creating, altering or dropping an object invalidates it, and it expires ttl seconds after it was saved.
+    The marker is read once per provider, then a hit costs no other round trip.
+    Reading the marker again (e.g. a watch poll) moves the entries used by the next queries to the new marker
+    """
+
+    def __init__(self,provider:CatalogProvider,cache_dir:str,source_name:str,ttl:int=CACHE_TTL):
+
+        self.provider = provider
+
+        self.cache_dir = Path(cache_dir)
+
+        self.source_name = source_name
+
+        self.ttl = ttl
+
+        self.change_marker:Optional[Tuple] = None
+
+        self.hit_count = 0
+
+        self.lock = threading.Lock()
+
+    def test_connection(self)->bool:
+        return self.provider.test_connection()
+
+    def has_query(self,query_name:str)->bool:
+        return self.provider.has_query(query_name=query_name)
+
+    def get_entry_path(self,query_name:str,object_filter:Optional[ObjectFilter])->Tuple[str,Path]:
+        """
+        Return the key of the query and filters, and the file of their entry for the current change marker
+        """
+
+        with self.lock:
+            if self.change_marker is None:
+                self.change_marker = self.provider.get_change_marker()
+
+            change_marker = self.change_marker
+
+        entry_key = get_cache_key(values=[self.source_name,\
+                                          query_name,\
+                                          CATALOG_QUERY.get(query_name,""),\
+                                          None if object_filter is None else asdict(object_filter)])
+
+        return (entry_key,self.cache_dir/f"{entry_key}-{get_cache_key(values=list(change_marker))}{CACHE_FILE_SUFFIX}")
+
+    def fetch_rows(self,query_name:str,object_filter:Optional[ObjectFilter]=None)->Iterator[Sequence]:
+        """
+        A generator, so the change marker is read when the first row is requested and its error raised like a fetch error
+        """
+
+        entry_key,entry_path = self.get_entry_path(query_name=query_name,object_filter=object_filter)
+
+        rows:Optional[Iterator[Sequence]] = None
+
+        try:
+            if time.time()-entry_path.stat().st_mtime<self.ttl:
+
+                snapshot_reader = SnapshotReader(snapshot_path=str(entry_path))
+
+                if query_name in snapshot_reader.get_query_names():
+
+                    with self.lock:
+                        self.hit_count+=1
+
+                    rows = snapshot_reader.read_rows(query_name=query_name)
+        except (OSError,ValueError):
+            pass
+
+        if rows is not None:
+            yield from rows
+            return
+
+        yield from self.fetch_entry_rows(query_name=query_name,object_filter=object_filter,entry_key=entry_key,entry_path=entry_path)
+
+    def fetch_entry_rows(self,query_name:str,object_filter:Optional[ObjectFilter],entry_key:str,entry_path:Path)->Iterator[Sequence]:
+        """
+        Stream the rows of the provider and save them as the entry once they are all fetched, replacing the previous entries of the key
+        """
+
+        snapshot_writer = SnapshotWriter(snapshot_path=str(entry_path))
+
+        try:
+            yield from snapshot_writer.capture(query_name=query_name,\
+                                               rows=self.provider.fetch_rows(query_name=query_name,object_filter=object_filter))
+
+            #an entry which cannot be saved is only fetched again by the next run
+            try:
+                snapshot_writer.save()
+
+                for previous_path in self.cache_dir.glob(f"{entry_key}-*{CACHE_FILE_SUFFIX}"):
+                    if previous_path!=entry_path:
+                        previous_path.unlink(missing_ok=True)
+            except OSError:
+                pass
+        finally:
+            snapshot_writer.close()
+
+    def get_module_state(self,object_filter:Optional[ObjectFilter]=None)->List[ModuleState]:
+        return self.provider.get_module_state(object_filter=object_filter)
+
+    def get_module_object(self,module_states:List[ModuleState])->Iterator[DatabaseObject]:
+        return self.provider.get_module_object(module_states=module_states)
+
+    def get_object_state(self,object_filter:Optional[ObjectFilter]=None)->List[ModuleState]:
+        return self.provider.get_object_state(object_filter=object_filter)
+
+    def get_change_marker(self)->Tuple:
+
+        change_marker = self.provider.get_change_marker()
+
+        with self.lock:
+            self.change_marker = change_marker
+
+        return change_marker
+
+    def get_connection_count(self)->Optional[int]:
+        return self.provider.get_connection_count()
+
+    def close(self):
+        self.provider.close()
@@ -0,0 +1,84 @@
+"""
+DDL rendering shared by tables, external tables and indexes.
+Each definition is assembled from a list of parts joined once, so the cost is linear in the number of columns
+"""
+from typing import List,Optional
+
+def render_data_type(data_type:str,data_type_length:Optional[str])->str:
+
+    if data_type_length is None:
+        return data_type
+
+    if data_type_length=="max":
+        return f"{data_type}(max)"
+
+    if "(" not in data_type_length:
+        return f"{data_type}({data_type_length})"
+
+    return f"{data_type}{data_type_length}"
+
+def render_column(column_name:str,data_type:str,data_type_length:Optional[str],is_nullable:bool)->str:
+
+    nullable = "NULL" if is_nullable else "NOT NULL"
+
+    return f"[{column_name}] {render_data_type(data_type=data_type,data_type_length=data_type_length)} {nullable}"
+
+def render_column_list(columns:List[str])->str:
+    """
+    One column per line, separated by a comma
+    """
+
+    if len(columns)==0:
+        return ""
+
+    return ",\n".join(columns)+"\n"
+
+def render_table(table_schema:str,table_name:str,columns:List[str])->str:
+
+    return "".join([f"CREATE TABLE [{table_schema}].[{table_name}]\n(\n",\
+                    render_column_list(columns=columns),\
+                    ");"])
+
+def render_external_table(table_schema:str,\
+                          table_name:str,\
+                          columns:List[str],\
+                          external_location:str,\
+                          external_data_source_name:str,\
+                          file_format_name:str)->str:
+
+    return "".join([f"CREATE EXTERNAL TABLE [{table_schema}].[{table_name}]\n(\n",\
+                    render_column_list(columns=columns),\
+                    ")\n",\
+                    "WITH\n",\
+                    "(\n",\
+                    f"LOCATION = N\'{external_location}\',\n",\
+                    f"DATA_SOURCE = {external_data_source_name},\n",\
+                    f"FILE_FORMAT = N\'{file_format_name}\'\n",\
+                    ");"])
+
+def render_index_column(column_name:str,is_descending_key:bool)->str:
+
+    order = "DESC" if is_descending_key else "ASC"
+
+    return f"[{column_name}] {order}"
+
+def render_index(index_type:str,\
+                 index_name:str,\
+                 index_schema:str,\
+                 table_name:str,\
+                 index_columns:List[str],\
+                 include_columns:List[str])->str:
+
+    parts = [f"CREATE {index_type} INDEX [{index_name}]\n",\
+             f"ON [{index_schema}].[{table_name}] (",\
+             ",".join(index_columns),\
+             ")"]
+
+    if len(include_columns)>0:
+        parts.extend(["\nINCLUDE (",\
+                      ",".join(include_columns),\
+                      ")"])
+
+    parts.append(";")
+
+    return "".join(parts)
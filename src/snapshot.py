@@ -0,0 +1,155 @@
+"""
+Raw rows of the catalog queries saved to a single file, so the objects can be rendered again without the database.
+Layout: SNAPSHOT_MAGIC, the 8 bytes length of the JSON header {query_name:[offset,length]}, the header, then one block per query.
+A block is a sequence of frames, each made of its 4 bytes length and a zlib compressed JSON array of rows.
+Catalog rows only hold strings, numbers, booleans and nulls, so reading a snapshot made by someone else never runs code
+"""
+import os
+import json
+import struct
+import tempfile
+import threading
+import zlib
+from pathlib import Path
+from typing import List,Dict,Tuple,Iterator,Iterable,Sequence,BinaryIO
+from config import FETCH_BATCH_SIZE,SNAPSHOT_MAGIC
+
+
+def write_frame(file:BinaryIO,rows:List[tuple]):
+
+    frame = zlib.compress(json.dumps(rows,separators=(",",":")).encode("utf-8"))
+
+    file.write(struct.pack("<I",len(frame)))
+    file.write(frame)
+
+class SnapshotWriter:
+    """
+    Capture the rows of the catalog queries while they are streamed.
+    Each query is buffered in its own temporary file so the queries can be captured concurrently
+    """
+
+    def __init__(self,snapshot_path:str):
+
+        self.snapshot_path = Path(snapshot_path)
+
+        self.block_files:Dict[str,BinaryIO] = dict()
+
+        self.lock = threading.Lock()
+
+    def capture(self,query_name:str,rows:Iterable[Sequence])->Iterator[Sequence]:
+        """
+        Yield the rows unchanged while saving them
+        """
+
+        block_file = tempfile.TemporaryFile()
+
+        with self.lock:
+            self.block_files[query_name] = block_file
+
+        batch:List[tuple] = list()
+
+        for row in rows:
+
+            batch.append(tuple(row))
+
+            yield row
+
+            if len(batch)>=FETCH_BATCH_SIZE:
+                write_frame(file=block_file,rows=batch)
+                batch = list()
+
+        if len(batch)>0:
+            write_frame(file=block_file,rows=batch)
+
+    def save(self):
+        """
+        Assemble the captured blocks into the snapshot file
+        """
+
+        header:Dict[str,Tuple[int,int]] = dict()
+
+        offset = 0
+
+        for query_name,block_file in self.block_files.items():
+
+            length = block_file.seek(0,os.SEEK_END)
+
+            header[query_name] = (offset,length)
+
+            offset+=length
+
+        header_bytes = json.dumps(header).encode("utf-8")
+
+        self.snapshot_path.parent.mkdir(parents=True,exist_ok=True)
+
+        temp_path = self.snapshot_path.with_name(self.snapshot_path.name+".tmp")
+
+        with open(temp_path,"wb") as file:
+
+            file.write(SNAPSHOT_MAGIC)
+            file.write(struct.pack("<Q",len(header_bytes)))
+            file.write(header_bytes)
+
+            for block_file in self.block_files.values():
+                block_file.seek(0)
+
+                while True:
+                    data = block_file.read(1024*1024)
+
+                    if len(data)==0:
+                        break
+
+                    file.write(data)
+
+        os.replace(temp_path,self.snapshot_path)
+
+    def close(self):
+
+        for block_file in self.block_files.values():
+            block_file.close()
+
+class SnapshotReader:
+    """
+    Read back the rows of a snapshot. Raise ValueError when the file is not a snapshot
+    """
+
+    def __init__(self,snapshot_path:str):
+
+        self.snapshot_path = Path(snapshot_path)
+
+        with open(self.snapshot_path,"rb") as file:
+
+            if file.read(len(SNAPSHOT_MAGIC))!=SNAPSHOT_MAGIC:
+                raise ValueError(f"{snapshot_path} is not a snapshot")
+
+            header_length, = struct.unpack("<Q",file.read(8))
+
+            try:
+                self.header:Dict[str,Tuple[int,int]] = {x:tuple(y) for x,y in json.loads(file.read(header_length)).items()}
+            except (UnicodeDecodeError,json.JSONDecodeError,AttributeError,TypeError):
+                raise ValueError(f"{snapshot_path} has an invalid header")
+
+        self.data_offset = len(SNAPSHOT_MAGIC)+8+header_length
+
+    def get_query_names(self)->List[str]:
+
+        return list(self.header.keys())
+
+    def read_rows(self,query_name:str)->Iterator[tuple]:
+        """
+        Stream the rows of the query one frame at a time
+        """
+
+        offset,length = self.header[query_name]
+
+        with open(self.snapshot_path,"rb") as file:
+
+            file.seek(self.data_offset+offset)
+
+            while length>0:
+
+                frame_length, = struct.unpack("<I",file.read(4))
+
+                yield from (tuple(x) for x in json.loads(zlib.decompress(file.read(frame_length))))
+
+                length-=4+frame_length
@@ -1,5 +1,103 @@
 from database import create_table_object,create_index_object,create_external_data_source_object
+from database import create_database_engine
+import database
 from model import TableInfo,ObjectType,IndexInfo,ExtDataSourceInfo
+from model import DatabaseObject
+from sqlalchemy import text
+import tempfile
+import time
+import io
+import threading
+import dos
+from fleet import read_fleet_manifest,run_fleet
+from incremental import load_module_state,save_module_state,diff_module_state
+from model import ModuleState
+from pathlib import Path
+from writer import DatabaseObjectWriter,get_content_hash,parse_database_object_file
+from model import WriteOptions
+from catalog import TableCatalog,IndexCatalog
+from database import iter_server_rendered_table_object,iter_server_rendered_index_object
+from render import render_column,render_index_column
+from itertools import groupby
+from fake import generate_table_rows,generate_index_rows
+from provider import CatalogProvider,CaptureCatalogProvider,SnapshotCatalogProvider,SqliteCatalogProvider,CachedCatalogProvider
+from snapshot import SnapshotWriter
+from config import SNAPSHOT_MAGIC,MANIFEST_FILE
+import pickle
+import struct
+from fake import create_fake_catalog,generate_module_rows
+from benchmark import benchmark_stages,compare_baseline
+from pack import PackReader,PackWriter
+from compare import ObjectSource,diff_content_hash,get_unified_diff
+from inventory import list_object
+from extractor import Extractor
+from gitimport import GitImportWriter,get_git_path
+from watch import watch_remote,get_watched_state
+import apply
+from pipeline import StageQueue,fetch_stage,iter_stage_queue
+from model import CategoryMetrics
+import os
+import json
+import sqlite3
+from functools import partial
+import subprocess
+import sys
+from contextlib import contextmanager,redirect_stdout
+from sqlalchemy.exc import OperationalError
+from model import FetchOptions
+from typing import List,Dict,Tuple
+
+#catalog queries producing one object per row
+FAKE_OBJECT_QUERIES = ["GET_VIEW_CODE","GET_FUNCTION_SQL","GET_PROCEDURE_SQL",\
+                       "GET_EXTERNAL_DATA_SOURCE_SQL","GET_EXTERNAL_FILE_FORMAT_SQL",\
+                       "GET_TABLE_DDL_SQL","GET_INDEX_DDL_SQL","GET_EXTERNAL_TABLE_DDL_SQL"]
+
+@contextmanager
+def working_directory(cwd:str):
+    """
+    Run the block in cwd, whose .dos folder then hold the remotes, and restore the working directory
+    """
+
+    current_dir = os.getcwd()
+
+    os.chdir(cwd)
+
+    try:
+        yield
+    finally:
+        os.chdir(current_dir)
+
+def get_fake_object_count(row_counts:Dict[str,int])->int:
+
+    return sum(row_counts[x] for x in FAKE_OBJECT_QUERIES)
+
+def extract_fake_remote(cwd:str,argv:List[str],remote_name:str="fake",database_path:str="fake.db")->Tuple[int,List[str]]:
+    """
+    Extract the fake catalog database_path (relative to cwd) into cwd/.dos/<remote_name> with the options of argv.
+    Return the exit code and the output lines
+    """
+
+    output = io.StringIO()
+
+    with working_directory(cwd=cwd):
+
+        extract_options = dos.get_extract_options(options=dos.parse_argument(argv=argv)[1])
+
+        exit_code = dos.extract_remote(remote_name=remote_name,\
+                                       provider=dos.create_provider(database_uri=f"sqlite:///{database_path}",extract_options=extract_options),\
+                                       extract_options=extract_options,\
+                                       output=output)
+
+    return (exit_code,output.getvalue().splitlines())
+
+def run_dos(cwd:str,argv:List[str])->int:
+    """
+    Run the command line in cwd
+    """
+
+    with working_directory(cwd=cwd):
+        return dos.main(argv=argv)
+
 
 def test_single_column_table():
 
@@ -162,6 +260,55 @@ def test_multiple_index_column_multiple_include_column_index():
     for index in range(len(expected_object_definition)):
         assert expected_object_definition[index]==actual_object_definition[index]
 
+def test_single_index_column_multiple_include_column_index():
+
+    index_info = [IndexInfo(index_schema="test",\
+                            table_name="foo",\
+                            index_name="idx_test",\
+                            index_column_name="c1",
+                            index_type="NONCLUSTERED",
+                            column_position=1,
+                            is_included_column=False,
+                            is_descending_key=False)]
+    
+    for position in range(2,5):
+        index_info.append(IndexInfo(index_schema="test",\
+                                    table_name="foo",\
+                                    index_name="idx_test",\
+                                    index_column_name=f"ic{position}",
+                                    index_type="NONCLUSTERED",
+                                    column_position=position,
+                                    is_included_column=True,
+                                    is_descending_key=False))
+
+    database_objects = create_index_object(index_info=index_info)
+
+    assert len(database_objects)==1
+
+    assert database_objects[0].object_definition=="CREATE NONCLUSTERED INDEX [idx_test]\n"+\
+        "ON [test].[foo] ([c1] ASC)\n"+\
+        "INCLUDE ([ic2] ASC,[ic3] ASC,[ic4] ASC);"
+
+def test_multiple_table_in_order():
+
+    table_info = [TableInfo(table_schema="test",\
+                            table_name=f"t{x//3}",\
+                            column_name=f"c{x%3}",\
+                            data_type="decimal",\
+                            data_type_length="(10,2)",\
+                            is_nullable="NO",\
+                            ordinal_position=x%3+1) for x in range(9)]
+
+    database_objects = create_table_object(table_info=table_info)
+
+    assert [x.object_name for x in database_objects]==["t0","t1","t2"]
+
+    assert database_objects[2].object_definition=="CREATE TABLE [test].[t2]\n(\n"+\
+        "[c0] decimal(10,2) NOT NULL,\n"+\
+        "[c1] decimal(10,2) NOT NULL,\n"+\
+        "[c2] decimal(10,2) NOT NULL\n"+\
+        ");"
+
 def test_no_type_external_data_source():
 
     database_objects = create_external_data_source_object(ext_data_source_info=[
@@ -215,14 +362,1234 @@ def test_type_external_data_source():
     for index in range(len(expected_object_definition)):
         assert expected_object_definition[index]==actual_object_definition[index]
 
+def test_shared_engine_connection_count():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        engine,connection_stats = create_database_engine(connection_str=f"sqlite:///{temp_dir}/test.db",\
+                                                         pool_size=1)
+
+        assert database.test_connection(engine=engine)
+
+        for _ in range(8):
+            with engine.connect() as connection:
+                connection.execute(statement=text("SELECT 1"))
+
+        engine.dispose()
+
+        assert connection_stats.connection_count==1
+
+def test_parse_argument():
+
+    arguments,options = dos.parse_argument(argv=["remote","user:password@host/db","--jobs","4"])
+
+    assert arguments==["remote","user:password@host/db"]
+    assert options=={"--jobs":"4"}
+
+    assert dos.parse_argument(argv=["remote","--jobs"]) is None
+
+
+def test_concurrent_extraction_keep_category_order():
+
+    def slow_category(category_no:int):
+
+        def extract():
+            #earlier categories finish last
+            time.sleep(0.01*(4-category_no))
+            yield DatabaseObject(object_schema=None,\
+                                 object_name=f"object{category_no}",\
+                                 object_definition="",\
+                                 object_type=ObjectType.TABLE)
+
+            if category_no==3:
+                raise ValueError()
+
+        return extract
+
+    output = io.StringIO()
+
+    consumed_objects = list()
+
+    is_success = dos.extract_database_object(jobs=4,\
+                                             consume_func=consumed_objects.append,\
+                                             extract_categories=[(f"category{x}",ObjectType.TABLE,slow_category(x),None) for x in range(4)],\
+                                             output=output)
+
+    assert not is_success
+    assert output.getvalue().splitlines()==["extracting category0:success",\
+                                            "extracting category1:success",\
+                                            "extracting category2:success",\
+                                            "extracting category3:fail"]
+    assert sorted(x.object_name for x in consumed_objects)==[f"object{x}" for x in range(4)]
+
+def test_read_fleet_manifest():
+
+    fleet_entries = read_fleet_manifest(lines=["# nightly",\
+                                              "",\
+                                              "dev user:password@host1/db",\
+                                              "  prod   user:password@host2/db  "])
+
+    assert [(x.remote_name,x.database_uri) for x in fleet_entries]==[("dev","user:password@host1/db"),\
+                                                                     ("prod","user:password@host2/db")]
+
+    assert read_fleet_manifest(lines=["dev"]) is None
+    assert read_fleet_manifest(lines=["dev a@h/db","dev b@h/db"]) is None
+
+
+def test_fleet_per_host_limit():
+
+    fleet_entries = read_fleet_manifest(lines=[f"remote{x} host{x%2}" for x in range(8)])
+
+    lock = threading.Lock()
+
+    host_running = {"host0":0,"host1":0}
+
+    max_host_running = {"host0":0,"host1":0}
+
+    def extract(fleet_entry,output):
+
+        host = fleet_entry.database_uri
+
+        with lock:
+            host_running[host]+=1
+            max_host_running[host] = max(max_host_running[host],host_running[host])
+
+        time.sleep(0.01)
+
+        with lock:
+            host_running[host]-=1
+
+        return 1 if fleet_entry.remote_name=="remote3" else 0
+
+    fleet_results = run_fleet(fleet_entries=fleet_entries,\
+                              extract_func=extract,\
+                              host_func=lambda x:x.database_uri,\
+                              max_parallel=4,\
+                              max_per_host=1)
+
+    assert max_host_running=={"host0":1,"host1":1}
+    assert [x.remote_name for x in fleet_results]==[f"remote{x}" for x in range(8)]
+    assert [x.remote_name for x in fleet_results if not x.is_success]==["remote3"]
+
+def test_diff_module_state():
+
+    previous_states = [ModuleState(1,"dbo","v1",ObjectType.VIEW,"2024-01-01T00:00:00"),\
+                       ModuleState(2,"dbo","p1",ObjectType.PROCEDURE,"2024-01-01T00:00:00"),\
+                       ModuleState(3,"dbo","f1",ObjectType.FUNCTION,"2024-01-01T00:00:00"),\
+                       ModuleState(4,"dbo","v2",ObjectType.VIEW,"2024-01-01T00:00:00")]
+    
+    current_states = [ModuleState(1,"dbo","v1",ObjectType.VIEW,"2024-01-01T00:00:00"),\
+                      ModuleState(2,"dbo","p1",ObjectType.PROCEDURE,"2024-02-01T00:00:00"),\
+                      ModuleState(4,"dbo","v2_renamed",ObjectType.VIEW,"2024-01-01T00:00:00"),\
+                      ModuleState(5,"dbo","f2",ObjectType.FUNCTION,"2024-02-01T00:00:00")]
+
+    changed_states,dropped_states = diff_module_state(previous_states=previous_states,\
+                                                      current_states=current_states)
+
+    assert [x.object_id for x in changed_states]==[2,4,5]
+    assert [x.object_name for x in dropped_states]==["f1","v2"]
+
+    changed_states,dropped_states = diff_module_state(previous_states=None,\
+                                                      current_states=current_states)
+
+    assert len(changed_states)==4
+    assert len(dropped_states)==0
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        state_path = Path(temp_dir)/"remote"/"state.json"
+
+        assert load_module_state(state_path=state_path) is None
+
+        save_module_state(state_path=state_path,module_states=current_states)
+
+        assert load_module_state(state_path=state_path)==current_states
+
+def test_writer_skip_unchanged_file():
+
+    def write_objects(root_dir,definitions):
+
+        database_object_writer = DatabaseObjectWriter(root_dir=root_dir,remote_name="remote")
+
+        for object_name,object_definition in definitions.items():
+            database_object_writer.write(database_object=DatabaseObject(object_schema="dbo",\
+                                                                        object_name=object_name,\
+                                                                        object_definition=object_definition,\
+                                                                        object_type=ObjectType.VIEW))
+
+        database_object_writer.close()
+
+        return database_object_writer.stats
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        write_stats = write_objects(root_dir=temp_dir,definitions={"v1":"SELECT 1","v2":"SELECT 2"})
+
+        assert (write_stats.written_count,write_stats.unchanged_count,write_stats.deleted_count)==(2,0,0)
+
+        v1_mtime = (Path(temp_dir)/"remote"/"view"/"dbo.v1.sql").stat().st_mtime_ns
+
+        write_stats = write_objects(root_dir=temp_dir,definitions={"v1":"SELECT 1","v3":"SELECT 3"})
+
+        assert (write_stats.written_count,write_stats.unchanged_count,write_stats.deleted_count)==(1,1,1)
+
+        assert (Path(temp_dir)/"remote"/"view"/"dbo.v1.sql").stat().st_mtime_ns==v1_mtime
+        assert not (Path(temp_dir)/"remote"/"view"/"dbo.v2.sql").exists()
+        assert (Path(temp_dir)/"remote"/"view"/"dbo.v3.sql").read_text()=="SELECT 3"
+
+        #line endings are written as extracted, so a file written before the manifest existed is found unchanged
+        definition = "SELECT 1\r\nFROM t\nWHERE a='\r'"
+
+        write_objects(root_dir=temp_dir,definitions={"v4":definition})
+
+        assert (Path(temp_dir)/"remote"/"view"/"dbo.v4.sql").read_bytes()==definition.encode("utf-8")
+
+        (Path(temp_dir)/"remote"/MANIFEST_FILE).unlink()
+
+        write_stats = write_objects(root_dir=temp_dir,definitions={"v4":definition})
+
+        assert (write_stats.written_count,write_stats.unchanged_count)==(0,1)
+
+def test_writer_same_file_last_wins():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        create_fake_catalog(database_path=f"{temp_dir}/fake.db",table_count=200,column_count=4,duplicate_index_count=200)
+
+        extractor = Extractor.open(database_uri=f"sqlite:///{temp_dir}/fake.db")
+
+        index_objects = extractor.get_category_object(object_type=ObjectType.INDEX)
+
+        extractor.close()
+
+        #20 indexes per file, written by 8 threads
+        expected_definitions = {f"index/{x.object_schema}.{x.object_name}.sql":x.object_definition for x in index_objects}
+
+        assert len(index_objects)==200 and len(expected_definitions)==10
+
+        for _ in range(2):
+
+            writer = DatabaseObjectWriter(root_dir=temp_dir,remote_name="fake",write_options=WriteOptions(write_jobs=8,queue_depth=64))
+
+            for database_object in index_objects:
+                writer.write(database_object)
+
+            writer.close()
+
+            assert len(writer.pending_files)==0
+
+            manifest = json.loads((Path(temp_dir)/"fake"/MANIFEST_FILE).read_text())
+
+            for object_file,object_definition in expected_definitions.items():
+                assert (Path(temp_dir)/"fake"/object_file).read_text()==object_definition
+
+                assert manifest[object_file]==get_content_hash(content=object_definition)
+
+def test_parallel_writer():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        database_object_writer = DatabaseObjectWriter(root_dir=temp_dir,\
+                                                      remote_name="remote",\
+                                                      write_options=WriteOptions(write_jobs=4,queue_depth=2,fsync=True))
+
+        for x in range(100):
+            database_object_writer.write(database_object=DatabaseObject(object_schema="dbo",\
+                                                                        object_name=f"t{x}",\
+                                                                        object_definition=f"CREATE TABLE t{x}",\
+                                                                        object_type=ObjectType.TABLE))
+
+        database_object_writer.close()
+
+        assert database_object_writer.stats.written_count==100
+        assert (Path(temp_dir)/"remote"/"table"/"dbo.t42.sql").read_text()=="CREATE TABLE t42"
+
+        #a folder in place of the file make the write fail
+        (Path(temp_dir)/"remote"/"view"/"dbo.v1.sql").mkdir(parents=True)
+
+        database_object_writer = DatabaseObjectWriter(root_dir=temp_dir,remote_name="remote")
+
+        database_object_writer.write(database_object=DatabaseObject(object_schema="dbo",\
+                                                                    object_name="v1",\
+                                                                    object_definition="SELECT 1",\
+                                                                    object_type=ObjectType.VIEW))
+
+        try:
+            database_object_writer.close()
+            assert False
+        except OSError:
+            pass
+
+def test_catalog_render_same_as_dataclass():
+
+    table_rows = list(generate_table_rows(table_count=20,column_count=7))
+
+    table_info = [TableInfo(*x) for x in table_rows]
+
+    table_catalog = TableCatalog.from_rows(rows=table_rows)
+
+    assert len(table_catalog)==20
+    assert list(table_catalog.iter_object())==create_table_object(table_info=table_info)
+
+    index_rows = list(generate_index_rows(index_count=20,column_count=5))
+
+    index_info = [IndexInfo(*x) for x in index_rows]
+
+    index_catalog = IndexCatalog.from_rows(rows=index_rows)
+
+    assert len(index_catalog)==20
+    assert list(index_catalog.iter_object())==create_index_object(index_info=index_info)
+
+def test_server_render_same_as_client_render():
+
+    table_info = [TableInfo(*x) for x in generate_table_rows(table_count=10,column_count=6)]
+
+    #STUFF(STRING_AGG(CHAR(10)+column,','),1,1,'') of GET_TABLE_DDL_SQL
+    table_rows = [(table_schema,table_name,",".join("\n"+render_column(column_name=x.column_name,\
+                                                                       data_type=x.data_type,\
+                                                                       data_type_length=x.data_type_length,\
+                                                                       is_nullable=x.is_nullable=="YES") for x in columns)[1:])\
+                  for (table_schema,table_name),columns in groupby(table_info,key=lambda x:(x.table_schema,x.table_name))]
+
+    assert list(iter_server_rendered_table_object(rows=table_rows))==create_table_object(table_info=table_info)
+
+    index_info = [IndexInfo(*x) for x in generate_index_rows(index_count=10,column_count=5)]
+
+    def aggregate_column(columns):
+        
+        if len(columns)==0:
+            return None
+        
+        return ",".join(render_index_column(column_name=x.index_column_name,is_descending_key=x.is_descending_key) for x in columns)
+
+    index_rows = list()
+
+    for (index_schema,table_name,index_name),columns in groupby(index_info,key=lambda x:(x.index_schema,x.table_name,x.index_name)):
+
+        columns = list(columns)
+
+        index_rows.append((index_schema,\
+                           table_name,\
+                           index_name,\
+                           columns[0].index_type,\
+                           aggregate_column([x for x in columns if not x.is_included_column]),\
+                           aggregate_column([x for x in columns if x.is_included_column])))
+
+    assert list(iter_server_rendered_index_object(rows=index_rows))==create_index_object(index_info=index_info)
+
+def test_snapshot_replay_same_as_capture():
+
+    catalog_rows = {"GET_TABLE_SQL":list(generate_table_rows(table_count=300,column_count=5)),\
+                    "GET_INDEX_SQL":list(generate_index_rows(index_count=300,column_count=4)),\
+                    "GET_VIEW_CODE":[("dbo","v1","CREATE VIEW v1 AS SELECT 1")],\
+                    "GET_EXTERNAL_FILE_FORMAT_SQL":[("csv","DELIMITEDTEXT",",",None,True,2)],\
+                    "GET_PROCEDURE_SQL":[]}
+
+    class RowProvider(CatalogProvider):
+
+        def fetch_rows(self,query_name,object_filter=None):
+            return iter(catalog_rows[query_name])
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        snapshot_writer = SnapshotWriter(snapshot_path=f"{temp_dir}/remote.snapshot")
+
+        capture_provider = CaptureCatalogProvider(provider=RowProvider(),snapshot_writer=snapshot_writer)
+
+        captured_objects = {x:list(capture_provider.get_object(query_name=x)) for x in catalog_rows}
+
+        snapshot_writer.save()
+        snapshot_writer.close()
+
+        snapshot_provider = SnapshotCatalogProvider(snapshot_path=f"{temp_dir}/remote.snapshot")
+
+        assert not snapshot_provider.has_query(query_name="GET_FUNCTION_SQL")
+
+        for query_name in catalog_rows:
+            assert list(snapshot_provider.fetch_rows(query_name=query_name))==catalog_rows[query_name]
+            assert list(snapshot_provider.get_object(query_name=query_name))==captured_objects[query_name]
+
+        (Path(temp_dir)/"not_snapshot").write_bytes(b"not a snapshot")
+
+        try:
+            SnapshotCatalogProvider(snapshot_path=f"{temp_dir}/not_snapshot")
+            assert False
+        except ValueError:
+            pass
+
+        #a pickled header is rejected, never unpickled
+        header_bytes = pickle.dumps({"GET_TABLE_SQL":(0,0)})
+
+        (Path(temp_dir)/"pickled").write_bytes(SNAPSHOT_MAGIC+struct.pack("<Q",len(header_bytes))+header_bytes)
+
+        try:
+            SnapshotCatalogProvider(snapshot_path=f"{temp_dir}/pickled")
+            assert False
+        except ValueError:
+            pass
+
+def test_fake_catalog_run_report():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        row_counts = create_fake_catalog(database_path=f"{temp_dir}/fake.db",table_count=30,column_count=6)
+
+        object_count = get_fake_object_count(row_counts=row_counts)
+
+        exit_code,lines = extract_fake_remote(cwd=temp_dir,argv=["--jobs","4","--prometheus","prom"])
+
+        assert exit_code==0 and lines[-1].startswith(f"saving database objects:success ({object_count} written,0 unchanged,0 deleted")
+
+        run_report = json.loads(Path(temp_dir,".dos/fake/.report.json").read_text())
+
+        assert run_report["is_success"] and 1<=run_report["connection_count"]<=4
+        assert run_report["categories"][0]["row_count"]==row_counts["GET_TABLE_SQL"]
+        assert sum(x["object_count"] for x in run_report["categories"])==object_count
+        assert [x["name"] for x in run_report["queues"]]==[f"{x[0]} rows" for x in dos.EXTRACT_CATEGORIES]+["objects"]
+        assert run_report["queues"][-1]["max_depth"]<=run_report["queues"][-1]["capacity"]
+
+        assert f'dos_category_rows{{remote="fake",category="tables"}} {row_counts["GET_TABLE_SQL"]}' in Path(temp_dir,"prom/dos_fake.prom").read_text().splitlines()
+
+        assert run_dos(cwd=temp_dir,argv=["fake","sqlite:///missing.db"])==1
+
+def test_fake_catalog_server_render():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        object_count = get_fake_object_count(row_counts=create_fake_catalog(database_path=f"{temp_dir}/fake.db",table_count=30,column_count=6))
+
+        assert extract_fake_remote(cwd=temp_dir,argv=[])[0]==0
+
+        #the server rendered definitions are the same as the client rendered ones
+        exit_code,lines = extract_fake_remote(cwd=temp_dir,argv=["--server-render"])
+
+        assert exit_code==0 and lines[-1].startswith(f"saving database objects:success (0 written,{object_count} unchanged,0 deleted")
+
+def test_fake_catalog_module_batch():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        object_count = get_fake_object_count(row_counts=create_fake_catalog(database_path=f"{temp_dir}/fake.db",table_count=30,column_count=6))
+
+        assert extract_fake_remote(cwd=temp_dir,argv=[])[0]==0
+
+        #definitions fetched a few at a time are the same, with and without incremental
+        for argv in [["--module-batch","7","--module-batch-bytes","100"],["--incremental","--module-batch","7"]]:
+
+            exit_code,lines = extract_fake_remote(cwd=temp_dir,argv=argv)
+
+            assert exit_code==0 and lines[-1].startswith(f"saving database objects:success (0 written,{object_count} unchanged,0 deleted")
+
+def test_fake_catalog_filter():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        object_count = get_fake_object_count(row_counts=create_fake_catalog(database_path=f"{temp_dir}/fake.db",table_count=30,column_count=6))
+
+        #the incremental run below needs the module state of a previous one
+        assert extract_fake_remote(cwd=temp_dir,argv=["--incremental"])[0]==0
+
+        #files out of the filters are neither written nor deleted
+        view_count = len([x for x in generate_module_rows(module_type="VIEW",module_count=30) if x[0]=="schema1" and x[1].startswith("view1")])
+
+        assert view_count>1
+
+        for argv,unchanged_count in [(["--types","view","--include-schema","schema1","--name","VIEW1*"],view_count),\
+                                     (["--types","view,table","--exclude-schema","schema2","--name","view1*","--incremental"],0),\
+                                     ([],object_count)]:
+
+            exit_code,lines = extract_fake_remote(cwd=temp_dir,argv=argv)
+
+            assert exit_code==0 and lines[-1].startswith(f"saving database objects:success (0 written,{unchanged_count} unchanged,0 deleted")
+
+def test_pack_same_as_files():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        create_fake_catalog(database_path=f"{temp_dir}/fake.db",table_count=20,column_count=4)
+
+        remote_dir = Path(temp_dir,".dos")
+
+        assert extract_fake_remote(cwd=temp_dir,argv=[],remote_name="files")[0]==0
+
+        object_files = sorted(x.relative_to(remote_dir/"files").as_posix() for x in (remote_dir/"files").glob("*/*.sql"))
+
+        for argv,summary in [(["--pack","--jobs","4"],f"({len(object_files)} written,0 unchanged,0 deleted"),\
+                             (["--pack","--incremental"],f"(0 written,{len(object_files)} unchanged,0 deleted"),\
+                             #objects out of the filters are carried over into the new pack
+                             (["--pack","--types","view"],"(0 written,20 unchanged,0 deleted")]:
+
+            exit_code,lines = extract_fake_remote(cwd=temp_dir,argv=argv,remote_name="packed")
+
+            assert exit_code==0 and lines[-1].startswith(f"saving database objects:success {summary}")
+
+        pack_reader = PackReader.open(remote_dir=remote_dir/"packed")
+
+        assert sorted(pack_reader.iter_key())==object_files
+
+        for object_file in object_files:
+            assert pack_reader.get_definition(key=object_file)==(remote_dir/"files"/object_file).read_text()
+
+        assert pack_reader.get_definition(key="view/schema0.missing.sql") is None
+
+        pack_reader.close()
+
+        assert run_dos(cwd=temp_dir,argv=["pack","extract","packed","view/schema1.*","extracted"])==0
+        assert sorted(x.name for x in Path(temp_dir,"extracted/view").iterdir())==sorted(Path(x).name for x in object_files if x.startswith("view/schema1."))
+
+        assert run_dos(cwd=temp_dir,argv=["pack","export","packed"])==0
+
+        for object_file in object_files:
+            assert (remote_dir/"packed"/object_file).read_text()==(remote_dir/"files"/object_file).read_text()
+
+        assert run_dos(cwd=temp_dir,argv=["pack","cat","packed","table/schema0.missing.sql"])==1
+
+def test_git_output():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        create_fake_catalog(database_path=f"{temp_dir}/fake.db",table_count=10,column_count=3)
+
+        remote_dir = Path(temp_dir,".dos")
+
+        assert run_dos(cwd=temp_dir,argv=["files","sqlite:///fake.db"])==0
+
+        object_files = sorted(x.relative_to(remote_dir/"files").as_posix() for x in (remote_dir/"files").glob("*/*.sql"))
+
+        def git(*arguments):
+            return subprocess.run(["git","-C",f"{temp_dir}/history.git"]+list(arguments),check=True,stdout=subprocess.PIPE).stdout.decode("utf-8")
+
+        assert run_dos(cwd=temp_dir,argv=["fake","sqlite:///fake.db","--git","history.git","--jobs","4"])==0
+
+        assert sorted(git("ls-tree","-r","--name-only","dos").split())==[f"fake/{x}" for x in object_files]
+
+        for object_file in object_files[::7]:
+            assert git("show",f"dos:fake/{object_file}")==(remote_dir/"files"/object_file).read_text()
+
+        #nothing changed, no commit
+        assert run_dos(cwd=temp_dir,argv=["fake","sqlite:///fake.db","--git","history.git","--incremental"])==0
+        assert run_dos(cwd=temp_dir,argv=["fake","sqlite:///fake.db","--git","history.git","--types","view"])==0
+
+        assert len(git("rev-list","dos").split())==1
+
+        #another remote is committed next to the first one
+        assert run_dos(cwd=temp_dir,argv=["other","sqlite:///fake.db","--git","history.git","--types","table"])==0
+
+        assert len(git("rev-list","dos").split())==2
+        assert len(git("ls-tree","-r","--name-only","dos","fake/").split())==len(object_files)
+
+        #the report and module state are kept in the repository, outside of the commits, not in a remote folder without objects
+        assert not (remote_dir/"fake").exists() and not (remote_dir/"other").exists()
+        assert Path(temp_dir,"history.git/dos/fake/.report.json").is_file() and Path(temp_dir,"history.git/dos/fake/.state.json").is_file()
+        assert "dos/" not in git("ls-tree","-r","--name-only","dos")
+
+        #a failed first run leaves a report where the repository is then created
+        assert run_dos(cwd=temp_dir,argv=["fake","sqlite:///missing.db","--git","new.git"])==1
+        assert run_dos(cwd=temp_dir,argv=["fake","sqlite:///fake.db","--git","new.git","--types","view"])==0
+
+        #paths git cannot read as is are C-style quoted, with the non-ASCII bytes in octal
+        assert get_git_path(path="fake/view/dbo.café.sql")=="fake/view/dbo.café.sql".encode("utf-8")
+        assert get_git_path(path="fake/view/dbo.a\"b\\c\nd\té.sql")==b'"fake/view/dbo.a\\"b\\\\c\\nd\\t\\303\\251.sql"'
+
+        object_names = ["café","two\nlines \"é\"","back\\slash\t"]
+
+        git_writer = GitImportWriter(git_dir=f"{temp_dir}/names.git",remote_name="fake")
+
+        for object_name in object_names:
+            git_writer.write(DatabaseObject(object_schema="dbo",object_name=object_name,object_definition=f"SELECT '{object_name}'",object_type=ObjectType.VIEW))
+
+        git_writer.close()
+
+        tree_paths = subprocess.run(["git","-C",f"{temp_dir}/names.git","ls-tree","-r","-z","--name-only","dos"],check=True,stdout=subprocess.PIPE).stdout.decode("utf-8")
+
+        assert sorted(tree_paths.split("\0")[:-1])==sorted(f"fake/view/dbo.{x}.sql" for x in object_names)
+
+def test_diff_remotes():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        remote_dir = Path(temp_dir,".dos")
+
+        def write_remote(remote_name,database_objects,writer_class):
+
+            database_object_writer = writer_class(root_dir=str(remote_dir),remote_name=remote_name)
+
+            for database_object in database_objects:
+                database_object_writer.write(database_object)
+
+            database_object_writer.close()
+
+        views = [DatabaseObject(object_schema="dbo",object_name=f"view{x}",object_definition=f"CREATE VIEW v{x}\nAS\nSELECT {x}",object_type=ObjectType.VIEW) for x in range(5)]
+
+        tables = [DatabaseObject(object_schema="dbo",object_name=f"table{x}",object_definition=f"CREATE TABLE t{x}",object_type=ObjectType.TABLE) for x in range(3)]
+
+        write_remote(remote_name="dev",database_objects=views+tables,writer_class=DatabaseObjectWriter)
+
+        changed_view = DatabaseObject(object_schema="dbo",object_name="view1",object_definition="CREATE VIEW v1\nAS\nSELECT 10",object_type=ObjectType.VIEW)
+
+        write_remote(remote_name="prod",database_objects=[changed_view]+views[2:]+tables[:2],writer_class=PackWriter)
+
+        dev_source = ObjectSource(remote_dir=remote_dir/"dev")
+
+        prod_source = ObjectSource(remote_dir=remote_dir/"prod")
+
+        object_type_diffs = diff_content_hash(content_hash_a=dev_source.get_content_hash(),content_hash_b=prod_source.get_content_hash())
+
+        assert [(x.object_type,x.added,x.removed,x.changed) for x in object_type_diffs]==[(ObjectType.TABLE,[],["table/dbo.table2.sql"],[]),\
+                                                                                         (ObjectType.VIEW,[],["view/dbo.view0.sql"],["view/dbo.view1.sql"])]
+
+        assert "".join(get_unified_diff(source_a=dev_source,source_b=prod_source,object_file="view/dbo.view1.sql",label_a="dev",label_b="prod")).endswith("-SELECT 1\n\\ No newline at end of file\n+SELECT 10\n\\ No newline at end of file\n")
+
+        dev_source.close()
+        prod_source.close()
+
+        assert run_dos(cwd=temp_dir,argv=["diff","dev","prod","--types","view","--name","view0"])==1
+        assert run_dos(cwd=temp_dir,argv=["diff","dev","prod","--types","view","--name","view4"])==0
+        assert run_dos(cwd=temp_dir,argv=["diff","dev","missing"])==1
+
+def test_module_batch_retry():
+
+    fetch_options = FetchOptions(batch_size=3,batch_bytes=100,retry_count=1,retry_delay=0)
+
+    module_keys = [(1,"dbo","a",40),(2,"dbo","b",40),(3,"dbo","c",500),(4,"dbo","d",10),(5,"dbo","e",10),(6,"dbo","f",10),(7,"dbo","g",10)]
+
+    assert [[y[0] for y in x] for x in database.split_module_batch(module_keys=module_keys,fetch_options=fetch_options)]==[[1,2],[3],[4,5,6],[7]]
+
+    class FlakyEngine:
+
+        def __init__(self):
+            self.attempt_count = 0
+
+        @contextmanager
+        def connect(self):
+
+            self.attempt_count+=1
+
+            if self.attempt_count==1:
+                raise OperationalError("SELECT",{},Exception("communication link failure"))
+
+            yield FlakyConnection()
+
+    class FlakyConnection:
+
+        def execute(self,statement,parameters):
+            return FlakyResult()
+
+    class FlakyResult:
+
+        def fetchall(self):
+            return [(1,)]
+
+    engine = FlakyEngine()
+
+    assert database.execute_with_retry(engine=engine,statement=None,parameters={},fetch_options=fetch_options)==[(1,)]
+    assert engine.attempt_count==2
+
+    engine = FlakyEngine()
+
+    try:
+        database.execute_with_retry(engine=engine,statement=None,parameters={},fetch_options=FetchOptions(retry_count=0))
+        assert False
+    except OperationalError:
+        pass
+
+    class DefinitionEngine:
+
+        def __init__(self):
+            self.object_ids:List[List[int]] = list()
+
+        @contextmanager
+        def connect(self):
+            yield self
+
+        def execute(self,statement,parameters):
+
+            self.object_ids.append(parameters["object_ids"])
+
+            return DefinitionResult(rows=[(x,f"definition of {x}") for x in parameters["object_ids"]])
+
+    class DefinitionResult:
+
+        def __init__(self,rows):
+            self.rows = rows
+
+        def fetchall(self):
+            return self.rows
+
+    #the definitions of the modified modules are also fetched by batches bounded in bytes
+    engine = DefinitionEngine()
+
+    module_states = [ModuleState(x[0],x[1],x[2],ObjectType.VIEW,"2024-01-01T00:00:00",x[3]) for x in module_keys]
+
+    database_objects = list(database.get_module_object(engine=engine,module_states=module_states,fetch_options=fetch_options))
+
+    assert engine.object_ids==[[1,2],[3],[4,5,6],[7]]
+    assert [x.object_name for x in database_objects]==["a","b","c","d","e","f","g"] and database_objects[2].object_definition=="definition of 3"
+
+def test_list_closed_pipe():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        create_fake_catalog(database_path=f"{temp_dir}/fake.db",table_count=2000,column_count=1)
+
+        #more output than the pipe buffer, read like head -1
+        process = subprocess.Popen([sys.executable,str(Path(__file__).parent/"dos.py"),"list",f"sqlite:///{temp_dir}/fake.db"],\
+                                   stdout=subprocess.PIPE,\
+                                   stderr=subprocess.PIPE)
+
+        assert process.stdout.readline().startswith(b"view\t")
+
+        process.stdout.close()
+
+        assert process.wait(timeout=60)==0 and process.stderr.read()==b""
+
+        process.stderr.close()
+
+def test_lazy_object_handles():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        create_fake_catalog(database_path=f"{temp_dir}/fake.db",table_count=30,column_count=6)
+
+        provider = SqliteCatalogProvider(database_path=f"{temp_dir}/fake.db",pool_size=1)
+
+        try:
+            object_handles = list_object(provider=provider,prefetch_size=7)
+
+            assert len(object_handles)>14 and not any(x.is_loaded for x in object_handles)
+
+            loader = object_handles[0].loader
+
+            #the first access fetch the definitions of the next handles too
+            assert len(object_handles[3].object_definition)>0
+
+            assert loader.batch_count==1
+            assert [x.is_loaded for x in object_handles[:12]]==[False]*3+[True]*7+[False]*2
+
+            expected_objects = {(x.object_type,x.object_schema,x.object_name):x.object_definition\
+                                for x in provider.get_module_object(module_states=[y.module_state for y in object_handles])}
+
+            assert [x.get_database_object() for x in object_handles]==[DatabaseObject(object_schema=x.object_schema,\
+                                                                                       object_name=x.object_name,\
+                                                                                       object_definition=expected_objects[(x.object_type,x.object_schema,x.object_name)],\
+                                                                                       object_type=x.object_type) for x in object_handles]
+
+            #handles already loaded are not fetched again
+            assert loader.batch_count==(len(object_handles)-7+6)//7+1
+
+            view_handles = list_object(provider=provider,object_filter=dos.ObjectFilter(object_types=[ObjectType.VIEW],include_schemas=["schema1"]))
+
+            assert len(view_handles)>0 and all(x.object_type==ObjectType.VIEW and x.object_schema=="schema1" for x in view_handles)
+        finally:
+            provider.close()
+
+def test_extractor_reuse():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        row_counts = create_fake_catalog(database_path=f"{temp_dir}/fake.db",table_count=20,column_count=4)
+
+        assert Extractor.open(database_uri="not a uri") is None
+
+        extractor = Extractor.open(database_uri=f"sqlite:///{temp_dir}/fake.db",pool_size=2)
+
+        try:
+            database_objects = list(extractor.extract())
+
+            assert len(database_objects)==get_fake_object_count(row_counts=row_counts)
+
+            statement_count = len(extractor.provider.statement_cache)
+
+            #a second extraction reuse the pooled connections and the statements of the first one
+            assert list(extractor.extract())==database_objects
+            assert len(extractor.provider.statement_cache)==statement_count
+            assert extractor.get_connection_count()<=2
+
+            for object_type in [ObjectType.TABLE,ObjectType.VIEW,ObjectType.INDEX,ObjectType.EXTDATASOURCE]:
+
+                expected_object = [x for x in database_objects if x.object_type==object_type][-1]
+
+                assert extractor.get_object(object_type=object_type,\
+                                            object_name=expected_object.object_name.upper(),\
+                                            object_schema=expected_object.object_schema)==expected_object
+
+            assert extractor.get_object(object_type=ObjectType.VIEW,object_name="missing_view",object_schema="schema1") is None
+
+            views = extractor.get_category_object(object_type=ObjectType.VIEW,object_filter=dos.ObjectFilter(include_schemas=["schema1"]))
+
+            assert views==[x for x in database_objects if x.object_type==ObjectType.VIEW and x.object_schema=="schema1"]
+        finally:
+            extractor.close()
+
+def test_watch_sync_changed_module():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        database_path = f"{temp_dir}/fake.db"
+
+        create_fake_catalog(database_path=database_path,table_count=20,column_count=4)
+
+        extract_options = dos.get_extract_options(options={})
+
+        extractor = Extractor(provider=dos.create_provider(database_uri=f"sqlite:///{database_path}",extract_options=extract_options))
+
+        change_marker = extractor.provider.get_change_marker()
+
+        object_states = get_watched_state(extractor=extractor,object_filter=extract_options.object_filter)
+
+        view_state,procedure_state = [[x for x in object_states if x.object_type==y][0] for y in [ObjectType.VIEW,ObjectType.PROCEDURE]]
+
+        def change_catalog(interval):
+
+            #the modules change between the first and second polls, an external data source between the third and fourth
+            if interval==-2:
+                with sqlite3.connect(database_path) as connection:
+                    connection.execute("UPDATE \"GET_EXTERNAL_DATA_SOURCE_SQL\" SET c2='abfss://moved' WHERE c0='data_source1'")
+
+                connection.close()
+
+            if interval!=-1:
+                return
+
+            with sqlite3.connect(database_path) as connection:
+                connection.execute("UPDATE \"GET_MODULE_DEFINITION_SQL\" SET c1='CREATE VIEW changed AS SELECT 1' WHERE c0=?",(view_state.object_id,))
+                connection.execute("UPDATE \"GET_MODULE_STATE_SQL\" SET c4='2030-01-01T00:00:00' WHERE c0=?",(view_state.object_id,))
+
+                for table in ["GET_MODULE_STATE_SQL","GET_MODULE_DEFINITION_SQL"]:
+                    connection.execute(f"DELETE FROM \"{table}\" WHERE c0=?",(procedure_state.object_id,))
+
+            connection.close()
+
+        intervals = iter([0,-1,0,-2])
+
+        output = io.StringIO()
+
+        #the initial extraction and the polls share the provider
+        try:
+            with working_directory(cwd=temp_dir):
+
+                assert dos.extract_remote(remote_name="fake",\
+                                          provider=extractor.provider,\
+                                          extract_options=extract_options,\
+                                          output=io.StringIO(),\
+                                          close_provider=False)==0
+
+                watch_stats = watch_remote(extractor=extractor,\
+                                           object_filter=extract_options.object_filter,\
+                                           writer_func=partial(dos.create_object_writer,remote_name="fake",extract_options=extract_options),\
+                                           object_states=object_states,\
+                                           change_marker=change_marker,\
+                                           max_poll_count=4,\
+                                           sleep_func=lambda _:change_catalog(interval=next(intervals)),\
+                                           output=output)
+        finally:
+            extractor.close()
+
+        remote_dir = Path(temp_dir,".dos/fake")
+
+        assert watch_stats.poll_count==4 and watch_stats.failed_poll_count==0 and watch_stats.sync_count==2
+        assert (watch_stats.written_count,watch_stats.deleted_count)==(2,1)
+        assert "success (1 written,0 unchanged,1 deleted)" in output.getvalue()
+
+        #external data sources are not in the object states, the change marker alone trigger their rendering
+        assert "success (1 written,1 unchanged,0 deleted)" in output.getvalue()
+        assert "abfss://moved" in (remote_dir/"ext_data_source/data_source1.sql").read_text()
+
+        assert (remote_dir/"view"/f"{view_state.object_schema}.{view_state.object_name}.sql").read_text()=="CREATE VIEW changed AS SELECT 1"
+        assert not (remote_dir/"procedure"/f"{procedure_state.object_schema}.{procedure_state.object_name}.sql").exists()
+
+def test_watch_with_cache():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        database_path = f"{temp_dir}/fake.db"
+
+        create_fake_catalog(database_path=database_path,table_count=20,column_count=4)
+
+        extract_options = dos.get_extract_options(options={"--cache":f"{temp_dir}/cache"})
+
+        extractor = Extractor(provider=dos.create_provider(database_uri=f"sqlite:///{database_path}",extract_options=extract_options))
+
+        assert isinstance(extractor.provider,CachedCatalogProvider)
+
+        change_marker = extractor.provider.get_change_marker()
+
+        object_states = get_watched_state(extractor=extractor,object_filter=extract_options.object_filter)
+
+        def change_catalog(interval):
+
+            with sqlite3.connect(database_path) as connection:
+                connection.execute("UPDATE \"GET_EXTERNAL_DATA_SOURCE_SQL\" SET c2='abfss://moved' WHERE c0='data_source1'")
+
+            connection.close()
+
+        output = io.StringIO()
+
+        try:
+            with working_directory(cwd=temp_dir):
+
+                assert dos.extract_remote(remote_name="fake",\
+                                          provider=extractor.provider,\
+                                          extract_options=extract_options,\
+                                          output=io.StringIO(),\
+                                          close_provider=False)==0
+
+                #the cached rows of the previous marker are not used by the sync
+                watch_stats = watch_remote(extractor=extractor,\
+                                           object_filter=extract_options.object_filter,\
+                                           writer_func=partial(dos.create_object_writer,remote_name="fake",extract_options=extract_options),\
+                                           object_states=object_states,\
+                                           change_marker=change_marker,\
+                                           max_poll_count=1,\
+                                           sleep_func=change_catalog,\
+                                           output=output)
+        finally:
+            extractor.close()
+
+        assert watch_stats.sync_count==1 and "success (1 written,1 unchanged,0 deleted)" in output.getvalue()
+        assert "abfss://moved" in Path(temp_dir,".dos/fake/ext_data_source/data_source1.sql").read_text()
+
+def test_query_cache():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        database_path = f"{temp_dir}/fake.db"
+
+        cache_dir = Path(temp_dir,"cache")
+
+        create_fake_catalog(database_path=database_path,table_count=20,column_count=4)
+
+        def extract(argv):
+            """
+            Return the cached queries line and the last line of a run with the cache
+            """
+
+            exit_code,lines = extract_fake_remote(cwd=temp_dir,argv=["--cache",str(cache_dir)]+argv)
+
+            assert exit_code==0
+
+            return ([x for x in lines if x.startswith("cached queries:")][0],lines[-1])
+
+        def change_catalog(*statements):
+
+            with sqlite3.connect(database_path) as connection:
+                for statement in statements:
+                    connection.execute(statement)
+
+            connection.close()
+
+        category_count = len(dos.EXTRACT_CATEGORIES)
+
+        assert extract(argv=[])[0]=="cached queries:0"
+
+        assert len(list(cache_dir.iterdir()))==category_count
+
+        cached_queries,saved_objects = extract(argv=["--jobs","4"])
+
+        assert cached_queries==f"cached queries:{category_count}" and saved_objects.startswith("saving database objects:success (0 written,")
+
+        #other filters are other entries
+        assert extract(argv=["--types","view","--include-schema","schema1"])[0]=="cached queries:0"
+        assert extract(argv=["--types","view","--include-schema","schema1"])[0]=="cached queries:1"
+
+        #a modified object change the marker, so every entry is fetched again and replaced
+        change_catalog("UPDATE \"GET_MODULE_STATE_SQL\" SET c4='2030-01-01T00:00:00' WHERE rowid=1",\
+                       "UPDATE \"GET_MODULE_DEFINITION_SQL\" SET c1='CREATE VIEW changed AS SELECT 1' WHERE rowid=1")
+
+        cached_queries,saved_objects = extract(argv=[])
+
+        assert cached_queries=="cached queries:0" and saved_objects.startswith("saving database objects:success (1 written,")
+
+        assert len(list(cache_dir.iterdir()))==category_count+1
+
+        #expired entries are fetched again
+        for cache_path in cache_dir.iterdir():
+            os.utime(cache_path,(time.time()-100,time.time()-100))
+
+        assert extract(argv=["--cache-ttl","60"])[0]=="cached queries:0"
+        assert extract(argv=["--cache-ttl","60"])[0]==f"cached queries:{category_count}"
+
+        #external data sources are not in sys.objects, but a change of one also invalidates the entries
+        change_catalog("UPDATE \"GET_EXTERNAL_DATA_SOURCE_SQL\" SET c2='abfss://moved' WHERE rowid=1")
+
+        cached_queries,saved_objects = extract(argv=[])
+
+        assert cached_queries=="cached queries:0" and saved_objects.startswith("saving database objects:success (1 written,")
+
+def test_query_cache_marker_error():
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        #the change marker of a catalog without state table fails when the rows are read, as a fetch error
+        with sqlite3.connect(f"{temp_dir}/nostate.db") as connection:
+            connection.execute("CREATE TABLE other (c1)")
+
+        connection.close()
+
+        provider = CachedCatalogProvider(provider=SqliteCatalogProvider(database_path=f"{temp_dir}/nostate.db",pool_size=1),\
+                                         cache_dir=f"{temp_dir}/cache",\
+                                         source_name="nostate")
+
+        rows = provider.fetch_rows(query_name="GET_TABLE_SQL")
+
+        try:
+            list(rows)
+            assert False
+        except OperationalError:
+            pass
+        finally:
+            provider.close()
+
+def test_benchmark_regression():
+
+    stages = benchmark_stages(table_count=20,column_count=3,index_count=20,procedure_count=5,ext_table_count=2)
+
+    assert stages["render_table"]["items"]==20
+    assert stages["ingest_table_info"]["items"]==60
+
+    assert compare_baseline(stages=stages,baseline_stages=stages,tolerance=0)==[]
+
+    slower_stages = {x:dict(y,items_per_second=y["items_per_second"]/2) for x,y in stages.items()}
+
+    regressions = compare_baseline(stages=slower_stages,baseline_stages={"render_table":stages["render_table"]},tolerance=0.25)
+
+    assert len(regressions)==1 and regressions[0].startswith("render_table:")
+
+def test_apply_waves():
+
+    object_definitions = {
+        "table/dbo.customer.sql":"CREATE TABLE [dbo].[customer] (\n  [id] int NOT NULL\n);",
+        "index/dbo.customer_ix.sql":"CREATE INDEX [customer_ix] ON [dbo].[customer] ([id]);",
+        "view/sales.customer_view.sql":"CREATE VIEW sales.customer_view AS SELECT id FROM customer -- order_view\n",
+        "view/sales.top_customer.sql":"CREATE VIEW sales.top_customer AS SELECT TOP 10 id FROM [sales].[customer_view]",
+        "procedure/sales.get_customer.sql":"CREATE PROCEDURE sales.get_customer AS SELECT 'customer_view' FROM top_customer",
+        "ext_data_source/lake.sql":"CREATE EXTERNAL DATA SOURCE [lake] WITH (LOCATION = N'abfss://lake')",
+        "ext_file_format/parquet.sql":"CREATE EXTERNAL FILE FORMAT [parquet] WITH (FORMAT_TYPE = PARQUET)",
+        "ext_table/dbo.events.sql":"CREATE EXTERNAL TABLE [dbo].[events] ([id] int) WITH (DATA_SOURCE = [lake],LOCATION = N'/events',FILE_FORMAT = [parquet])"
+    }
+
+    dependencies = apply.get_dependency(object_definitions=object_definitions)
+
+    assert dependencies["index/dbo.customer_ix.sql"]=={"table/dbo.customer.sql"}
+    assert dependencies["view/sales.customer_view.sql"]=={"table/dbo.customer.sql"}
+    assert dependencies["procedure/sales.get_customer.sql"]=={"view/sales.top_customer.sql"}
+    assert dependencies["ext_table/dbo.events.sql"]=={"ext_data_source/lake.sql","ext_file_format/parquet.sql"}
+
+    waves = apply.get_apply_wave(dependencies=dependencies)
+
+    assert waves==[["ext_data_source/lake.sql","ext_file_format/parquet.sql","table/dbo.customer.sql"],\
+                   ["ext_table/dbo.events.sql","index/dbo.customer_ix.sql","view/sales.customer_view.sql"],\
+                   ["view/sales.top_customer.sql"],\
+                   ["procedure/sales.get_customer.sql"]]
+
+    #objects depending on each other are applied together in the last wave
+    assert apply.get_apply_wave(dependencies={"a":set(),"c":{"b"},"b":{"a","c"}})==[["a"],["c","b"]]
+
+    batches = apply.get_batch(object_files=waves[0]+waves[1],object_definitions=object_definitions,batch_size=2)
+
+    assert batches==[["ext_data_source/lake.sql"],["ext_file_format/parquet.sql"],["ext_table/dbo.events.sql"],\
+                     ["table/dbo.customer.sql","index/dbo.customer_ix.sql"],["view/sales.customer_view.sql"]]
+
+    class FakeCursor:
+
+        def __init__(self,engine):
+            self.engine = engine
+            self.results:List[str] = list()
+
+        def execute(self,sql:str):
+
+            with self.engine.lock:
+                self.engine.statements.append(sql)
+
+            self.results = [x for x in sql.split("\n") if x.startswith("EXEC ")] or [sql]
+            self.nextset()
+
+        def nextset(self)->bool:
+
+            if not self.results:
+                return False
+
+            #like pyodbc, the error of a statement is only raised when its result is reached
+            result = self.results.pop(0)
+
+            #the table exists only once the view it depends on was created (retried at the end)
+            if "fail_always" in result or ("customer_ix" in result and not any("top_customer" in x for x in self.engine.statements[:-1])):
+                raise Exception("cannot create object")
+
+            return True
+
+        def close(self):
+            pass
+
+    class FakeDBAPIConnection:
+
+        def __init__(self,engine):
+            self.engine = engine
+
+        def cursor(self):
+            return FakeCursor(engine=self.engine)
+
+    class FakeConnection:
+
+        def __init__(self,engine):
+            self.engine = engine
+            self.connection = FakeDBAPIConnection(engine=engine)
+
+        def execution_options(self,**kwargs):
+            return self
+
+        def exec_driver_sql(self,sql:str):
+            self.connection.cursor().execute(sql)
+
+    class FakeEngine:
+
+        def __init__(self):
+            self.statements:List[str] = list()
+            self.lock = threading.Lock()
+
+        @contextmanager
+        def begin(self):
+            yield FakeConnection(engine=self)
+
+        @contextmanager
+        def connect(self):
+            yield FakeConnection(engine=self)
+
+    engine = FakeEngine()
+
+    output = io.StringIO()
+
+    apply_stats,failures = apply.apply_object(engine=engine,\
+                                              object_definitions=dict(object_definitions,**{"func/sales.broken.sql":"CREATE FUNCTION fail_always()"}),\
+                                              jobs=4,\
+                                              output=output)
+
+    assert [x.object_file for x in failures]==["func/sales.broken.sql"]
+
+    assert apply_stats.object_count==9 and apply_stats.applied_count==8 and apply_stats.failed_count==1 and apply_stats.wave_count==5
+
+    #the sales schema is created first, dbo is not
+    assert engine.statements[0]=="SET NOCOUNT ON;\nSET XACT_ABORT ON;\nEXEC sp_executesql N'IF SCHEMA_ID(N''sales'') IS NULL EXEC(N''CREATE SCHEMA [sales]'');';"
+
+    assert "retrying 2 failed objects" in output.getvalue()
+
+    #external objects are not wrapped into sp_executesql
+    assert object_definitions["ext_table/dbo.events.sql"] in engine.statements
+
+    #the error of a statement after the first one of a batch is not lost
+    assert [x.object_file for x in apply.execute_batch(engine=engine,\
+                                                        batch=["view/dbo.top_customer.sql","func/sales.broken.sql"],\
+                                                        object_definitions={"view/dbo.top_customer.sql":"CREATE VIEW top_customer AS SELECT 1 AS a",\
+                                                                            "func/sales.broken.sql":"CREATE FUNCTION fail_always()"})]==["func/sales.broken.sql"]
+
+    #the objects of a dependency cycle are applied one at a time, in the order of their definitions
+    cycle_definitions = {"view/dbo.last_order.sql":"CREATE VIEW dbo.last_order AS SELECT * FROM dbo.first_order",\
+                         "view/dbo.first_order.sql":"CREATE VIEW dbo.first_order AS SELECT * FROM dbo.last_order"}
+
+    engine.statements.clear()
+
+    apply_stats,failures = apply.apply_object(engine=engine,object_definitions=cycle_definitions,jobs=4)
+
+    assert len(failures)==0 and apply_stats.wave_count==1 and apply_stats.batch_count==2
+    assert [x.split("\n")[-1] for x in engine.statements]==[f"EXEC sp_executesql {apply.get_literal(text=x)};" for x in cycle_definitions.values()]
+
+    output = io.StringIO()
+
+    apply.apply_object(engine=None,object_definitions=cycle_definitions,dry_run=True,output=output)
+
+    assert output.getvalue()=="wave 1/1: 2 objects in 2 batches (serial)\n  view/dbo.last_order.sql\n  view/dbo.first_order.sql\n"
+
+    output = io.StringIO()
+
+    apply_stats,failures = apply.apply_object(engine=None,object_definitions=object_definitions,dry_run=True,output=output)
+
+    assert len(failures)==0 and apply_stats.applied_count==0 and output.getvalue().startswith("wave 1/5: 1 objects in 1 batches\n  schema:sales\n")
+
+    #the dry run of the command needs no database uri
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        writer = DatabaseObjectWriter(root_dir=temp_dir,remote_name="remote")
+
+        for object_file,object_definition in object_definitions.items():
+
+            object_schema,object_name,object_type = parse_database_object_file(object_file=object_file)
+
+            writer.write(DatabaseObject(object_schema=object_schema,\
+                                        object_name=object_name,\
+                                        object_definition=object_definition,\
+                                        object_type=object_type))
+
+        writer.close()
+
+        output = io.StringIO()
+
+        with redirect_stdout(output):
+            assert dos.main(["apply",f"{temp_dir}/remote","--dry-run","--types","table,view"])==0
+
+        assert output.getvalue().splitlines()[-1].startswith("apply: 3 objects,4 waves,0 batches,0 applied,0 failed")
+
+        with redirect_stdout(io.StringIO()):
+            assert dos.main(["apply",f"{temp_dir}/remote"])==1
+
+def test_fetch_error_reach_render_stage():
+
+    def fetch_func():
+        raise OperationalError("SELECT 1",None,Exception("cannot connect"))
+
+    row_queue = StageQueue(name="rows",capacity=2,stop_event=threading.Event())
+
+    try:
+        fetch_stage(fetch_func=fetch_func,row_queue=row_queue,category_metrics=CategoryMetrics(category="table"))
+        assert False
+    except OperationalError:
+        pass
+
+    #the render stage fail instead of waiting for rows forever
+    try:
+        list(iter_stage_queue(stage_queue=row_queue))
+        assert False
+    except OperationalError:
+        pass
 
 def test_main():
     test_single_column_table()
     test_multiple_column_table()
     test_single_index_column_single_include_column_index()
     test_multiple_index_column_multiple_include_column_index()
+    test_single_index_column_multiple_include_column_index()
+    test_multiple_table_in_order()
     test_no_type_external_data_source()
     test_type_external_data_source()
+    test_shared_engine_connection_count()
+    test_parse_argument()
+    test_concurrent_extraction_keep_category_order()
+    test_read_fleet_manifest()
+    test_fleet_per_host_limit()
+    test_diff_module_state()
+    test_writer_skip_unchanged_file()
+    test_parallel_writer()
+    test_writer_same_file_last_wins()
+    test_catalog_render_same_as_dataclass()
+    test_server_render_same_as_client_render()
+    test_snapshot_replay_same_as_capture()
+    test_fake_catalog_run_report()
+    test_fake_catalog_server_render()
+    test_fake_catalog_module_batch()
+    test_fake_catalog_filter()
+    test_pack_same_as_files()
+    test_git_output()
+    test_diff_remotes()
+    test_module_batch_retry()
+    test_lazy_object_handles()
+    test_list_closed_pipe()
+    test_extractor_reuse()
+    test_watch_sync_changed_module()
+    test_watch_with_cache()
+    test_query_cache()
+    test_query_cache_marker_error()
+    test_apply_waves()
+    test_fetch_error_reach_render_stage()
+    test_benchmark_regression()
 
 if __name__=="__main__":
     test_main()
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""
+Watch mode: keep the objects of a remote close to the database. Every interval a single row change marker
+(object count and last modification, count and checksum of the external data sources and file formats) is read on a pooled connection.
+Only when it moves are the object states read again and the objects created, altered or dropped since the previous poll written or deleted:
+modules are fetched by object id, tables and external tables are rendered again in the schemas where one changed
+(tables with their indexes), external data sources and file formats are all rendered again when their part of the marker moved.
+An idle database only costs the marker query
+"""
+import sys
+import time
+from dataclasses import replace
+from datetime import datetime
+from typing import List,Dict,Set,Tuple,Optional,Callable,TextIO
+from model import ModuleState,ObjectFilter,ObjectType,WatchStats
+from objectfilter import is_type_match,is_object_file_match
+from incremental import diff_module_state
+from extractor import Extractor
+from writer import parse_database_object_file
+from config import WATCH_INTERVAL
+
+#categories rendered again in the schemas of a changed or dropped object of the type
+RESCAN_OBJECT_TYPES:Dict[ObjectType,List[ObjectType]] = {
+    ObjectType.TABLE:[ObjectType.TABLE,ObjectType.INDEX],
+    ObjectType.EXTTABLE:[ObjectType.EXTTABLE]
+}
+
+#columns of the change marker (GET_CHANGE_MARKER_SQL) of the objects which are not in sys.objects
+EXTERNAL_MARKER_COLUMNS:Dict[ObjectType,slice] = {
+    ObjectType.EXTDATASOURCE:slice(2,4),
+    ObjectType.EXTFILEFORMAT:slice(4,6)
+}
+
+def get_external_change(previous_marker:Tuple,current_marker:Tuple)->List[ObjectType]:
+    """
+    Return the types of the external objects whose part of the change marker moved
+    """
+
+    return [x for x,y in EXTERNAL_MARKER_COLUMNS.items() if previous_marker[y]!=current_marker[y]]
+
+def get_watched_state(extractor:Extractor,object_filter:ObjectFilter)->List[ModuleState]:
+    """
+    Return the state of the objects matching the filter. A table is watched when its table or its indexes are requested
+    """
+
+    return [x for x in extractor.provider.get_object_state(object_filter=object_filter)\
+            if any(is_type_match(object_filter=object_filter,object_type=y) for y in RESCAN_OBJECT_TYPES.get(x.object_type,[x.object_type]))]
+
+def sync_object(extractor:Extractor,\
+                database_object_writer,\
+                object_filter:ObjectFilter,\
+                changed_states:List[ModuleState],\
+                dropped_states:List[ModuleState],\
+                external_types:Optional[List[ObjectType]]=None)->Dict[ObjectType,Set[Optional[str]]]:
+    """
+    Write the changed modules, delete the dropped ones and render again the categories of the changed and dropped tables
+    and the external data sources and file formats of external_types.
+    Return the schemas rendered again for each type (None for the types without schema), whose files not written are stale
+    """
+
+    rescan_schemas:Dict[ObjectType,Set[Optional[str]]] = dict()
+
+    for object_type in external_types or []:
+        if is_type_match(object_filter=object_filter,object_type=object_type):
+            rescan_schemas[object_type] = {None}
+
+    for module_state in changed_states+dropped_states:
+        for object_type in RESCAN_OBJECT_TYPES.get(module_state.object_type,[]):
+            if is_type_match(object_filter=object_filter,object_type=object_type):
+                rescan_schemas.setdefault(object_type,set()).add(module_state.object_schema)
+
+    #delete before writing as a module can be dropped and re-created under the same name
+    for module_state in dropped_states:
+        if module_state.object_type not in RESCAN_OBJECT_TYPES:
+            database_object_writer.delete(object_schema=module_state.object_schema,\
+                                          object_name=module_state.object_name,\
+                                          object_type=module_state.object_type)
+
+    for database_object in extractor.provider.get_module_object(module_states=[x for x in changed_states if x.object_type not in RESCAN_OBJECT_TYPES]):
+        database_object_writer.write(database_object)
+
+    for object_type,schemas in rescan_schemas.items():
+
+        category_filter = object_filter if None in schemas else replace(object_filter,include_schemas=sorted(schemas))
+
+        for database_object in extractor.iter_category_object(object_type=object_type,object_filter=category_filter):
+            database_object_writer.write(database_object)
+
+    return rescan_schemas
+
+def watch_remote(extractor:Extractor,\
+                 object_filter:ObjectFilter,\
+                 writer_func:Callable[[],object],\
+                 object_states:List[ModuleState],\
+                 change_marker:Tuple,\
+                 interval:float=WATCH_INTERVAL,\
+                 max_poll_count:Optional[int]=None,\
+                 sleep_func:Callable[[float],None]=time.sleep,\
+                 output:TextIO=sys.stdout)->WatchStats:
+    """
+    Poll the change marker every interval until interrupted or max_poll_count polls, and write the changes through a new writer of writer_func.
+    object_states and change_marker are those read before the last extraction.
+    A failed poll or sync is reported and tried again at the next poll
+    """
+
+    watch_stats = WatchStats()
+
+    try:
+        while max_poll_count is None or watch_stats.poll_count<max_poll_count:
+
+            sleep_func(interval)
+
+            start_time = time.perf_counter()
+
+            watch_stats.poll_count+=1
+
+            try:
+                current_marker = extractor.provider.get_change_marker()
+            except:
+                current_marker = None
+                watch_stats.failed_poll_count+=1
+
+            poll_duration = time.perf_counter()-start_time
+
+            watch_stats.poll_duration+=poll_duration
+            watch_stats.max_poll_duration = max(watch_stats.max_poll_duration,poll_duration)
+
+            if current_marker is None:
+                print(f"{datetime.now().isoformat(timespec='seconds')} poll:fail",file=output)
+                continue
+
+            if current_marker==change_marker:
+                continue
+
+            print(f"{datetime.now().isoformat(timespec='seconds')} sync:",end="",file=output)
+
+            sync_start_time = time.perf_counter()
+
+            try:
+                current_states = get_watched_state(extractor=extractor,object_filter=object_filter)
+
+                changed_states,dropped_states = diff_module_state(previous_states=object_states,current_states=current_states)
+
+                database_object_writer = writer_func()
+
+                try:
+                    rescan_schemas = sync_object(extractor=extractor,\
+                                                 database_object_writer=database_object_writer,\
+                                                 object_filter=object_filter,\
+                                                 changed_states=changed_states,\
+                                                 dropped_states=dropped_states,\
+                                                 external_types=get_external_change(previous_marker=change_marker,current_marker=current_marker))
+                except:
+                    database_object_writer.close(delete_stale=False)
+                    raise
+
+                def is_in_scope(object_file:str)->bool:
+
+                    parsed_file = parse_database_object_file(object_file=object_file)
+
+                    return parsed_file is not None and\
+                        parsed_file[0] in rescan_schemas.get(parsed_file[2],set()) and\
+                        is_object_file_match(object_filter=object_filter,object_file=object_file)
+
+                database_object_writer.close(delete_stale=len(rescan_schemas)>0,is_in_scope=is_in_scope)
+            except:
+                print("fail",file=output)
+                continue
+
+            object_states = current_states
+
+            change_marker = current_marker
+
+            write_stats = database_object_writer.stats
+
+            watch_stats.sync_count+=1
+            watch_stats.sync_duration+=time.perf_counter()-sync_start_time
+            watch_stats.written_count+=write_stats.written_count
+            watch_stats.deleted_count+=write_stats.deleted_count
+
+            print(f"success ({write_stats.written_count} written,"+\
+                  f"{write_stats.unchanged_count} unchanged,"+\
+                  f"{write_stats.deleted_count} deleted) "+\
+                  f"polls:{watch_stats.poll_count},{watch_stats.poll_duration/watch_stats.poll_count*1000:.1f} ms mean,"+\
+                  f"{watch_stats.max_poll_duration*1000:.1f} ms max",file=output)
+    except KeyboardInterrupt:
+        pass
+
+    return watch_stats
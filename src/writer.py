@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict,Optional,Set,List,Tuple,Callable
+from model import DatabaseObject,ObjectType,WriteStats,WriteOptions
+from config import MANIFEST_FILE
+
+DATABASE_OBJECT_FOLDER:Dict[ObjectType,str] = {
+    ObjectType.TABLE:"table",
+    ObjectType.VIEW:"view",
+    ObjectType.FUNCTION:"func",
+    ObjectType.PROCEDURE:"procedure",
+    ObjectType.INDEX:"index",
+    ObjectType.EXTDATASOURCE:"ext_data_source",
+    ObjectType.EXTTABLE:"ext_table",
+    ObjectType.EXTFILEFORMAT:"ext_file_format"
+}
+
+#object types saved without schema
+SCHEMALESS_OBJECT_TYPES = {ObjectType.EXTDATASOURCE,ObjectType.EXTFILEFORMAT}
+
+def get_database_object_file(object_schema:Optional[str],\
+                             object_name:str,\
+                             object_type:ObjectType)->str:
+    """
+    Return the path of the object file relative to the remote folder
+    """
+
+    file_name = f"{object_name}.sql"
+
+    if object_schema is not None:
+        file_name = f"{object_schema}.{object_name}.sql"
+
+    return f"{DATABASE_OBJECT_FOLDER[object_type]}/{file_name}"
+
+def parse_database_object_file(object_file:str)->Optional[Tuple[Optional[str],str,ObjectType]]:
+    """
+    Return the schema, name and type of an object file path, or None when it is not an object file.
+    The schema is assumed to hold no dot
+    """
+
+    folder,_,file_name = object_file.partition("/")
+
+    object_types = [x for x,y in DATABASE_OBJECT_FOLDER.items() if y==folder]
+
+    if len(object_types)==0 or not file_name.endswith(".sql"):
+        return None
+
+    object_type = object_types[0]
+
+    object_name = file_name[:-len(".sql")]
+
+    if object_type in SCHEMALESS_OBJECT_TYPES:
+        return (None,object_name,object_type)
+
+    object_schema,_,object_name = object_name.partition(".")
+
+    return (object_schema,object_name,object_type)
+
+def get_content_hash(content:str)->str:
+
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def fsync_file(file_path:Path):
+
+    with file_path.open("rb") as file:
+        os.fsync(file.fileno())
+
+def load_manifest(manifest_path:Path)->Dict[str,str]:
+    """
+    Return the content hash of every file written by the last run keyed by its relative path
+    """
+
+    if not manifest_path.exists():
+        return dict()
+
+    try:
+        with manifest_path.open("r") as file:
+            manifest = json.load(file)
+    except ValueError:
+        return dict()
+
+    if not isinstance(manifest,dict):
+        return dict()
+
+    return manifest
+
+def save_manifest(manifest_path:Path,manifest:Dict[str,str]):
+
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+
+    temp_path = manifest_path.with_name(manifest_path.name+".tmp")
+
+    with temp_path.open("w") as file:
+        json.dump(manifest,file,sort_keys=True,indent=0)
+
+    temp_path.replace(manifest_path)
+
+
+class DatabaseObjectWriter:
+    """
+    Write the object files of a remote, only touching the files whose content changed since the last run.
+    The content hash of every file is kept in a manifest under the remote folder.
+    Objects are written by a pool of `write_jobs` threads with at most `queue_depth` objects waiting,
+    so write can be called from several threads and only block while the queue is full.
+    With fsync, the written files are flushed to disk in one batch on close
+    """
+
+    def __init__(self,\
+                 root_dir:str,\
+                 remote_name:str,\
+                 write_options:WriteOptions=None):
+
+        if write_options is None:
+            write_options = WriteOptions()
+
+        self.remote_dir = Path(f"{root_dir}/{remote_name}")
+
+        self.manifest_path = self.remote_dir/MANIFEST_FILE
+
+        self.previous_manifest = load_manifest(manifest_path=self.manifest_path)
+
+        self.manifest:Dict[str,str] = dict()
+
+        self.deleted_files:Set[str] = set()
+
+        self.created_folders:Set[Path] = set()
+
+        self.written_paths:List[Path] = list()
+
+        self.write_options = write_options
+
+        self.executor = ThreadPoolExecutor(max_workers=write_options.write_jobs)
+
+        self.queue_slots = threading.BoundedSemaphore(write_options.queue_depth)
+
+        self.write_error:Optional[Exception] = None
+
+        self.start_time = time.perf_counter()
+
+        self.stats = WriteStats()
+
+        self.lock = threading.Lock()
+
+        #lock, queued write count and sequence of the last queued write of the files being written.
+        #Index names are only unique per table, so two objects can share a file
+        self.pending_files:Dict[str,Tuple[threading.Lock,int,int]] = dict()
+
+        self.write_sequence = 0
+
+    def write(self,database_object:DatabaseObject):
+        """
+        Queue the object to be written. Raise the error of a previous write if any.
+        Writes of the same file are serialized and the last queued one wins, as when files were written sequentially
+        """
+
+        if self.write_error is not None:
+            raise self.write_error
+
+        object_file = get_database_object_file(object_schema=database_object.object_schema,\
+                                               object_name=database_object.object_name,\
+                                               object_type=database_object.object_type)
+
+        self.queue_slots.acquire()
+
+        with self.lock:
+            self.write_sequence+=1
+
+            file_lock,write_count,_ = self.pending_files.get(object_file,(threading.Lock(),0,0))
+
+            self.pending_files[object_file] = (file_lock,write_count+1,self.write_sequence)
+
+            sequence = self.write_sequence
+
+        try:
+            self.executor.submit(self.write_file,database_object,object_file,sequence)
+        except:
+            self.release_file(object_file=object_file)
+            self.queue_slots.release()
+            raise
+
+    def release_file(self,object_file:str):
+
+        with self.lock:
+            file_lock,write_count,last_sequence = self.pending_files[object_file]
+
+            if write_count==1:
+                del self.pending_files[object_file]
+            else:
+                self.pending_files[object_file] = (file_lock,write_count-1,last_sequence)
+
+    def write_file(self,database_object:DatabaseObject,object_file:str,sequence:int):
+
+        try:
+            with self.lock:
+                file_lock = self.pending_files[object_file][0]
+
+            with file_lock:
+
+                #a later object of the same file is queued, it will be written instead
+                with self.lock:
+                    if self.pending_files[object_file][2]!=sequence:
+                        return
+
+                self.write_object_file(database_object=database_object,object_file=object_file)
+        except Exception as ex:
+            with self.lock:
+                if self.write_error is None:
+                    self.write_error = ex
+        finally:
+            self.release_file(object_file=object_file)
+            self.queue_slots.release()
+
+    def write_object_file(self,database_object:DatabaseObject,object_file:str):
+        """
+        Write the file unless its content is unchanged. Called with the lock of the file held
+        """
+
+        object_path = self.remote_dir/object_file
+
+        content_hash = get_content_hash(content=database_object.object_definition)
+
+        with self.lock:
+            #an object of the same file may already have been written by this run
+            previous_hash = self.manifest.get(object_file,self.previous_manifest.get(object_file))
+
+        is_exist = object_path.exists()
+
+        #file written before the manifest existed
+        if previous_hash is None and is_exist:
+            with object_path.open("r",newline="") as file:
+                previous_hash = get_content_hash(content=file.read())
+
+        is_unchanged = is_exist and previous_hash==content_hash
+
+        if not is_unchanged:
+            self.create_folder(folder=object_path.parent)
+
+            #no newline translation, so the file hold the exact content hashed into the manifest
+            with object_path.open("w",newline="") as file:
+                file.write(database_object.object_definition)
+
+        with self.lock:
+            self.manifest[object_file] = content_hash
+
+            if is_unchanged:
+                self.stats.unchanged_count+=1
+            else:
+                self.stats.written_count+=1
+                self.stats.written_bytes+=len(database_object.object_definition.encode("utf-8"))
+
+                self.written_paths.append(object_path)
+
+    def create_folder(self,folder:Path):
+        """
+        Create the folder once per run instead of once per file
+        """
+
+        if folder in self.created_folders:
+            return
+
+        folder.mkdir(parents=True, exist_ok=True)
+
+        with self.lock:
+            self.created_folders.add(folder)
+
+    def keep(self,object_schema:Optional[str],object_name:str,object_type:ObjectType):
+        """
+        Keep a file which was not extracted in this run (e.g. an unmodified module in incremental mode)
+        """
+
+        object_file = get_database_object_file(object_schema=object_schema,\
+                                               object_name=object_name,\
+                                               object_type=object_type)
+
+        if object_file in self.previous_manifest:
+            with self.lock:
+                self.manifest[object_file] = self.previous_manifest[object_file]
+
+    def delete(self,object_schema:Optional[str],object_name:str,object_type:ObjectType):
+
+        object_file = get_database_object_file(object_schema=object_schema,\
+                                               object_name=object_name,\
+                                               object_type=object_type)
+
+        (self.remote_dir/object_file).unlink(missing_ok=True)
+
+        with self.lock:
+            self.deleted_files.add(object_file)
+
+            self.stats.deleted_count+=1
+
+    def close(self,delete_stale:bool=True,is_in_scope:Optional[Callable[[str],bool]]=None):
+        """
+        Wait for the queued objects, then delete the files written by the last run but neither written
+        nor kept by this one and save the manifest. Without delete_stale, those files are kept in the manifest instead,
+        as are the files for which is_in_scope return False (objects this run did not extract, e.g. filtered out).
+        Raise the first write error
+        """
+
+        self.executor.shutdown(wait=True)
+
+        if self.write_options.fsync and self.write_error is None:
+            with ThreadPoolExecutor(max_workers=self.write_options.write_jobs) as executor:
+                list(executor.map(fsync_file,self.written_paths))
+
+        self.stats.duration = time.perf_counter()-self.start_time
+
+        if self.write_error is not None:
+            raise self.write_error
+
+        for object_file,content_hash in self.previous_manifest.items():
+
+            if object_file in self.manifest or object_file in self.deleted_files:
+                continue
+
+            if delete_stale and (is_in_scope is None or is_in_scope(object_file)):
+                (self.remote_dir/object_file).unlink(missing_ok=True)
+
+                self.stats.deleted_count+=1
+            else:
+                self.manifest[object_file] = content_hash
+
+        save_manifest(manifest_path=self.manifest_path,manifest=self.manifest)